@@ -0,0 +1,197 @@
+############################################################################### 
+# File:          benchmark.py                                                 # 
+# Project:       Kindred                                                      # 
+# Author:        Paul Klein                                                   # 
+# EMail:         pauljkaz@gmail.com                                           # 
+# -----                                                                       # 
+# Last Modified: Mon Jul 31 2023                                              # 
+# Modified By:   Paul Klein                                                   # 
+# -----                                                                       # 
+#                                                                             # 
+#  Copyright (c) 2019 - 2023 N/A, All Rights Reserved.                        # 
+#                                                                             # 
+############################################################################### 
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    # Windows - peak RSS is not reported
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SIMPLE = os.path.join(ROOT,'src','simple')
+sys.path.insert(0,SIMPLE)
+
+import simulator
+import printer
+
+WORKLOADS = [
+    os.path.join(ROOT,'workloads','test1.s')
+    , os.path.join(ROOT,'workloads','test2.s')
+    , os.path.join(ROOT,'workloads','test3.s')
+    , os.path.join(ROOT,'benchmarks','kernels','long_loop.s')
+    , os.path.join(ROOT,'benchmarks','kernels','dep_chain.s')
+    , os.path.join(ROOT,'benchmarks','kernels','mem_stream.s')
+]
+
+MODES = [ 'cycle', 'functional' ]
+
+# Metric => True if bigger is better
+METRICS = {
+    'cycles_per_sec' : True
+    , 'inst_per_sec' : True
+    , 'peak_rss_kb' : False
+    , 'startup_time' : False
+}
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, KB elsewhere
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+###############################################################################
+# Worker - one workload/mode in a fresh interpreter so RSS is not shared
+###############################################################################
+def measure(workload,mode,repeat):
+    """ Best of repeat runs, returns the result dict """
+    printer.Printer.set_verbosity(printer.PrinterVerbosity.QUIET)
+    best = None
+    for _ in range(repeat):
+        sim = simulator.KindredSimulator('kindred')
+        sim.max_cycles = None
+        sim.load(workload)
+        if mode == 'cycle':
+            sim.run_cycle()
+            retired = sim.pipeline.num_retired_instructions
+        else:
+            retired = sim.run_functional()
+        if best is None or sim.host_time < best['host_time']:
+            best = { 'host_time' : sim.host_time, 'retired' : retired, 'cycles' : sim.cycle if mode == 'cycle' else None }
+    host_time = best['host_time']
+    best['inst_per_sec'] = best['retired'] / host_time if host_time > 0 else None
+    best['cycles_per_sec'] = best['cycles'] / host_time if best['cycles'] and host_time > 0 else None
+    best['peak_rss_kb'] = peak_rss_kb()
+    return best
+
+def startup_time(mode,repeat):
+    """ Wall time of a complete kindredsim.py invocation on the smallest workload """
+    best = None
+    with tempfile.TemporaryDirectory() as tmp:
+        command = [ sys.executable, os.path.join(SIMPLE,'kindredsim.py'), '-q', '-m', mode
+                    , '-w', WORKLOADS[0], '-v', os.path.join(tmp,'t.vcd'), '-i', os.path.join(tmp,'t.inst') ]
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run(command,stdout=subprocess.DEVNULL,check=True)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best,elapsed)
+    return best
+
+def run_suite(workloads,modes,repeat):
+    results = {}
+    for mode in modes:
+        startup = startup_time(mode,repeat)
+        for workload in workloads:
+            command = [ sys.executable, os.path.abspath(__file__), '--worker', workload, mode, '--repeat', str(repeat) ]
+            output = subprocess.run(command,stdout=subprocess.PIPE,check=True,text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            result['startup_time'] = startup
+            name = '{0}/{1}'.format(os.path.basename(workload),mode)
+            results[name] = result
+            print( '{0:24} {1:>10} inst/s {2:>10} cycles/s {3:>8} KB RSS  startup {4:.3f}s'.format(name
+                    , '{0:.0f}'.format(result['inst_per_sec']) if result['inst_per_sec'] else '-'
+                    , '{0:.0f}'.format(result['cycles_per_sec']) if result['cycles_per_sec'] else '-'
+                    , result['peak_rss_kb'] if result['peak_rss_kb'] is not None else '-', startup) )
+    return results
+
+###############################################################################
+# Baseline comparison
+###############################################################################
+def compare(results,baseline,threshold):
+    """ List of regressions beyond threshold (fraction) against the baseline results """
+    regressions = []
+    for name,result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        if base.get('cycles') != result.get('cycles') or base.get('retired') != result.get('retired'):
+            # Simulated behaviour changed - host speed is not comparable but worth knowing
+            print( 'NOTE: {0} simulated cycles/instructions changed ({1}/{2} -> {3}/{4})'.format(name
+                    , base.get('cycles'), base.get('retired'), result.get('cycles'), result.get('retired')) )
+        for metric,bigger_is_better in METRICS.items():
+            old = base.get(metric)
+            new = result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (bigger_is_better and change < -threshold) or (not bigger_is_better and change > threshold):
+                regressions.append( '{0} {1}: {2:.4g} -> {3:.4g} ({4:+.1%})'.format(name,metric,old,new,change) )
+    return regressions
+
+def main():
+
+    parser = argparse.ArgumentParser(
+            prog='benchmark',
+            description='Kindred RiscV Simulator - simulator speed benchmarks'
+        )
+    parser.add_argument('-w', '--workload', nargs='+', default=WORKLOADS,
+                        help='Workloads to benchmark (default: workloads/test1-3 and benchmarks/kernels)')
+    parser.add_argument('-m', '--mode', nargs='+', default=MODES, choices=MODES,
+                        help='Simulation modes to benchmark (default: all)')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Runs per measurement, the fastest is kept (default: 3)')
+    parser.add_argument('-o', '--output', default=None,
+                        help='Write the results to this JSON file (may be the baseline, it is read first)')
+    parser.add_argument('-b', '--baseline', default=None,
+                        help='Compare against this results file, exit 1 on a regression')
+    parser.add_argument('-t', '--threshold', type=float, default=10.0,
+                        help='Allowed regression against the baseline in percent (default: 10)')
+    parser.add_argument('--worker', nargs=2, default=None, metavar=('WORKLOAD','MODE'),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        print(json.dumps(measure(args.worker[0],args.worker[1],args.repeat)))
+        return 0
+
+    # Read before anything is written, --output may name the baseline itself
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline,'r') as f:
+            baseline = json.load(f)['results']
+
+    results = run_suite(args.workload,args.mode,args.repeat)
+    if args.output is not None:
+        report = {
+            'date' : datetime.datetime.now().isoformat(timespec='seconds')
+            , 'python' : platform.python_version()
+            , 'platform' : platform.platform()
+            , 'results' : results
+        }
+        with open(args.output,'w') as f:
+            json.dump(report,f,indent=2)
+        print( 'Results written to [{0}]'.format(args.output) )
+
+    if baseline is not None:
+        regressions = compare(results,baseline,args.threshold / 100.0)
+        if regressions:
+            print( 'REGRESSIONS against [{0}] (threshold {1}%):'.format(args.baseline,args.threshold) )
+            for regression in regressions:
+                print( '  ' + regression )
+            return 1
+        print( 'No regressions against [{0}] (threshold {1}%)'.format(args.baseline,args.threshold) )
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,30 @@
+###############################################################################
+# File:          dep_chain.s                                                  # 
+# Project:       Kindred                                                      # 
+# Author:        Paul Klein                                                   # 
+# EMail:         pauljkaz@gmail.com                                           # 
+# -----                                                                       # 
+# Last Modified: Mon Jul 31 2023                                              # 
+# Modified By:   Paul Klein                                                   # 
+# -----                                                                       # 
+#                                                                             # 
+#  Copyright (c) 2019 - 2023 N/A, All Rights Reserved.                        # 
+#                                                                             # 
+###############################################################################
+
+
+# Dependency chains - every instruction reads the result of the one before
+
+                li t0, 0
+                li t1, 1
+chain_loop:     add t1, t1, t0
+                xor t1, t1, t0
+                slli t2, t1, 1
+                add t1, t1, t2
+                andi t1, t1, 0xFFFF
+                or t3, t1, t0
+                sub t3, t3, t1
+                add t4, t3, t1
+                addi t0, t0, 1
+                blt t0, 2000, chain_loop
+end:            nop
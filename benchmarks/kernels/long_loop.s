@@ -0,0 +1,26 @@
+###############################################################################
+# File:          long_loop.s                                                  # 
+# Project:       Kindred                                                      # 
+# Author:        Paul Klein                                                   # 
+# EMail:         pauljkaz@gmail.com                                           # 
+# -----                                                                       # 
+# Last Modified: Mon Jul 31 2023                                              # 
+# Modified By:   Paul Klein                                                   # 
+# -----                                                                       # 
+#                                                                             # 
+#  Copyright (c) 2019 - 2023 N/A, All Rights Reserved.                        # 
+#                                                                             # 
+###############################################################################
+
+
+# Loop overhead - nested counted loops with a short body
+
+                li t0, 0
+outer_loop:     bge t0, 100, end
+                li t1, 0
+inner_loop:     addi t2, t2, 1
+                addi t1, t1, 1
+                blt t1, 100, inner_loop
+                addi t0, t0, 1
+                jal x0, outer_loop
+end:            nop
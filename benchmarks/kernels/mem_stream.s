@@ -0,0 +1,31 @@
+###############################################################################
+# File:          mem_stream.s                                                 # 
+# Project:       Kindred                                                      # 
+# Author:        Paul Klein                                                   # 
+# EMail:         pauljkaz@gmail.com                                           # 
+# -----                                                                       # 
+# Last Modified: Mon Jul 31 2023                                              # 
+# Modified By:   Paul Klein                                                   # 
+# -----                                                                       # 
+#                                                                             # 
+#  Copyright (c) 2019 - 2023 N/A, All Rights Reserved.                        # 
+#                                                                             # 
+###############################################################################
+
+
+# Memory streaming - read-modify-write passes over a 16KB array
+
+                li s0, 0xA000
+                li t0, 0
+pass_loop:      bge t0, 2, end
+                li t1, 0
+                mv t3, s0
+word_loop:      lw t4, 0(t3)
+                addi t4, t4, 1
+                sw t4, 0(t3)
+                addi t3, t3, 4
+                addi t1, t1, 1
+                blt t1, 4096, word_loop
+                addi t0, t0, 1
+                jal x0, pass_loop
+end:            nop
@@ -0,0 +1,204 @@
+###############################################################################
+# File:          assembly_cache.py                                            # 
+# Project:       Kindred                                                      # 
+# Author:        Paul Klein                                                   # 
+# EMail:         pauljkaz@gmail.com                                           # 
+# -----                                                                       # 
+# Last Modified: Mon Jul 31 2023                                              # 
+# Modified By:   Paul Klein                                                   # 
+# -----                                                                       # 
+#                                                                             # 
+#  Copyright (c) 2019 - 2023 N/A, All Rights Reserved.                        # 
+#                                                                             # 
+###############################################################################
+
+import assembly_loader
+import inst_buffer_unit
+import registers_unit
+import printer
+
+import array
+import hashlib
+import os
+import struct
+
+class KindredAssemblyCache:
+    """ On-disk cache of parsed assembly workloads, keyed by the SHA-256 of the source
+
+    Layout (little-endian):
+        header      magic, version, loader fingerprint, source hash, string table size,
+                    line count, parsed line count
+        strings     every string referenced below, utf-8, NUL separated
+        lines       string index of each non-comment source line, int32 per line
+        parsed      per distinct line that parsed: line, label, inst, dst, op1, op2 string
+                    index (-1 for None), then for dst, op1 and op2 the operand kind,
+                    register index (-1 none), register string index (-1 none), offset
+                    and immediate value
+
+    A hit rebuilds each distinct instruction once from its pre-classified operands and
+    clones repeats, the parser never runs. The loader fingerprint hashes the sources of
+    the modules that parse and classify, so editing any of them invalidates every entry.
+    """
+
+    MAGIC = b'KNDASMC\0'
+    VERSION = 1
+
+    HEADER = struct.Struct('<8sI32s32sIII')
+    PARSED = struct.Struct('<6i' + 'Bbiqq' * 3)
+
+    SUFFIX = '.kac'
+
+    # None disables the cache
+    directory = os.environ.get('KINDRED_CACHE_DIR') or os.path.join(os.path.expanduser('~'),'.cache','kindred')
+
+    fingerprint = None
+
+    def __init__(self,directory=None):
+        self.directory = directory if directory != None else KindredAssemblyCache.directory
+
+    @staticmethod
+    def loader_fingerprint():
+        if KindredAssemblyCache.fingerprint == None:
+            digest = hashlib.sha256( str(KindredAssemblyCache.VERSION).encode() )
+            for filename in (assembly_loader.__file__,inst_buffer_unit.__file__,registers_unit.__file__,__file__):
+                with open(filename,'rb') as source:
+                    digest.update(source.read())
+            KindredAssemblyCache.fingerprint = digest.digest()
+        return KindredAssemblyCache.fingerprint
+
+    def path(self,digest):
+        return os.path.join(self.directory,digest.hex() + KindredAssemblyCache.SUFFIX)
+
+    ###########################################################################
+    # Restore
+    ###########################################################################
+    def restore(self,source,buffer):
+        """ Append the cached instructions of source (bytes) to buffer, False on a miss """
+        if self.directory == None:
+            return False
+        digest = hashlib.sha256(source).digest()
+        try:
+            with open(self.path(digest),'rb') as f:
+                data = f.read()
+            magic,version,fingerprint,source_digest,strings_size,line_count,parsed_count = KindredAssemblyCache.HEADER.unpack_from(data)
+        except (OSError,struct.error):
+            return False
+        if magic != KindredAssemblyCache.MAGIC or version != KindredAssemblyCache.VERSION \
+                or fingerprint != KindredAssemblyCache.loader_fingerprint() or source_digest != digest:
+            return False
+        offset = KindredAssemblyCache.HEADER.size
+        lines_offset = offset + strings_size
+        parsed_offset = lines_offset + line_count * 4
+        if len(data) != parsed_offset + parsed_count * KindredAssemblyCache.PARSED.size:
+            return False
+
+        strings = data[offset:lines_offset].decode().split('\0')
+        lines = array.array('i',data[lines_offset:parsed_offset])
+        def string(index):
+            return strings[index] if index >= 0 else None
+
+        # Line string index => instruction state, cloned for every occurrence
+        Operand = inst_buffer_unit.KindredRiscVOperand
+        Instruction = inst_buffer_unit.KindredRiscVInstruction
+        new = object.__new__
+        operands = {}
+        templates = {}
+        for record in KindredAssemblyCache.PARSED.iter_unpack(data[parsed_offset:]):
+            line,label,inst = record[0:3]
+            ops = []
+            for n in range(3):
+                text = string(record[3+n])
+                text = text.lower() if text != None else ''
+                fields = record[6+5*n:11+5*n]
+                # Identical operands are shared, as the binary loader does
+                op = operands.get((text,fields))
+                if op == None:
+                    kind,index,reg,op_offset,value = fields
+                    op = operands[(text,fields)] = new(Operand)
+                    op.text = text
+                    op.kind = kind
+                    op.reg = string(reg)
+                    op.index = index if index >= 0 else None
+                    op.offset = op_offset
+                    op.label = text if kind == Operand.LABEL else None
+                    op.value = value if kind == Operand.IMMEDIATE else None
+                ops.append(op)
+            instruction = Instruction( strings[line], string(label), strings[inst], string(record[3]), string(record[4]), string(record[5]), tuple(ops) )
+            templates[line] = instruction.__dict__
+
+        debug = printer.Printer.debug_enabled
+        append = buffer.append
+        for line in lines:
+            if debug:
+                printer.Printer.debug( 'LOADER', f'  Parsing line: [{strings[line]}]' )
+            state = templates.get(line)
+            if state != None:
+                instruction = new(Instruction)
+                instruction.__dict__ = state.copy()
+                append(instruction)
+        return True
+
+    ###########################################################################
+    # Store
+    ###########################################################################
+    def store(self,source,lines):
+        """ Cache the parse of source (bytes). lines holds a (text, fields, instruction) per
+        non-comment line, fields being the label, inst, dst, op1, op2 groups or None when the
+        line did not parse. Returns False if nothing was written. """
+        if self.directory == None:
+            return False
+        strings = {}
+        def string(text):
+            if text == None:
+                return -1
+            return strings.setdefault(text,len(strings))
+
+        indices = array.array('i')
+        parsed = []
+        seen = set()
+        for text,fields,instruction in lines:
+            index = string(text)
+            if index not in seen:
+                seen.add(index)
+                if fields != None:
+                    record = [index] + [ string(field) for field in fields ]
+                    for op in instruction.operands():
+                        if op.kind == inst_buffer_unit.KindredRiscVOperand.NONE and op.reg != None:
+                            # Invalid register, the error would not be reported again on a hit
+                            return False
+                        record += [ op.kind, op.index if op.index != None else -1, string(op.reg), op.offset
+                                    , op.value if op.kind == inst_buffer_unit.KindredRiscVOperand.IMMEDIATE else 0 ]
+                    parsed.append(record)
+            indices.append(index)
+
+        if any( '\0' in text for text in strings ):
+            return False
+        table = '\0'.join(strings).encode()
+        try:
+            records = b''.join( KindredAssemblyCache.PARSED.pack(*record) for record in parsed )
+        except struct.error:
+            # Immediate or offset beyond 64 bits
+            return False
+        header = KindredAssemblyCache.HEADER.pack( KindredAssemblyCache.MAGIC, KindredAssemblyCache.VERSION
+                                                  , KindredAssemblyCache.loader_fingerprint(), hashlib.sha256(source).digest()
+                                                  , len(table), len(indices), len(parsed) )
+
+        filename = self.path(hashlib.sha256(source).digest())
+        temp = '{0}.{1}.tmp'.format(filename,os.getpid())
+        try:
+            os.makedirs(self.directory,exist_ok=True)
+            with open(temp,'wb') as f:
+                f.write(header)
+                f.write(table)
+                f.write(indices.tobytes())
+                f.write(records)
+            # Atomic, concurrent sweep workers never see a partial entry
+            os.replace(temp,filename)
+        except OSError as e:
+            printer.Printer.warn( 'LOADER', 'Could not write assembly cache [{0}]: {1}', filename, e )
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
+            return False
+        return True
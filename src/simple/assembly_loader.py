@@ -12,9 +12,12 @@
 #                                                                             # 
 ###############################################################################
 
+import assembly_cache
 import inst_buffer_unit
+import registers_unit
 import printer
 
+import gc
 import re
 import os
 import traceback
@@ -25,48 +28,77 @@ class RiscVAssemblyLoader:
     reg_offset_re = r'^(?P<offset>[-]{0,1}[\d]+){1}[\s]*\((?P<reg>\D[\w]+){1}\)$'
     compiled_reg_offset_re = re.compile(reg_offset_re)
     op_hex_re = r"^0x[0-9a-f]+$"
-    op_dec_re = r"^[\d]+$"
-    op_reg_re = r"^[txs]{1}[0-9]+$"
+    op_dec_re = r"^[-]{0,1}[\d]+$"
+    # Compiled once, shared by every load
+    compiled_assembly_re = re.compile(r'^((?P<label>[\w_]+){0,1}:){0,1}[\s]*(?P<inst>[\w]+){1}[\s]*(?P<dst>[\w]+){0,1}[\s]*(,[\s]*(?P<op1>[\w()]+)*){0,1}[\s]*(,[\s]*(?P<op2>[\w]+){0,1})*$',re.IGNORECASE)
 
     @staticmethod
     def load(filename: str, buffer: inst_buffer_unit.KindredInstructionBufferUnit ):
         if os.path.exists(filename):
             try:
-                with open(filename,'r') as assembly:
-                    printer.Printer.info( 'LOADER', 'Loading assembly: [{0}]'.format(filename) )
-                    content = assembly.readlines()
-                    assemre = re.compile(r'^((?P<label>[\w_]+){0,1}:){0,1}[\s]*(?P<inst>[\w]+){1}[\s]*(?P<dst>[\w]+){0,1}[\s]*(,[\s]*(?P<op1>[\w()]+)*){0,1}[\s]*(,[\s]*(?P<op2>[\w]+){0,1})*$',re.IGNORECASE)
-                    for line in content:
-                        line = line.strip()
-                        if len(line) > 0 and line[0] != '#':
-                            # Parse line of assembly
-                            printer.Printer.debug( 'LOADER', f'  Parsing line: [{line}]' )
-                            m = None
-                            try:
-                                m = assemre.match(line)
-                            except Exception as e:
-                                printer.Printer.error( 'LOADER', 'Could not parse line [{0}] from [{1}]'.format(line,filename) )
-                                traceback.print_exception(type(e),e,e.__traceback__)
-                            else:
-                                try:
-                                    if m:
-                                        i = inst_buffer_unit.KindredRiscVInstruction( line, m.groupdict()['label'], m.groupdict()['inst'], m.groupdict()['dst'], m.groupdict()['op1'], m.groupdict()['op2'] )
-                                        buffer.append(i)
-                                except Exception as e:
-                                    printer.Printer.error( 'LOADER', 'Could not create RiscV instruction from [{0}]'.format(line) )
-                                    traceback.print_exception(type(e),e,e.__traceback__)
+                with open(filename,'rb') as assembly:
+                    printer.Printer.info( 'LOADER', 'Loading assembly: [{0}]', filename )
+                    source = assembly.read()
             except:
                 printer.Printer.error( 'LOADER', 'Workload file [{filename}] could not be opened for read'.format(filename=filename) )
+                return
+            # Loading allocates objects per line, keep the cyclic GC from rescanning them all the time
+            collecting = gc.isenabled()
+            gc.disable()
+            try:
+                cache = assembly_cache.KindredAssemblyCache()
+                if not cache.restore(source,buffer):
+                    lines = RiscVAssemblyLoader.parse(filename,source,buffer)
+                    if lines != None:
+                        cache.store(source,lines)
+            finally:
+                if collecting:
+                    gc.enable()
         else:
             printer.Printer.error( 'LOADER', 'Workload file [{filename}] was not found'.format(filename=filename) )
 
+    @staticmethod
+    def parse(filename,source,buffer):
+        """ Parse assembly source (bytes) into buffer, returns the (line, regex groups, instruction)
+        of every line for the cache, None after errors so the load is not cached """
+        lines = []
+        clean = True
+        assemre = RiscVAssemblyLoader.compiled_assembly_re
+        for line in source.decode().splitlines():
+            line = line.strip()
+            if len(line) > 0 and line[0] != '#':
+                # Parse line of assembly
+                if printer.Printer.debug_enabled:
+                    printer.Printer.debug( 'LOADER', f'  Parsing line: [{line}]' )
+                m = None
+                try:
+                    m = assemre.match(line)
+                except Exception as e:
+                    printer.Printer.error( 'LOADER', 'Could not parse line [{0}] from [{1}]'.format(line,filename) )
+                    traceback.print_exception(type(e),e,e.__traceback__)
+                    clean = False
+                else:
+                    try:
+                        if m:
+                            groups = m.groupdict()
+                            fields = ( groups['label'], groups['inst'], groups['dst'], groups['op1'], groups['op2'] )
+                            i = inst_buffer_unit.KindredRiscVInstruction( line, *fields )
+                            buffer.append(i)
+                            lines.append( (line,fields,i) )
+                        else:
+                            lines.append( (line,None,None) )
+                    except Exception as e:
+                        printer.Printer.error( 'LOADER', 'Could not create RiscV instruction from [{0}]'.format(line) )
+                        traceback.print_exception(type(e),e,e.__traceback__)
+                        clean = False
+        return lines if clean else None
+
     @staticmethod
     def is_op_register(op):
         if op == None or not isinstance(op,str) or len(op) == 0:
             return False
-        if re.fullmatch(RiscVAssemblyLoader.op_reg_re,op,re.IGNORECASE) is not None:
-            return True
-        return op == 'pc'
+        # x0-x31, ABI names and pc
+        return registers_unit.register_index(op) is not None
     
     @staticmethod
     def is_op_immediate(op):
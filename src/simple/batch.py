@@ -0,0 +1,131 @@
+############################################################################### 
+# File:          batch.py                                                     # 
+# Project:       Kindred                                                      # 
+# Author:        Paul Klein                                                   # 
+# EMail:         pauljkaz@gmail.com                                           # 
+# -----                                                                       # 
+# Last Modified: Mon Jul 31 2023                                              # 
+# Modified By:   Paul Klein                                                   # 
+# -----                                                                       # 
+#                                                                             # 
+#  Copyright (c) 2019 - 2023 N/A, All Rights Reserved.                        # 
+#                                                                             # 
+############################################################################### 
+
+import simulator
+import binary_loader
+import kindredsim
+import sweep
+import pipeline_unit
+import printer
+
+import argparse
+import glob
+import os
+import time
+
+FIELDS = [ 'workload', 'instructions', 'cycles', 'retired', 'cpi' ] + [ 'stall_' + cause for cause in pipeline_unit.KindredPipeline.STALL_CAUSES ] + [ 'host_time', 'error' ]
+
+def workload_list(paths):
+    """ Expand directories (every .s file) and manifests (one workload per line, '#' comments,
+    relative to the manifest) into a list of workloads, ELF and .bin files are workloads themselves """
+    workloads = []
+    for path in paths:
+        if os.path.isdir(path):
+            workloads.extend( sorted(glob.glob(os.path.join(path,'*.s'))) )
+        elif path.endswith('.s') or binary_loader.RiscVBinaryLoader.is_binary(path):
+            workloads.append(path)
+        else:
+            base = os.path.dirname(path)
+            try:
+                with open(path,'r') as manifest:
+                    for line in manifest:
+                        line = line.split('#')[0].strip()
+                        if len(line) > 0:
+                            workloads.append(os.path.join(base,line))
+            except UnicodeDecodeError:
+                raise ValueError('[{0}] is not a manifest - expected one workload path per line'.format(path))
+    return workloads
+
+def run_workload(sim,workload,mode):
+    """ Reset sim, load workload and run it, returns a results row """
+    row = { name : None for name in FIELDS }
+    row['workload'] = workload
+    sim.inst_buffer.clear()
+    sim.reset()
+    if not os.path.exists(workload):
+        row['error'] = 'not found'
+        return row
+    sim.load(workload)
+    row['instructions'] = sim.inst_buffer.size()
+    if sim.inst_buffer.size() == 0:
+        row['error'] = 'no instructions'
+        return row
+
+    if mode == 'cycle':
+        cycles = sim.run_cycle()
+        retired = sim.pipeline.num_retired_instructions
+        row['cycles'] = cycles
+        row['cpi'] = cycles / retired if retired > 0 else None
+        for cause,value in sim.pipeline.stalls.items():
+            row['stall_' + cause] = value
+        if not sim.completed():
+            row['error'] = 'max_cycles reached'
+    else:
+        retired = sim.run_functional()
+    row['retired'] = retired
+    row['host_time'] = sim.host_time
+    return row
+
+def main():
+
+    parser = argparse.ArgumentParser(
+            prog='batch',
+            description='Kindred RiscV Simulator - run many workloads in one process'
+        )
+    parser.add_argument('-w', '--workload', nargs='+', required=True,
+                        help='Workloads, directories of .s files or manifest files listing workloads')
+    parser.add_argument('-m', '--mode', default='cycle', choices=['cycle','functional'],
+                        help='cycle accurate pipeline model or ISA-only functional execution')
+    parser.add_argument('--max_cycles', type=int, default=0,
+                        help='Stop each cycle accurate run after this many cycles, 0 for no limit (default: 0)')
+    parser.add_argument('-o', '--output', default=None,
+                        help='Also write the results table to this .csv or .json file')
+    kindredsim.add_config_arguments(parser)
+    args = parser.parse_args()
+
+    printer.Printer.set_verbosity(printer.PrinterVerbosity.QUIET)
+
+    # One simulator for the whole batch, reset between workloads
+    sim = simulator.KindredSimulator('kindred')
+    sim.max_cycles = args.max_cycles if args.max_cycles > 0 else None
+    if not kindredsim.configure(sim,args):
+        return
+
+    try:
+        workloads = workload_list(args.workload)
+    except (OSError,ValueError) as e:
+        printer.Printer.error( 'BATCH', 'Could not read manifest - {0}', e )
+        return
+
+    start = time.perf_counter()
+    rows = [ run_workload(sim,workload,args.mode) for workload in workloads ]
+    elapsed = time.perf_counter() - start
+    if args.output != None:
+        sweep.write_results(args.output,rows,FIELDS)
+
+    # SUMMARY
+    printer.Printer.summary( 'BATCH', '{0:32} {1:>8} {2:>10} {3:>10} {4:>8} {5:>10}', 'Workload', 'Inst', 'Cycles', 'Retired', 'CPI', 'Host (s)' )
+    for row in rows:
+        if row['retired'] == None:
+            printer.Printer.summary( 'BATCH', '{0:32} {1}', row['workload'], row['error'] )
+            continue
+        printer.Printer.summary( 'BATCH', '{0:32} {1:>8} {2:>10} {3:>10} {4:>8} {5:>10.6f}{6}', row['workload'], row['instructions']
+                                , row['cycles'] if row['cycles'] != None else '-', row['retired']
+                                , '{0:.4f}'.format(row['cpi']) if row['cpi'] != None else '-', row['host_time']
+                                , ' ({0})'.format(row['error']) if row['error'] else '' )
+    failed = sum( 1 for row in rows if row['error'] )
+    printer.Printer.summary( 'BATCH', 'Batch complete - {0} workloads ({1} with errors) in {2:.3f}s', len(rows), failed, elapsed )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+###############################################################################
+# File:          binary_loader.py                                             # 
+# Project:       Kindred                                                      # 
+# Author:        Paul Klein                                                   # 
+# EMail:         pauljkaz@gmail.com                                           # 
+# -----                                                                       # 
+# Last Modified: Mon Jul 31 2023                                              # 
+# Modified By:   Paul Klein                                                   # 
+# -----                                                                       # 
+#                                                                             # 
+#  Copyright (c) 2019 - 2023 N/A, All Rights Reserved.                        # 
+#                                                                             # 
+###############################################################################
+
+import inst_buffer_unit
+import inst_set
+import registers_unit
+import printer
+
+import array
+import gc
+import os
+import struct
+import sys
+
+try:
+    import numpy
+except ImportError:
+    # Fields are then extracted word by word
+    numpy = None
+
+# Major opcode => instruction format
+FORMATS = {
+    0x37 : 'lui'
+    , 0x17 : 'auipc'
+    , 0x6f : 'jal'
+    , 0x67 : 'jalr'
+    , 0x63 : 'branch'
+    , 0x03 : 'load'
+    , 0x23 : 'store'
+    , 0x13 : 'alu_imm'
+    , 0x33 : 'alu'
+    , 0x0f : 'fence'
+    , 0x73 : 'system'
+}
+
+# (major opcode, funct3, funct7 or None) => mnemonic. funct7 only selects for register-register
+# ops and immediate shifts.
+MNEMONICS = {
+    (0x63,0,None) : 'beq', (0x63,1,None) : 'bne', (0x63,4,None) : 'blt'
+    , (0x63,5,None) : 'bge', (0x63,6,None) : 'bltu', (0x63,7,None) : 'bgeu'
+    , (0x03,0,None) : 'lb', (0x03,1,None) : 'lh', (0x03,2,None) : 'lw'
+    , (0x03,4,None) : 'lbu', (0x03,5,None) : 'lhu'
+    , (0x23,0,None) : 'sb', (0x23,1,None) : 'sh', (0x23,2,None) : 'sw'
+    , (0x13,0,None) : 'addi', (0x13,2,None) : 'slti', (0x13,3,None) : 'sltiu'
+    , (0x13,4,None) : 'xori', (0x13,6,None) : 'ori', (0x13,7,None) : 'andi'
+    , (0x13,1,0x00) : 'slli', (0x13,5,0x00) : 'srli', (0x13,5,0x20) : 'srai'
+    , (0x33,0,0x00) : 'add', (0x33,0,0x20) : 'sub', (0x33,1,0x00) : 'sll'
+    , (0x33,2,0x00) : 'slt', (0x33,3,0x00) : 'sltu', (0x33,4,0x00) : 'xor'
+    , (0x33,5,0x00) : 'srl', (0x33,5,0x20) : 'sra', (0x33,6,0x00) : 'or'
+    , (0x33,7,0x00) : 'and'
+}
+
+def sext(value,bits):
+    sign = 1 << (bits - 1)
+    return (value & (sign - 1)) - (value & sign)
+
+# Immediate extraction per format
+def imm_i(w):
+    return sext(w >> 20,12)
+
+def imm_s(w):
+    return sext(((w >> 20) & 0xfe0) | ((w >> 7) & 0x1f),12)
+
+def imm_b(w):
+    return sext(((w >> 19) & 0x1000) | ((w << 4) & 0x800) | ((w >> 20) & 0x7e0) | ((w >> 7) & 0x1e),13)
+
+def imm_u(w):
+    return w >> 12
+
+def imm_j(w):
+    return sext(((w >> 11) & 0x100000) | (w & 0xff000) | ((w >> 9) & 0x800) | ((w >> 20) & 0x7fe),21)
+
+def word_fields(words):
+    """ (major opcode, funct3, funct7, rd, rs1, rs2, I, S, B, U, J immediate) of every word.
+    The extractors above only use operators, so with numpy they run once over all words. """
+    if numpy is not None:
+        w = numpy.asarray(words,dtype=numpy.int64)
+        columns = ( w & 0x7f, (w >> 12) & 0x7, w >> 25, (w >> 7) & 0x1f, (w >> 15) & 0x1f, (w >> 20) & 0x1f
+                    , imm_i(w), imm_s(w), imm_b(w), imm_u(w), imm_j(w) )
+        return list(zip(*( column.tolist() for column in columns )))
+    return [ ( w & 0x7f, (w >> 12) & 0x7, w >> 25, (w >> 7) & 0x1f, (w >> 15) & 0x1f, (w >> 20) & 0x1f
+               , imm_i(w), imm_s(w), imm_b(w), imm_u(w), imm_j(w) ) for w in words ]
+
+
+class RiscVBinaryLoader:
+    """ RV32I machine code front end for ELF executables and raw images
+
+    The simulator PC counts instructions, so code is decoded into the instruction buffer
+    in address order (instruction n is at text base + 4n) with branch and jump targets
+    converted to instruction numbers. Every loaded segment, code included, is also handed
+    to the LSU through buffer.data. Code addresses must only come from jal/jalr links -
+    auipc is resolved at load time to the data address it computes.
+    """
+
+    ELF_MAGIC = b'\x7fELF'
+    # e_ident, e_type, e_machine, e_version, e_entry, e_phoff, e_shoff, e_flags, e_ehsize,
+    # e_phentsize, e_phnum, e_shentsize, e_shnum, e_shstrndx
+    ELF_HEADER = struct.Struct('<16sHHIIIIIHHHHHH')
+    # p_type, p_offset, p_vaddr, p_paddr, p_filesz, p_memsz, p_flags, p_align
+    PROGRAM_HEADER = struct.Struct('<IIIIIIII')
+    EM_RISCV = 243
+    PT_LOAD = 1
+    PF_X = 1
+
+    @staticmethod
+    def is_binary(filename):
+        """ ELF file or raw .bin image, anything else is assembly """
+        if filename.lower().endswith('.bin'):
+            return True
+        try:
+            with open(filename,'rb') as f:
+                return f.read(4) == RiscVBinaryLoader.ELF_MAGIC
+        except OSError:
+            return False
+
+    @staticmethod
+    def load(filename: str, buffer: inst_buffer_unit.KindredInstructionBufferUnit, base=0):
+        if not os.path.exists(filename):
+            printer.Printer.error( 'LOADER', 'Workload file [{filename}] was not found'.format(filename=filename) )
+            return
+        try:
+            with open(filename,'rb') as f:
+                image = f.read()
+        except OSError:
+            printer.Printer.error( 'LOADER', 'Workload file [{filename}] could not be opened for read'.format(filename=filename) )
+            return
+
+        if image[:4] == RiscVBinaryLoader.ELF_MAGIC:
+            printer.Printer.info( 'LOADER', 'Loading ELF: [{0}]', filename )
+            segments = RiscVBinaryLoader.elf_segments(filename,image)
+            if segments == None:
+                return
+            segments,entry = segments
+        else:
+            printer.Printer.info( 'LOADER', 'Loading raw image: [{0}] @{1}', filename, hex(base) )
+            segments = [ (base,image,True) ]
+            entry = base
+
+        code = [ (addr,data) for addr,data,executable in segments if executable ]
+        if len(code) == 0:
+            printer.Printer.error( 'LOADER', 'Workload file [{0}] has no executable segment', filename )
+            return
+        # One contiguous code image from the lowest to the highest executable address
+        text_base = min( addr for addr,_ in code )
+        text = bytearray( max( addr + len(data) for addr,data in code ) - text_base )
+        for addr,data in code:
+            text[addr-text_base:addr-text_base+len(data)] = data
+        text.extend( bytes(-len(text) % 4) )
+
+        # Decoding allocates an object per word, keep the cyclic GC from rescanning them all the time
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            RiscVBinaryLoader.decode(text,text_base,buffer)
+        finally:
+            if collecting:
+                gc.enable()
+        buffer.data.extend( (addr,data) for addr,data,_ in segments )
+        if (entry - text_base) % 4 != 0 or not text_base <= entry < text_base + len(text):
+            printer.Printer.error( 'LOADER', 'Entry point [{0}] is outside the code of [{1}]', hex(entry), filename )
+            return
+        buffer.entry = (entry - text_base) // 4
+        printer.Printer.info( 'LOADER', 'Decoded {0} instructions @{1}, entry @{2}', len(text) // 4, hex(text_base), hex(entry) )
+
+    @staticmethod
+    def elf_segments(filename,image):
+        """ ([(vaddr, bytes, executable)], entry) of a 32-bit little endian RISC-V ELF, None on error """
+        header = RiscVBinaryLoader.ELF_HEADER
+        if len(image) < header.size:
+            printer.Printer.error( 'LOADER', 'ELF file [{0}] is truncated', filename )
+            return None
+        ident,_,machine,_,entry,phoff,_,_,_,phentsize,phnum,_,_,_ = header.unpack_from(image)
+        if ident[4] != 1 or ident[5] != 1 or machine != RiscVBinaryLoader.EM_RISCV:
+            printer.Printer.error( 'LOADER', 'ELF file [{0}] is not a 32-bit little endian RISC-V executable', filename )
+            return None
+        segments = []
+        for i in range(phnum):
+            p_type,offset,vaddr,_,filesz,_,flags,_ = RiscVBinaryLoader.PROGRAM_HEADER.unpack_from(image,phoff + i*phentsize)
+            if p_type != RiscVBinaryLoader.PT_LOAD or filesz == 0:
+                # .bss reads as zero from the LSU without being loaded
+                continue
+            segments.append( (vaddr,image[offset:offset+filesz],(flags & RiscVBinaryLoader.PF_X) != 0) )
+        return segments,entry
+
+    @staticmethod
+    def decode(text,text_base,buffer):
+        """ Decode a code image into buffer. Each distinct word is decoded once and repeats are
+        clones of the first instruction (with the target patched for PC relative ones), and
+        operands are shared between instructions, so the cost is mostly per distinct word. """
+        if numpy is not None:
+            distinct,inverse = numpy.unique(numpy.frombuffer(bytes(text),dtype='<u4'),return_inverse=True)
+            distinct = distinct.tolist()
+            inverse = inverse.tolist()
+        else:
+            words = array.array('I')
+            words.frombytes(text)
+            if sys.byteorder == 'big':
+                words.byteswap()
+            index = {}
+            inverse = [ index.setdefault(w,len(index)) for w in words ]
+            distinct = list(index)
+        first = buffer.size()
+        end = first + len(inverse)
+        operands = {}
+        states = {}
+        templates = [ RiscVBinaryLoader.decode_word(w,fields,end,operands,states) for w,fields in zip(distinct,word_fields(distinct)) ]
+        instructions = []
+        append = instructions.append
+        new = object.__new__
+        cls = inst_buffer_unit.KindredRiscVInstruction
+        operand_cls = inst_buffer_unit.KindredRiscVOperand
+        jump = inst_set.KindredOpcode.JUMP
+        for n,t in enumerate(inverse):
+            state,relative = templates[t]
+            inst = new(cls)
+            inst.__dict__ = state.copy()
+            if relative != None:
+                attr,fmt,delta = relative
+                if attr == 'op1' and inst.opcode.kind != jump:
+                    # auipc - data address from the byte PC
+                    value = inst_set.sext32(text_base + 4*n + delta)
+                else:
+                    value = first + n + delta
+                operand = new(operand_cls)
+                operand.__dict__ = state[attr + '_operand'].__dict__.copy()
+                operand.text = str(value)
+                operand.value = value
+                inst.__dict__[attr] = operand.text
+                inst.__dict__[attr + '_operand'] = operand
+                inst.assembly = fmt.format(value)
+            append(inst)
+        buffer.extend(instructions)
+
+    @staticmethod
+    def decode_word(w,fields,end,operands,states):
+        """ (instruction state, None or (operand, assembly format, target delta)) for one word
+        and its word_fields(). Instruction states are kept in states by their make() arguments,
+        so words that only differ in a patched target (or are unsupported) build one. """
+        names = registers_unit.ABI_NAMES
+        major,funct3,funct7,rd,rs1,rs2,i,s,b,u,j = fields
+        kind = FORMATS.get(major)
+        rd = names[rd]
+        rs1 = names[rs1]
+        rs2 = names[rs2]
+        funct7 = funct7 if major == 0x33 or (major == 0x13 and funct3 & 3 == 1) else None
+        mnemonic = MNEMONICS.get((major,funct3,funct7))
+
+        def operand(text):
+            op = operands.get(text)
+            if op == None:
+                op = operands[text] = inst_buffer_unit.KindredRiscVOperand(text)
+            return op
+
+        def make(assembly,inst,dst='',op1='',op2=''):
+            key = (assembly,inst,dst,op1,op2)
+            state = states.get(key)
+            if state == None:
+                state = states[key] = inst_buffer_unit.KindredRiscVInstruction(assembly,None,inst,dst,op1,op2,(operand(dst),operand(op1),operand(op2))).__dict__
+            return state
+
+        if kind in ('alu','alu_imm','load','store','branch') and mnemonic == None:
+            kind = None
+        if kind == 'alu':
+            return make('{0} {1}, {2}, {3}'.format(mnemonic,rd,rs1,rs2),mnemonic,rd,rs1,rs2),None
+        if kind == 'alu_imm':
+            imm = i & 0x1f if funct3 & 3 == 1 else i
+            return make('{0} {1}, {2}, {3}'.format(mnemonic,rd,rs1,imm),mnemonic,rd,rs1,str(imm)),None
+        if kind == 'load':
+            op1 = '{0}({1})'.format(i,rs1)
+            return make('{0} {1}, {2}'.format(mnemonic,rd,op1),mnemonic,rd,op1),None
+        if kind == 'store':
+            op1 = '{0}({1})'.format(s,rs1)
+            return make('{0} {1}, {2}'.format(mnemonic,rs2,op1),mnemonic,rs2,op1),None
+        if kind == 'lui':
+            return make('lui {0}, {1}'.format(rd,hex(u)),'lui',rd,str(u)),None
+        if kind == 'auipc':
+            return make('auipc','li',rd,'0'),('op1','auipc {0}, {1:#x} ({{0:#x}})'.format(rd,u),u << 12)
+        if kind == 'branch' and b % 4 == 0:
+            return make(mnemonic,mnemonic,rs1,rs2,'0'),('op2','{0} {1}, {2}, {{0}}'.format(mnemonic,rs1,rs2),b // 4)
+        if kind == 'jal' and j % 4 == 0:
+            return make('jal',inst='jal',dst=rd,op1='0'),('op1','jal ' + rd + ', {0}',j // 4)
+        if kind == 'jalr' and funct3 == 0 and i % 4 == 0:
+            # Link registers hold instruction numbers, so is the offset
+            op1 = '{0}({1})'.format(i // 4,rs1)
+            return make('jalr {0}, {1}'.format(rd,op1),'jalr',rd,op1),None
+        if kind == 'fence':
+            return make('fence','nop'),None
+        if kind == 'system' and w in (0x00000073,0x00100073):
+            # ecall/ebreak end the program - jump past the last instruction
+            return make('ecall' if w == 0x73 else 'ebreak','jal','zero',str(end)),None
+        if printer.Printer.debug_enabled:
+            printer.Printer.debug( 'LOADER', 'Unsupported instruction word [{0:#010x}] - treated as nop', w )
+        state = make('.word','unknown').copy()
+        state['assembly'] = '.word {0:#010x}'.format(w)
+        return state,None
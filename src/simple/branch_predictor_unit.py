@@ -0,0 +1,242 @@
+############################################################################### 
+# File:          branch_predictor_unit.py                                     # 
+# Project:       Kindred                                                      # 
+# Author:        Paul Klein                                                   # 
+# EMail:         pauljkaz@gmail.com                                           # 
+# -----                                                                       # 
+# Last Modified: Mon Jul 31 2023                                              # 
+# Modified By:   Paul Klein                                                   # 
+# -----                                                                       # 
+#                                                                             # 
+#  Copyright (c) 2019 - 2023 N/A, All Rights Reserved.                        # 
+#                                                                             # 
+############################################################################### 
+
+import inst_set
+import printer
+
+import array
+
+###############################################################################
+# Direction predictors - predict(pc,inst) / update(pc,taken)
+###############################################################################
+class KindredStaticNotTaken:
+    """ Conditional branches are never taken """
+
+    name = 'static_nt'
+
+    def predict(self,pc,inst):
+        return False
+
+    def update(self,pc,taken):
+        pass
+
+    def reset(self):
+        pass
+
+    def state(self):
+        return b''
+
+    def restore_state(self,data):
+        pass
+
+
+class KindredStaticBTFN(KindredStaticNotTaken):
+    """ Backward taken, forward not taken - loops are predicted to iterate """
+
+    name = 'btfn'
+
+    def predict(self,pc,inst):
+        target = inst.op2_operand.value
+        return target is not None and target <= pc
+
+
+class KindredBimodal:
+    """ Table of 2-bit saturating counters indexed by PC """
+
+    name = 'bimodal'
+
+    def __init__(self,entries=1024):
+        if entries & (entries - 1):
+            raise ValueError('bimodal predictor entries must be a power of two')
+        self.mask = entries - 1
+        self.counters = bytearray(entries)
+        self.reset()
+
+    def reset(self):
+        # Weakly not-taken
+        self.counters[:] = bytearray([1]) * len(self.counters)
+
+    def index(self,pc):
+        return pc & self.mask
+
+    def predict(self,pc,inst):
+        return self.counters[self.index(pc)] >= 2
+
+    def update(self,pc,taken):
+        i = self.index(pc)
+        c = self.counters[i]
+        if taken:
+            if c < 3:
+                self.counters[i] = c + 1
+        elif c > 0:
+            self.counters[i] = c - 1
+
+    def state(self):
+        return bytes(self.counters)
+
+    def restore_state(self,data):
+        self.counters[:] = data
+
+
+class KindredGshare(KindredBimodal):
+    """ 2-bit counters indexed by PC xor global branch history """
+
+    name = 'gshare'
+
+    def __init__(self,entries=4096,history_bits=12):
+        KindredBimodal.__init__(self,entries)
+        self.history_mask = (1 << history_bits) - 1
+        # Updated at resolve time, branches in flight see the committed history
+        self.history = 0
+
+    def reset(self):
+        KindredBimodal.reset(self)
+        self.history = 0
+
+    def index(self,pc):
+        return (pc ^ self.history) & self.mask
+
+    def update(self,pc,taken):
+        KindredBimodal.update(self,pc,taken)
+        self.history = ((self.history << 1) | int(taken)) & self.history_mask
+
+    def state(self):
+        return self.history.to_bytes(8,'little') + bytes(self.counters)
+
+    def restore_state(self,data):
+        self.history = int.from_bytes(data[:8],'little')
+        self.counters[:] = data[8:]
+
+
+###############################################################################
+# Branch target buffer
+###############################################################################
+class KindredBTB:
+    """ Direct mapped branch target buffer, PC => last taken target """
+
+    def __init__(self,entries=256):
+        if entries & (entries - 1):
+            raise ValueError('BTB entries must be a power of two')
+        self.mask = entries - 1
+        self.reset()
+
+    def reset(self):
+        entries = self.mask + 1
+        self.tags = array.array('q',[-1]) * entries
+        self.targets = array.array('q',[0]) * entries
+
+    def lookup(self,pc):
+        i = pc & self.mask
+        if self.tags[i] == pc:
+            return self.targets[i]
+        return None
+
+    def update(self,pc,target):
+        i = pc & self.mask
+        self.tags[i] = pc
+        self.targets[i] = target
+
+    def state(self):
+        return self.tags.tobytes() + self.targets.tobytes()
+
+    def restore_state(self,data):
+        half = len(data) // 2
+        self.tags = array.array('q')
+        self.tags.frombytes(data[:half])
+        self.targets = array.array('q')
+        self.targets.frombytes(data[half:])
+
+
+class KindredBranchPredictorUnit:
+    """ Direction predictor + BTB used by FETCH for speculative fetch """
+
+    PREDICTORS = {
+        KindredStaticNotTaken.name : KindredStaticNotTaken
+        , KindredStaticBTFN.name : KindredStaticBTFN
+        , KindredBimodal.name : KindredBimodal
+        , KindredGshare.name : KindredGshare
+    }
+
+    def __init__(self,instance_name,predictor='bimodal',entries=1024,history_bits=10,btb_entries=256):
+        self.instance_name = instance_name
+        if predictor not in KindredBranchPredictorUnit.PREDICTORS:
+            raise ValueError('unknown branch predictor [{0}]'.format(predictor))
+        if predictor == KindredGshare.name:
+            self.direction = KindredGshare(entries,history_bits)
+        elif predictor == KindredBimodal.name:
+            self.direction = KindredBimodal(entries)
+        else:
+            self.direction = KindredBranchPredictorUnit.PREDICTORS[predictor]()
+        self.btb = KindredBTB(btb_entries)
+        self.reset_stats()
+
+    def reset(self):
+        """ Cold tables, stats cleared """
+        self.direction.reset()
+        self.btb.reset()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.branches = 0
+        self.mispredicts = 0
+        self.btb_misses = 0
+        self.flushes = 0
+        self.flush_cycles = 0
+        self.squashed_instructions = 0
+
+    def predict(self,pc,inst):
+        """ Predicted next PC for the control instruction inst at pc """
+        if inst.opcode.kind == inst_set.KindredOpcode.BRANCH and not self.direction.predict(pc,inst):
+            return pc + 1
+        target = self.btb.lookup(pc)
+        if target is None:
+            # Taken (or unconditional) without a known target - keep fetching sequentially
+            self.btb_misses += 1
+            return pc + 1
+        return target
+
+    def update(self,pc,inst,taken,target):
+        self.branches += 1
+        if inst.opcode.kind == inst_set.KindredOpcode.BRANCH:
+            self.direction.update(pc,taken)
+        if taken:
+            self.btb.update(pc,target)
+
+    def accuracy(self):
+        return 1.0 - self.mispredicts / self.branches if self.branches > 0 else 1.0
+
+    def mpki(self,retired):
+        return 1000.0 * self.mispredicts / retired if retired > 0 else 0.0
+
+    def state(self):
+        """ Tables and stats, packed for checkpoints """
+        counters = array.array('q',[ self.branches, self.mispredicts, self.btb_misses, self.flushes, self.flush_cycles, self.squashed_instructions ])
+        btb = self.btb.state()
+        return counters.tobytes() + len(btb).to_bytes(8,'little') + btb + self.direction.state()
+
+    def restore_state(self,data):
+        counters = array.array('q')
+        counters.frombytes(data[:48])
+        self.branches, self.mispredicts, self.btb_misses, self.flushes, self.flush_cycles, self.squashed_instructions = counters
+        size = int.from_bytes(data[48:56],'little')
+        self.btb.restore_state(data[56:56+size])
+        self.direction.restore_state(data[56+size:])
+
+    def display_stats(self,retired):
+        printer.Printer.summary( 'BPRED', '{0} ({1}, {2} BTB entries)', self.instance_name, self.direction.name, self.btb.mask + 1 )
+        printer.Printer.summary( 'BPRED', '  Control Inst        : {}', self.branches )
+        printer.Printer.summary( 'BPRED', '  Mispredicts         : {} ({} BTB misses)', self.mispredicts, self.btb_misses )
+        printer.Printer.summary( 'BPRED', '  Accuracy            : {:.4f}', self.accuracy() )
+        printer.Printer.summary( 'BPRED', '  MPKI                : {:.2f}', self.mpki(retired) )
+        printer.Printer.summary( 'BPRED', '  Flush Cycles        : {} ({} wrong-path inst squashed)', self.flush_cycles, self.squashed_instructions )
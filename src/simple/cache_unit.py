@@ -0,0 +1,255 @@
+############################################################################### 
+# File:          cache_unit.py                                                # 
+# Project:       Kindred                                                      # 
+# Author:        Paul Klein                                                   # 
+# EMail:         pauljkaz@gmail.com                                           # 
+# -----                                                                       # 
+# Last Modified: Mon Jul 31 2023                                              # 
+# Modified By:   Paul Klein                                                   # 
+# -----                                                                       # 
+#                                                                             # 
+#  Copyright (c) 2019 - 2023 N/A, All Rights Reserved.                        # 
+#                                                                             # 
+############################################################################### 
+
+import load_store_unit
+import printer
+
+import array
+import random
+
+class KindredCache:
+    """ Timing-only set associative cache
+
+    Data always lives in the LSU, the cache only tracks tags to work out the
+    latency of an access. Tags, dirty bits and replacement state are flat arrays
+    indexed by set*assoc+way, a lookup is a single list.index over the set.
+    """
+
+    LRU = 'lru'
+    PLRU = 'plru'
+    RANDOM = 'random'
+
+    WRITE_BACK = 'back'
+    WRITE_THROUGH = 'through'
+
+    # Tag of an empty way - not an integer, so no address can match it
+    INVALID = None
+
+    def __init__(self,instance_name,size=32768,assoc=8,line_size=64,replacement=LRU,write_policy=WRITE_BACK,hit_latency=1,next_level=None,memory_latency=100):
+        self.instance_name = instance_name
+        lines = size // line_size
+        if line_size & (line_size - 1) or assoc <= 0 or lines % assoc or (lines // assoc) & (lines // assoc - 1):
+            raise ValueError('{0}: size, line size and associativity must give a power of two number of sets'.format(instance_name))
+        if replacement == KindredCache.PLRU and assoc & (assoc - 1):
+            raise ValueError('{0}: tree PLRU needs a power of two associativity'.format(instance_name))
+        if replacement not in (KindredCache.LRU,KindredCache.PLRU,KindredCache.RANDOM):
+            raise ValueError('{0}: unknown replacement policy [{1}]'.format(instance_name,replacement))
+        if write_policy not in (KindredCache.WRITE_BACK,KindredCache.WRITE_THROUGH):
+            raise ValueError('{0}: unknown write policy [{1}]'.format(instance_name,write_policy))
+        self.size = size
+        self.assoc = assoc
+        self.line_size = line_size
+        self.num_sets = lines // assoc
+        self.line_bits = line_size.bit_length() - 1
+        self.set_bits = self.num_sets.bit_length() - 1
+        self.set_mask = self.num_sets - 1
+        self.replacement = replacement
+        self.write_policy = write_policy
+        self.hit_latency = hit_latency
+        # Misses go to the next level, or to memory after memory_latency cycles
+        self.next_level : KindredCache = next_level
+        self.memory_latency = memory_latency
+
+        self.reset()
+
+    def reset(self):
+        """ Cold cache, stats cleared - the next level is reset too """
+        lines = self.num_sets * self.assoc
+        # Set-indexed state
+        self.tags = [KindredCache.INVALID] * lines
+        self.dirty = bytearray(lines)
+        self.stamps = array.array('q',[0]) * lines     # LRU - last access time
+        self.plru = array.array('Q',[0]) * self.num_sets  # PLRU - tree bits per set
+        self.clock = 0
+        self.random = random.Random(0)
+
+        # Stats
+        self.reads = 0
+        self.writes = 0
+        self.read_misses = 0
+        self.write_misses = 0
+        self.evictions = 0
+        self.writebacks = 0
+
+        if self.next_level is not None:
+            self.next_level.reset()
+
+    @staticmethod
+    def from_spec(instance_name,spec,next_level=None,memory_latency=100):
+        """ Build a cache from a 'size=32k,assoc=8,line=64,policy=lru,write=back,hit=1' spec """
+        args = {}
+        keys = { 'size' : 'size', 'assoc' : 'assoc', 'line' : 'line_size', 'policy' : 'replacement', 'write' : 'write_policy', 'hit' : 'hit_latency' }
+        for item in spec.split(','):
+            if len(item.strip()) == 0:
+                continue
+            key,_,value = item.partition('=')
+            key = key.strip().lower()
+            value = value.strip().lower()
+            if key not in keys:
+                raise ValueError('{0}: unknown cache option [{1}]'.format(instance_name,key))
+            if key in ('policy','write'):
+                args[keys[key]] = value
+            else:
+                scale = 1
+                if value[-1:] == 'k':
+                    scale = 1024
+                    value = value[:-1]
+                elif value[-1:] == 'm':
+                    scale = 1024 * 1024
+                    value = value[:-1]
+                args[keys[key]] = int(value,0) * scale
+        return KindredCache(instance_name,next_level=next_level,memory_latency=memory_latency,**args)
+
+    def access(self,addr,write=False):
+        """ Look up addr, update the cache and return the access latency in cycles """
+        # Same 32-bit wrap as the LSU, a negative register value is a high address
+        addr &= load_store_unit.ADDR_MASK
+        line = addr >> self.line_bits
+        set_index = line & self.set_mask
+        tag = line >> self.set_bits
+        base = set_index * self.assoc
+        tags = self.tags
+        self.clock += 1
+        if write:
+            self.writes += 1
+        else:
+            self.reads += 1
+
+        try:
+            way = tags.index(tag,base,base + self.assoc) - base
+        except ValueError:
+            way = -1
+
+        if way >= 0:
+            # Hit
+            self.touch(set_index,way)
+            if write:
+                if self.write_policy == KindredCache.WRITE_BACK:
+                    self.dirty[base + way] = 1
+                else:
+                    self.write_next_level(addr)
+            return self.hit_latency
+
+        # Miss
+        if write:
+            self.write_misses += 1
+            if self.write_policy == KindredCache.WRITE_THROUGH:
+                # No write allocate - the store goes straight to the next level
+                return self.hit_latency + self.next_level_latency(addr,True)
+        else:
+            self.read_misses += 1
+        latency = self.hit_latency + self.next_level_latency(addr,False)
+
+        # Allocate, invalid ways first
+        try:
+            way = tags.index(KindredCache.INVALID,base,base + self.assoc) - base
+        except ValueError:
+            way = self.victim(set_index)
+            self.evictions += 1
+            if self.dirty[base + way]:
+                # Write-back of the victim is buffered, it does not add latency
+                self.writebacks += 1
+                self.write_next_level( ((tags[base + way] << self.set_bits) | set_index) << self.line_bits )
+        tags[base + way] = tag
+        self.dirty[base + way] = 1 if write else 0
+        self.touch(set_index,way)
+        return latency
+
+    def next_level_latency(self,addr,write):
+        if self.next_level is not None:
+            return self.next_level.access(addr,write)
+        return self.memory_latency
+
+    def write_next_level(self,addr):
+        if self.next_level is not None:
+            self.next_level.access(addr,True)
+
+    def touch(self,set_index,way):
+        if self.replacement == KindredCache.LRU:
+            self.stamps[set_index * self.assoc + way] = self.clock
+        elif self.replacement == KindredCache.PLRU:
+            # Tree bits point away from the most recently used half
+            bits = self.plru[set_index]
+            node = 1
+            level = self.assoc >> 1
+            while level:
+                if way & level:
+                    bits &= ~(1 << node)
+                    node = node * 2 + 1
+                else:
+                    bits |= 1 << node
+                    node = node * 2
+                level >>= 1
+            self.plru[set_index] = bits
+
+    def victim(self,set_index):
+        if self.replacement == KindredCache.LRU:
+            base = set_index * self.assoc
+            stamps = self.stamps[base:base + self.assoc]
+            return stamps.index(min(stamps))
+        if self.replacement == KindredCache.PLRU:
+            bits = self.plru[set_index]
+            node = 1
+            way = 0
+            level = self.assoc >> 1
+            while level:
+                if (bits >> node) & 1:
+                    way |= level
+                    node = node * 2 + 1
+                else:
+                    node = node * 2
+                level >>= 1
+            return way
+        return self.random.randrange(self.assoc)
+
+    def state(self):
+        """ Tag, dirty and replacement state plus stats, packed for checkpoints """
+        header = array.array('q',[ self.clock, self.reads, self.writes, self.read_misses, self.write_misses, self.evictions, self.writebacks ])
+        tags = array.array('q',[ -1 if tag is KindredCache.INVALID else tag for tag in self.tags ])
+        return header.tobytes() + tags.tobytes() + bytes(self.dirty) + self.stamps.tobytes() + self.plru.tobytes()
+
+    def restore_state(self,data):
+        lines = len(self.tags)
+        header = array.array('q')
+        header.frombytes(data[:56])
+        self.clock, self.reads, self.writes, self.read_misses, self.write_misses, self.evictions, self.writebacks = header
+        offset = 56
+        tags = array.array('q')
+        tags.frombytes(data[offset:offset + lines*8])
+        self.tags[:] = [ KindredCache.INVALID if tag < 0 else tag for tag in tags ]
+        offset += lines*8
+        self.dirty[:] = data[offset:offset + lines]
+        offset += lines
+        self.stamps = array.array('q')
+        self.stamps.frombytes(data[offset:offset + lines*8])
+        offset += lines*8
+        self.plru = array.array('Q')
+        self.plru.frombytes(data[offset:offset + self.num_sets*8])
+
+    def misses(self):
+        return self.read_misses + self.write_misses
+
+    def accesses(self):
+        return self.reads + self.writes
+
+    def miss_rate(self):
+        return self.misses() / self.accesses() if self.accesses() > 0 else 0.0
+
+    def display_stats(self):
+        printer.Printer.summary( 'CACHE', '{0} ({1}B, {2}-way, {3}B lines, {4}, write-{5})', self.instance_name, self.size, self.assoc, self.line_size, self.replacement.upper(), self.write_policy )
+        printer.Printer.summary( 'CACHE', '  Accesses            : {} ({} reads, {} writes)', self.accesses(), self.reads, self.writes )
+        printer.Printer.summary( 'CACHE', '  Hits                : {}', self.accesses() - self.misses() )
+        printer.Printer.summary( 'CACHE', '  Misses              : {} ({} reads, {} writes)', self.misses(), self.read_misses, self.write_misses )
+        printer.Printer.summary( 'CACHE', '  Miss Rate           : {:.4f}', self.miss_rate() )
+        printer.Printer.summary( 'CACHE', '  Evictions           : {} ({} write-backs)', self.evictions, self.writebacks )
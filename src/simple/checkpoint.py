@@ -0,0 +1,310 @@
+############################################################################### 
+# File:          checkpoint.py                                                # 
+# Project:       Kindred                                                      # 
+# Author:        Paul Klein                                                   # 
+# EMail:         pauljkaz@gmail.com                                           # 
+# -----                                                                       # 
+# Last Modified: Mon Jul 31 2023                                              # 
+# Modified By:   Paul Klein                                                   # 
+# -----                                                                       # 
+#                                                                             # 
+#  Copyright (c) 2019 - 2023 N/A, All Rights Reserved.                        # 
+#                                                                             # 
+############################################################################### 
+
+import inst_buffer_unit
+import registers_unit
+import load_store_unit
+import staged_pipeline
+import replay
+import printer
+
+
+import array
+import hashlib
+import mmap
+import os
+import struct
+
+class KindredCheckpoint:
+    """ Compact binary checkpoint of the complete simulator state
+
+    Layout (little-endian):
+        header      magic, version, section count, program hash
+        sections    table of (tag, offset, size)
+        REGS        register values, int64 per register
+        CNTR        named counters, (name length, name, int64) per counter
+        DECO        in-flight decoded instructions, fixed size records
+        LTCH        pipeline latches, int32 index into DECO (-1 empty)
+        LNAM        pipeline latch names in LTCH order, newline separated
+        REDY        staged pipelines, int64 cycle each DECO entry can be worked on in its stage
+        PROD        in-flight producer of each register, int32 index into DECO (-1 none)
+        PAGE        page numbers of the mapped LSU pages, uint64 each
+        MEMP        LSU page contents in PAGE order, PAGE_SIZE bytes each
+        CAC<n>      state of the n-th data cache level, if configured
+        BPRD        branch predictor tables and BTB, if configured
+
+    Sections start on 8 byte boundaries, memory on a 4KB boundary so a
+    checkpoint can be memory-mapped and LSU pages copied straight out of it.
+    """
+
+    MAGIC = b'KNDCKPT\0'
+    VERSION = 1
+
+    HEADER = struct.Struct('<8sIIQ')
+    SECTION = struct.Struct('<4sQQ')
+    COUNTER = struct.Struct('<Hq')
+    # instruction index, None flags, reserved mask, stalled, dst/op1/op2/lsu/resultant/target
+    DECODE = struct.Struct('<iHQB6q')
+
+    DECODE_FIELDS = [ 'dst_value', 'op1_value', 'op2_value', 'lsu_value', 'resultant', 'target' ]
+
+    LATCHES = [
+        'stage1_fetch_input_latch'
+        , 'stage1_fetch_output_latch'
+        , 'stage2_exec_input_latch'
+        , 'stage2_exec_output_latch'
+        , 'stage3_wb_input_latch'
+        , 'stage3_wb_output_latch'
+    ]
+
+    # (object attribute of KindredSimulator or None for the simulator itself, attribute)
+    COUNTERS = [
+        (None, 'cycle')
+        , (None, 'edge')
+        , ('pipeline', 'num_retired_instructions')
+        , ('pipeline', 'exec_lsu_delay')
+        , ('pipeline', 'load_store_unit_access_delay')
+        , ('pipeline', 'fetch_enabled')
+        , ('functional', 'num_retired_instructions')
+    ]
+
+    MEMORY_ALIGN = 4096
+
+    @staticmethod
+    def latches(pipeline):
+        """ (names, decodes) of the pipeline latches - the classic latch attributes or the
+        input/output latch slots of every stage of a staged pipeline """
+        if isinstance(pipeline,staged_pipeline.KindredStagedPipeline):
+            latches = pipeline.latches()
+            return [ name for name,_ in latches ], [ decode for _,decode in latches ]
+        return KindredCheckpoint.LATCHES, [ getattr(pipeline,latch) for latch in KindredCheckpoint.LATCHES ]
+
+    @staticmethod
+    def program_hash(inst_buffer : inst_buffer_unit.KindredInstructionBufferUnit):
+        """ 64-bit fingerprint of the loaded program, checked on restore """
+        h = hashlib.sha1()
+        for inst in inst_buffer.instructions:
+            h.update(inst.assembly.encode())
+            h.update(b'\n')
+        return struct.unpack('<Q',h.digest()[:8])[0]
+
+    @staticmethod
+    def save(filename,sim):
+        pipeline = sim.pipeline
+        if isinstance(pipeline.inst_buffer,replay.KindredReplayBuffer):
+            printer.Printer.error( 'CHECKPOINT', 'Checkpoints are not supported when replaying a trace' )
+            return False
+        sections = []
+
+        # Registers
+        regs = array.array('q',sim.registers.values)
+        regs.append(sim.registers.reserved_mask)
+        sections.append( (b'REGS', regs.tobytes()) )
+
+        # Counters
+        counters = bytearray()
+        for owner,name in KindredCheckpoint.COUNTERS:
+            obj = sim if owner is None else getattr(sim,owner)
+            key = '{0}.{1}'.format(owner or 'simulator',name).encode()
+            counters += KindredCheckpoint.COUNTER.pack(len(key),int(getattr(obj,name)))
+            counters += key
+        for cause,value in pipeline.stalls.items():
+            key = 'pipeline.stalls.{0}'.format(cause).encode()
+            counters += KindredCheckpoint.COUNTER.pack(len(key),value)
+            counters += key
+        sections.append( (b'CNTR', bytes(counters)) )
+
+        # Decoded instructions in flight - latches can share a decode, keep identity
+        decodes = []
+        latches = array.array('i')
+        names,latched = KindredCheckpoint.latches(pipeline)
+        for decode in latched:
+            if decode is None:
+                latches.append(-1)
+                continue
+            for i,d in enumerate(decodes):
+                if d is decode:
+                    latches.append(i)
+                    break
+            else:
+                latches.append(len(decodes))
+                decodes.append(decode)
+        producers = array.array('i')
+        for producer in pipeline.producers:
+            index = -1
+            for i,d in enumerate(decodes):
+                if d is producer:
+                    index = i
+                    break
+            producers.append(index)
+        records = bytearray()
+        for decode in decodes:
+            none_flags = 0
+            fields = []
+            for i,field in enumerate(KindredCheckpoint.DECODE_FIELDS):
+                v = getattr(decode,field)
+                if v is None:
+                    none_flags |= 1 << i
+                    v = 0
+                fields.append(v)
+            records += KindredCheckpoint.DECODE.pack(decode.instruction.id-1,none_flags,decode.reserved_mask,int(decode.stalled),*fields)
+        sections.append( (b'DECO', bytes(records)) )
+        sections.append( (b'LTCH', latches.tobytes()) )
+        sections.append( (b'LNAM', '\n'.join(names).encode()) )
+        if isinstance(pipeline,staged_pipeline.KindredStagedPipeline):
+            sections.append( (b'REDY', array.array('q',[ decode.ready_cycle for decode in decodes ]).tobytes()) )
+        sections.append( (b'PROD', producers.tobytes()) )
+
+        # Memory
+        numbers = array.array('Q',sim.lsu.mapped_pages())
+        sections.append( (b'PAGE', numbers.tobytes()) )
+        sections.append( (b'MEMP', b''.join( sim.lsu.pages[n] for n in numbers )) )
+
+        # Caches
+        for level,cache in enumerate(sim.caches()):
+            sections.append( (b'CAC' + str(level).encode(), cache.state()) )
+
+        # Branch predictor
+        if pipeline.branch_predictor is not None:
+            sections.append( (b'BPRD', pipeline.branch_predictor.state()) )
+
+        # Lay out sections
+        offset = KindredCheckpoint.HEADER.size + KindredCheckpoint.SECTION.size * len(sections)
+        table = []
+        for tag,data in sections:
+            align = KindredCheckpoint.MEMORY_ALIGN if tag.startswith(b'MEM') else 8
+            offset = (offset + align - 1) // align * align
+            table.append( (tag,offset,len(data)) )
+            offset += len(data)
+
+        with open(filename,'wb') as f:
+            f.write(KindredCheckpoint.HEADER.pack(KindredCheckpoint.MAGIC,KindredCheckpoint.VERSION,len(sections),KindredCheckpoint.program_hash(sim.inst_buffer)))
+            for entry in table:
+                f.write(KindredCheckpoint.SECTION.pack(*entry))
+            for (tag,offset,size),(_,data) in zip(table,sections):
+                f.write(b'\0' * (offset - f.tell()))
+                f.write(data)
+        printer.Printer.info( 'CHECKPOINT', 'Saved checkpoint [{0}] at cycle={1}', filename, sim.cycle )
+        return True
+
+    @staticmethod
+    def restore(filename,sim):
+        """ Restore a checkpoint into a simulator with the same program loaded """
+        if not os.path.exists(filename):
+            printer.Printer.error( 'CHECKPOINT', 'Checkpoint [{0}] was not found', filename )
+            return False
+        with open(filename,'rb') as f, mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ) as mm:
+            magic,version,num_sections,program_hash = KindredCheckpoint.HEADER.unpack_from(mm,0)
+            if magic != KindredCheckpoint.MAGIC or version != KindredCheckpoint.VERSION:
+                printer.Printer.error( 'CHECKPOINT', 'Checkpoint [{0}] is not a version {1} Kindred checkpoint', filename, KindredCheckpoint.VERSION )
+                return False
+            if program_hash != KindredCheckpoint.program_hash(sim.inst_buffer):
+                printer.Printer.error( 'CHECKPOINT', 'Checkpoint [{0}] was taken with a different program', filename )
+                return False
+            sections = {}
+            for i in range(num_sections):
+                tag,offset,size = KindredCheckpoint.SECTION.unpack_from(mm,KindredCheckpoint.HEADER.size + i*KindredCheckpoint.SECTION.size)
+                sections[tag] = memoryview(mm)[offset:offset+size]
+            try:
+                # Checkpoints without latch names are from the classic pipeline
+                names = bytes(sections[b'LNAM']).decode().split('\n') if b'LNAM' in sections else KindredCheckpoint.LATCHES
+                if names != KindredCheckpoint.latches(sim.pipeline)[0]:
+                    printer.Printer.error( 'CHECKPOINT', 'Checkpoint [{0}] was taken with a different pipeline', filename )
+                    return False
+                KindredCheckpoint._restore_sections(sections,sim)
+            finally:
+                for view in sections.values():
+                    view.release()
+        printer.Printer.info( 'CHECKPOINT', 'Restored checkpoint [{0}] at cycle={1}', filename, sim.cycle )
+        return True
+
+    @staticmethod
+    def _restore_sections(sections,sim):
+        pipeline = sim.pipeline
+
+        # Registers - update in place, executors hold a reference to the list
+        regs = array.array('q')
+        regs.frombytes(sections[b'REGS'])
+        sim.registers.values[:] = regs[:registers_unit.NUM_REGISTERS]
+        sim.registers.reserved_mask = regs[registers_unit.NUM_REGISTERS]
+
+        # Counters
+        counters = {}
+        data = sections[b'CNTR']
+        offset = 0
+        while offset < len(data):
+            length,value = KindredCheckpoint.COUNTER.unpack_from(data,offset)
+            offset += KindredCheckpoint.COUNTER.size
+            counters[bytes(data[offset:offset+length]).decode()] = value
+            offset += length
+        for owner,name in KindredCheckpoint.COUNTERS:
+            key = '{0}.{1}'.format(owner or 'simulator',name)
+            if key in counters:
+                obj = sim if owner is None else getattr(sim,owner)
+                value = counters[key]
+                setattr(obj,name,bool(value) if isinstance(getattr(obj,name),bool) else value)
+        for cause in pipeline.stalls:
+            pipeline.stalls[cause] = counters.get('pipeline.stalls.{0}'.format(cause),0)
+
+        # Decoded instructions and latches
+        decodes = []
+        for fields in KindredCheckpoint.DECODE.iter_unpack(sections[b'DECO']):
+            index,none_flags,reserved_mask,stalled = fields[:4]
+            decode = inst_buffer_unit.KindredRiscVInstructionDecode(sim.inst_buffer.fetch(index))
+            decode.reserved_mask = reserved_mask
+            decode.stalled = bool(stalled)
+            for i,field in enumerate(KindredCheckpoint.DECODE_FIELDS):
+                setattr(decode,field,None if none_flags & (1 << i) else fields[4+i])
+            decodes.append(decode)
+        latches = array.array('i')
+        latches.frombytes(sections[b'LTCH'])
+        latched = [ decodes[index] if index >= 0 else None for index in latches ]
+        if isinstance(pipeline,staged_pipeline.KindredStagedPipeline):
+            ready = array.array('q')
+            ready.frombytes(sections[b'REDY'])
+            for decode,cycle in zip(decodes,ready):
+                decode.ready_cycle = cycle
+            pipeline.restore_latches(latched)
+        else:
+            for latch,decode in zip(KindredCheckpoint.LATCHES,latched):
+                setattr(pipeline,latch,decode)
+        producers = array.array('i')
+        if b'PROD' in sections:
+            producers.frombytes(sections[b'PROD'])
+        for register in range(registers_unit.NUM_REGISTERS):
+            index = producers[register] if register < len(producers) else -1
+            pipeline.producers[register] = decodes[index] if index >= 0 else None
+
+        # Memory
+        numbers = array.array('Q')
+        numbers.frombytes(sections[b'PAGE'])
+        data = sections[b'MEMP']
+        sim.lsu.clear()
+        for i,number in enumerate(numbers):
+            sim.lsu.pages[number] = bytearray(data[i*load_store_unit.PAGE_SIZE:(i+1)*load_store_unit.PAGE_SIZE])
+
+        # Caches - only when the same hierarchy is configured, otherwise they start cold
+        for level,cache in enumerate(sim.caches()):
+            tag = b'CAC' + str(level).encode()
+            if tag in sections and len(sections[tag]) == len(cache.state()):
+                cache.restore_state(sections[tag])
+            else:
+                printer.Printer.warn( 'CHECKPOINT', 'No matching state for cache [{0}], starting cold', cache.instance_name )
+
+        bp = pipeline.branch_predictor
+        if bp is not None:
+            if b'BPRD' in sections and len(sections[b'BPRD']) == len(bp.state()):
+                bp.restore_state(sections[b'BPRD'])
+            else:
+                printer.Printer.warn( 'CHECKPOINT', 'No matching state for branch predictor [{0}], starting cold', bp.instance_name )
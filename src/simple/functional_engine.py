@@ -0,0 +1,325 @@
+############################################################################### 
+# File:          functional_engine.py                                         # 
+# Project:       Kindred                                                      # 
+# Author:        Paul Klein                                                   # 
+# EMail:         pauljkaz@gmail.com                                           # 
+# -----                                                                       # 
+# Last Modified: Mon Jul 31 2023                                              # 
+# Modified By:   Paul Klein                                                   # 
+# -----                                                                       # 
+#                                                                             # 
+#  Copyright (c) 2019 - 2023 N/A, All Rights Reserved.                        # 
+#                                                                             # 
+############################################################################### 
+
+import inst_buffer_unit
+import registers_unit
+import load_store_unit
+import inst_set
+import printer
+
+import re
+
+class KindredFunctionalEngine:
+    """ ISA-only execution - no latches, stalls or display
+
+    Instructions are run back to back against the same register file and LSU the
+    cycle model uses. Each static instruction is compiled on first execution into a
+    small executor function, with the opcode expression inlined, that returns the next PC.
+
+    Straight-line code is translated a basic block at a time: the executor bodies of a
+    block are compiled into one function, so the run loop dispatches once per block
+    instead of once per instruction. Blocks end at a control instruction, before a
+    leader (label, branch/jump target or fall-through of a control instruction) or after
+    MAX_BLOCK instructions, and are translated on first entry - an entry PC in the middle
+    of a block (jalr, restored state) simply gets a block of its own.
+    """
+
+    # Longest translated block
+    MAX_BLOCK = 256
+    # Loop budget of an unlimited run
+    UNLIMITED = 1 << 62
+
+    def __init__(self,instance_name,inst_buffer,registers,lsu):
+        self.instance_name = instance_name
+        self.inst_buffer : inst_buffer_unit.KindredInstructionBufferUnit = inst_buffer
+        self.registers : registers_unit.KindredRegistersUnit = registers
+        self.lsu : load_store_unit.KindredLoadStoreUnit = lsu
+        self.num_retired_instructions = 0
+        # Translate basic blocks, single instruction executors otherwise
+        self.translate_blocks = True
+
+        self.executors = []
+        # Per entry PC - translated block (None until first entry), its length and executions
+        self.blocks = []
+        self.block_lengths = []
+        self.block_counts = []
+        # Block leader PCs and the instruction buffer version they were built for
+        self.leaders = None
+        self.version = None
+
+        # Iterations a self-looping block may run per call, and the iterations beyond the
+        # first one that looping blocks ran (added to the retired count by run)
+        self.loop_budget = [KindredFunctionalEngine.UNLIMITED]
+        self.loop_iterations = [0]
+
+        # Translation statistics, kept across invalidations
+        self.translations = 0
+        self.translated_instructions = 0
+        self.invalidations = 0
+        self.block_executions = 0
+
+    def invalidate(self):
+        """ Drop executors and translated blocks, e.g. when LSU methods were wrapped. A run
+        also invalidates by itself once the instruction buffer version changes. """
+        if self.executors:
+            self.invalidations += 1
+        self.block_executions += sum(self.block_counts)
+        self.executors = []
+        self.blocks = []
+        self.block_lengths = []
+        self.block_counts = []
+        self.leaders = None
+        self.version = None
+
+    def prepare(self):
+        buffer = self.inst_buffer
+        if self.version != buffer.version or len(self.executors) != buffer.size():
+            self.invalidate()
+            size = buffer.size()
+            self.executors = [ self.build_on_first_use(pc) for pc in range(size) ]
+            self.blocks = [None] * size
+            self.block_lengths = [0] * size
+            self.block_counts = [0] * size
+            self.leaders = self.find_leaders()
+            self.version = buffer.version
+
+    def run(self,max_instructions=None):
+        """ Execute from the current PC until the end of the program or max_instructions """
+        self.prepare()
+        if not self.translate_blocks:
+            return self.run_instructions(max_instructions)
+        executors = self.executors
+        blocks = self.blocks
+        lengths = self.block_lengths
+        counts = self.block_counts
+        budget = self.loop_budget
+        iterations = self.loop_iterations
+        values = self.registers.values
+        size = len(executors)
+        pc = values[registers_unit.PC]
+        retired = 0
+        iterations[0] = 0
+        if max_instructions is None:
+            budget[0] = KindredFunctionalEngine.UNLIMITED
+            while pc < size:
+                block = blocks[pc] or self.translate(pc)
+                retired += lengths[pc]
+                counts[pc] += 1
+                pc = block()
+            retired += iterations[0]
+        else:
+            while pc < size and retired < max_instructions:
+                block = blocks[pc] or self.translate(pc)
+                length = lengths[pc]
+                if retired + length > max_instructions:
+                    # Stop exactly at max_instructions, partway through the block
+                    while pc < size and retired < max_instructions:
+                        pc = executors[pc]()
+                        retired += 1
+                    break
+                budget[0] = (max_instructions - retired) // length
+                counts[pc] += 1
+                pc = block()
+                retired += length + iterations[0]
+                iterations[0] = 0
+        values[registers_unit.PC] = pc
+        self.num_retired_instructions += retired
+        return retired
+
+    def run_instructions(self,max_instructions=None):
+        """ One executor call per instruction """
+        executors = self.executors
+        values = self.registers.values
+        size = len(executors)
+        pc = values[registers_unit.PC]
+        retired = 0
+        if max_instructions is None:
+            while pc < size:
+                pc = executors[pc]()
+                retired += 1
+        else:
+            while pc < size and retired < max_instructions:
+                pc = executors[pc]()
+                retired += 1
+        values[registers_unit.PC] = pc
+        self.num_retired_instructions += retired
+        return retired
+
+    def build_on_first_use(self,pc):
+        def execute():
+            executor = self.build_executor(self.inst_buffer.fetch(pc),pc)
+            self.executors[pc] = executor
+            return executor()
+        return execute
+
+    @staticmethod
+    def operand_source(operand : inst_buffer_unit.KindredRiscVOperand):
+        """ Python expression for an operand value read from 'values' """
+        kind = operand.kind
+        if kind == inst_buffer_unit.KindredRiscVOperand.REGISTER:
+            return 'values[{0}]'.format(operand.index)
+        if kind == inst_buffer_unit.KindredRiscVOperand.REG_OFFSET:
+            if operand.offset == 0:
+                return 'values[{0}]'.format(operand.index)
+            return 'values[{0}] + {1}'.format(operand.index,operand.offset)
+        return repr(operand.value if operand.value is not None else 0)
+
+    @staticmethod
+    def executor_source(inst : inst_buffer_unit.KindredRiscVInstruction,pc):
+        """ Body statements executing inst at pc, the last one returns the next PC """
+        opcode = inst.opcode
+        kind = opcode.kind
+        rd = inst.dst_operand.index
+        d = KindredFunctionalEngine.operand_source(inst.dst_operand)
+        a = KindredFunctionalEngine.operand_source(inst.op1_operand)
+        b = KindredFunctionalEngine.operand_source(inst.op2_operand)
+        nxt = pc + 1
+        # x0 is hard-wired to zero, results written to it are dropped
+        dst = 'values[{0}] = '.format(rd) if rd else ''
+
+        if kind == inst_set.KindredOpcode.ALU:
+            if not rd:
+                return ['return {0}'.format(nxt)]
+            return [ dst + opcode.expression(a,b), 'return {0}'.format(nxt) ]
+        if kind == inst_set.KindredOpcode.LOAD:
+            if opcode.width == 4 and opcode.signed:
+                return [ dst + 'lsu_read_word({0})'.format(a), 'return {0}'.format(nxt) ]
+            return [ dst + 'lsu_read({0}, {1}, {2})'.format(a,opcode.width,opcode.signed), 'return {0}'.format(nxt) ]
+        if kind == inst_set.KindredOpcode.STORE:
+            if opcode.width == 4:
+                return [ 'lsu_write_word({0}, {1})'.format(a,d), 'return {0}'.format(nxt) ]
+            return [ 'lsu_write({0}, {1}, {2})'.format(a,d,opcode.width), 'return {0}'.format(nxt) ]
+        if kind == inst_set.KindredOpcode.BRANCH:
+            return [ 'return {0} if {1} else {2}'.format(repr(inst.op2_operand.value),opcode.expression(d,a),nxt) ]
+        if kind == inst_set.KindredOpcode.JUMP:
+            if opcode.fetch is inst_set.fetch_jump_register:
+                target = a
+            else:
+                target = repr(inst.op1_operand.value)
+            if rd:
+                return [ 'target = ' + target, dst + str(nxt), 'return target' ]
+            return [ 'return ' + target ]
+        return ['return {0}'.format(nxt)]
+
+    def namespace(self):
+        """ Globals of the generated executor and block functions """
+        return {
+            'values' : self.registers.values
+            , 'lsu_read' : self.lsu.read
+            , 'lsu_write' : self.lsu.write
+            , 'lsu_read_word' : self.lsu.read_word
+            , 'lsu_write_word' : self.lsu.write_word
+            , 'loop_budget' : self.loop_budget
+            , 'loop_iterations' : self.loop_iterations
+            , 'block_counts' : self.block_counts
+        }
+
+    def build_executor(self,inst : inst_buffer_unit.KindredRiscVInstruction,pc):
+        source = 'def execute():\n' + ''.join( '    {0}\n'.format(line) for line in self.executor_source(inst,pc) )
+        namespace = self.namespace()
+        exec(compile(source,'<kindred pc={0}>'.format(pc),'exec'),namespace)
+        return namespace['execute']
+
+    ###########################################################################
+    # Basic blocks
+    ###########################################################################
+    def find_leaders(self):
+        """ PCs that start a basic block - labels, static branch/jump targets and the
+        instruction after every control instruction """
+        buffer = self.inst_buffer
+        arrays = buffer.arrays()
+        opcodes = inst_set.KindredInstructionSet.by_id
+        leaders = set(buffer.labels.values())
+        leaders.add(0)
+        for pc,flags in enumerate(arrays.flags):
+            if not flags & inst_buffer_unit.KindredInstructionBufferUnit.FLAG_CONTROL:
+                continue
+            leaders.add(pc + 1)
+            kind = opcodes[arrays.opcode_ids[pc]].kind
+            if kind == inst_set.KindredOpcode.BRANCH:
+                leaders.add(arrays.imm2[pc])
+            elif not flags & inst_buffer_unit.KindredInstructionBufferUnit.FLAG_OP1_REG:
+                # jal - jalr targets are only known at run time
+                leaders.add(arrays.imm1[pc])
+        return leaders
+
+    def block_source(self,pc):
+        """ Body statements of the block entered at pc and its length. Registers live in
+        locals inside the block, written back before it returns. A block ending in a branch
+        back to its own entry loops in place until the branch falls through or loop_budget
+        iterations ran. """
+        buffer = self.inst_buffer
+        leaders = self.leaders
+        size = buffer.size()
+        lines = []
+        end = pc
+        while True:
+            inst = buffer.fetch(end)
+            body = self.executor_source(inst,end)
+            end += 1
+            if inst.opcode.control or end >= size or end in leaders or end - pc >= KindredFunctionalEngine.MAX_BLOCK:
+                break
+            lines.extend(body[:-1])
+        length = end - pc
+        exit = body[-1]
+        lines.extend(body[:-1])
+
+        registers = sorted( set( int(n) for n in re.findall(r'values\[(\d+)\]','\n'.join(lines + [exit])) ) )
+        written = sorted( set( int(m.group(1)) for m in ( re.match(r'values\[(\d+)\] = ',line) for line in lines ) if m ) )
+        local = lambda line: re.sub(r'values\[(\d+)\]',r'r\1',line)
+        prologue = [ 'r{0} = values[{0}]'.format(n) for n in registers ]
+        epilogue = [ 'values[{0}] = r{0}'.format(n) for n in written ]
+        lines = [ local(line) for line in lines ]
+        exit = local(exit)
+
+        if inst.opcode.kind == inst_set.KindredOpcode.BRANCH and inst.op2_operand.value == pc:
+            condition = inst.opcode.expression( local(self.operand_source(inst.dst_operand)), local(self.operand_source(inst.op1_operand)) )
+            return prologue + [ 'limit = loop_budget[0]', 'n = 0', 'while True:', '    n += 1' ] \
+                + [ '    ' + line for line in lines ] \
+                + [ '    if not ({0}) or n >= limit:'.format(condition), '        break' ] \
+                + epilogue + [ 'loop_iterations[0] += (n - 1) * {0}'.format(length), 'block_counts[{0}] += n - 1'.format(pc), exit ], length
+        return prologue + lines + epilogue + [exit], length
+
+    def translate(self,pc):
+        body,length = self.block_source(pc)
+        source = 'def block():\n' + ''.join( '    {0}\n'.format(line) for line in body )
+        namespace = self.namespace()
+        exec(compile(source,'<kindred block pc={0}>'.format(pc),'exec'),namespace)
+        block = self.blocks[pc] = namespace['block']
+        self.block_lengths[pc] = length
+        self.translations += 1
+        self.translated_instructions += length
+        if printer.Printer.debug_enabled:
+            printer.Printer.debug( 'FUNCTIONAL', 'Translated block @PC={0} ({1} instructions)', pc, length )
+        return block
+
+    def stats(self):
+        """ Translation counters and the most executed blocks as plain data """
+        executions = self.block_executions + sum(self.block_counts)
+        hot = sorted( (pc for pc,count in enumerate(self.block_counts) if count), key=lambda pc: -self.block_counts[pc] )[:5]
+        return {
+            'translations' : self.translations
+            , 'translated_instructions' : self.translated_instructions
+            , 'invalidations' : self.invalidations
+            , 'block_executions' : executions
+            , 'hot_blocks' : [ (pc, self.block_lengths[pc], self.block_counts[pc]) for pc in hot ]
+        }
+
+    def display_stats(self):
+        stats = self.stats()
+        printer.Printer.summary( 'FUNCTIONAL', '{0} - basic block translation', self.instance_name )
+        printer.Printer.summary( 'FUNCTIONAL', '  Translated Blocks   : {} ({} instructions, {} invalidations)', stats['translations'], stats['translated_instructions'], stats['invalidations'] )
+        printer.Printer.summary( 'FUNCTIONAL', '  Block Executions    : {}', stats['block_executions'] )
+        for pc,length,count in stats['hot_blocks']:
+            printer.Printer.summary( 'FUNCTIONAL', '  Block @PC={0:<8} : {1} instructions, {2} executions', pc, length, count )
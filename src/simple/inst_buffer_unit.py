@@ -14,30 +14,76 @@
 
 import registers_unit
 import assembly_loader
+import inst_set
 import printer
 
+import array
+import collections
+
+class KindredRiscVOperand:
+    """ Pre-decoded instruction operand (classified once at load time) """
+
+    NONE = 0
+    REGISTER = 1
+    REG_OFFSET = 2
+    IMMEDIATE = 3
+    LABEL = 4
+
+    def __init__(self,text):
+        self.text = text
+        self.kind = KindredRiscVOperand.NONE
+        self.reg = None
+        self.index = None
+        self.offset = 0
+        self.label = None
+        # Constant value for immediates and resolved labels
+        self.value = None
+
+        if assembly_loader.RiscVAssemblyLoader.is_op_register(text):
+            self.kind = KindredRiscVOperand.REGISTER
+            self.reg = text
+            self.index = registers_unit.register_index(text)
+        elif assembly_loader.RiscVAssemblyLoader.is_op_reg_offset(text):
+            params = assembly_loader.RiscVAssemblyLoader.parse_op_as_reg_offset(text)
+            self.reg = params[1].lower()
+            self.index = registers_unit.register_index(self.reg)
+            if self.index is not None:
+                self.kind = KindredRiscVOperand.REG_OFFSET
+                self.offset = params[0]
+            else:
+                printer.Printer.error( 'INSTBUFFER', 'Invalid register [{0}] in operand [{1}]'.format(self.reg,text) )
+        elif assembly_loader.RiscVAssemblyLoader.is_op_hex(text):
+            self.kind = KindredRiscVOperand.IMMEDIATE
+            self.value = int(text,16)
+        elif assembly_loader.RiscVAssemblyLoader.is_op_dec(text):
+            self.kind = KindredRiscVOperand.IMMEDIATE
+            self.value = int(text)
+        elif len(text) > 0:
+            # Resolved by the instruction buffer once the label is known
+            self.kind = KindredRiscVOperand.LABEL
+            self.label = text
+
+    def read(self, registers: registers_unit.KindredRegistersUnit):
+        """ Operand value for the FETCH stage, no string parsing """
+        if self.kind == KindredRiscVOperand.REGISTER:
+            return registers.values[self.index]
+        if self.kind == KindredRiscVOperand.REG_OFFSET:
+            return registers.values[self.index] + self.offset
+        return self.value
+
+    def mask(self):
+        """ Scoreboard mask of the register this operand reads """
+        if self.index is not None:
+            return 1 << self.index
+        return 0
+
+
 class KindredRiscVInstruction:
 
-    def __init__(self,assembly,label,inst,dst,op1,op2):
-        """ RiscV instruction storage and "decoding" """
-
-        # Categorize instructions - typically you would have potentially auto-generated 
-        # code for instruction deccode and execution handlers in functional simulators
-        self.reg_write_back_instructions = [
-            "add"
-            , "addi"
-            , "li"
-            , "lw"
-            , 'slli'
-            , 'slri'
-            , "sub"
-        ]
-        self.mem_store_instructions = [
-            "sw"
-        ]
-        self.mem_load_instructions = [
-            "lw"
-        ]
+    def __init__(self,assembly,label,inst,dst,op1,op2,operands=None):
+        """ RiscV instruction storage and "decoding". operands optionally supplies the
+        already classified (dst, op1, op2) operands, e.g. shared by a binary loader. """
+
         self.id = 0
         self.assembly = assembly.lower() if assembly != None else ''
         self.label = label.lower() if label != None else ''
@@ -46,9 +92,19 @@ class KindredRiscVInstruction:
         self.op1 = op1.lower() if op1 != None else ''
         self.op2 = op2.lower() if op2 != None else ''
 
-        self.reg_write_back = self.inst in self.reg_write_back_instructions
-        self.mem_store = self.inst in self.mem_store_instructions
-        self.mem_load = self.inst in self.mem_load_instructions
+        # Resolve opcode semantics once per static instruction
+        self.opcode = inst_set.KindredInstructionSet.lookup(self.inst)
+        if self.opcode is None:
+            printer.Printer.error( 'INSTBUFFER', 'Unknown instruction [{0}] - treated as nop', self.inst )
+            self.opcode = inst_set.UNKNOWN
+        self.reg_write_back = self.opcode.reg_write_back
+        self.mem_store = self.opcode.mem_store
+        self.mem_load = self.opcode.mem_load
+
+        # Pre-decode operands once, FETCH reads values straight from these
+        if operands == None:
+            operands = (KindredRiscVOperand(self.dst),KindredRiscVOperand(self.op1),KindredRiscVOperand(self.op2))
+        self.dst_operand,self.op1_operand,self.op2_operand = operands
 
         # Check if dst/src opserands are registers and could cause pipe stage stall for THIS instruction
         # reg WB stall would be used for subsequent instruction stall conditions
@@ -57,16 +113,33 @@ class KindredRiscVInstruction:
         # Register Write is only available in WB stage
         # Memory is only availale in Exec stage
         self.stall_regs = []
-        if not self.reg_write_back and assembly_loader.RiscVAssemblyLoader.is_op_register(self.dst):
+        # Source register numbers, used by forwarding
+        self.src_indices = []
+        if not self.reg_write_back and self.dst_operand.kind == KindredRiscVOperand.REGISTER:
             self.stall_regs.append(self.dst)
-        if assembly_loader.RiscVAssemblyLoader.is_op_register(self.op1):
-            self.stall_regs.append(self.op1)
-        elif assembly_loader.RiscVAssemblyLoader.is_op_reg_offset(self.op1):
-            self.stall_regs.append(assembly_loader.RiscVAssemblyLoader.parse_op_as_reg_offset(self.op1)[1])
-        if assembly_loader.RiscVAssemblyLoader.is_op_register(self.op2):
-            self.stall_regs.append(self.op2)
-        elif assembly_loader.RiscVAssemblyLoader.is_op_reg_offset(self.op2):
-            self.stall_regs.append(assembly_loader.RiscVAssemblyLoader.parse_op_as_reg_offset(self.op2)[1])
+            self.src_indices.append(self.dst_operand.index)
+        for operand in (self.op1_operand,self.op2_operand):
+            if operand.kind == KindredRiscVOperand.REGISTER or operand.kind == KindredRiscVOperand.REG_OFFSET:
+                self.stall_regs.append(operand.reg)
+                self.src_indices.append(operand.index)
+
+        # Scoreboard masks so hazard checks are a single bit test
+        self.dst_mask = self.dst_operand.mask() if self.dst_operand.kind == KindredRiscVOperand.REGISTER else 0
+        self.stall_mask = 0
+        for index in self.src_indices:
+            self.stall_mask |= 1 << index
+        # dst is a source for stores (data) and branches (compare)
+        self.reads_dst = not self.reg_write_back and self.dst_operand.kind == KindredRiscVOperand.REGISTER
+        # FETCH stalls on a pending jump/branch, src RAW or dst WAW hazard
+        self.fetch_stall_mask = registers_unit.PC_MASK | self.stall_mask
+        if self.reg_write_back:
+            self.fetch_stall_mask |= self.dst_mask
+        # Read-only from here on, tuples are smaller than lists
+        self.stall_regs = tuple(self.stall_regs)
+        self.src_indices = tuple(self.src_indices)
+
+    def operands(self):
+        return (self.dst_operand,self.op1_operand,self.op2_operand)
 
     def has_reg_write_back(self):
         return self.reg_write_back
@@ -77,20 +150,114 @@ class KindredRiscVInstruction:
         return '       {1}, {2}, {3}, {4}'.format(self.label,self.inst,self.dst,self.op1,self.op2)
 
 
+# Static program as parallel arrays, one element per instruction (see KindredInstructionBufferUnit.arrays)
+KindredProgramArrays = collections.namedtuple('KindredProgramArrays',['opcode_ids','rd','rs1','rs2','imm1','imm2','flags'])
+
 class KindredInstructionBufferUnit:
     """ Instruction Buffer Unit """
+
+    # KindredProgramArrays.flags
+    FLAG_REG_WRITE = 0x01
+    FLAG_LOAD = 0x02
+    FLAG_STORE = 0x04
+    FLAG_CONTROL = 0x08
+    # dst register is a source (stores, branches)
+    FLAG_READS_DST = 0x10
+    # op1/op2 is a register read (register or offset(register))
+    FLAG_OP1_REG = 0x20
+    FLAG_OP2_REG = 0x40
+
     def __init__(self,instance_name):
         self.instance_name = instance_name
         self.instructions = []
         self.labels = {}
+        # Label operands by label name, patched as labels are (re)defined
+        self.label_refs = {}
+        # Program start and initial memory contents [(addr, bytes)] of binary workloads
+        self.entry = 0
+        self.data = []
+        # KindredProgramArrays, built on first use
+        self.program_arrays = None
+        # Bumped on every change, so engines caching translations can tell the program changed
+        self.version = 0
 
     def append(self, instruction : KindredRiscVInstruction):
+        self.program_arrays = None
+        self.version += 1
         if len(instruction.inst) > 0:
             instruction.id = len(self.instructions)+1
             self.instructions.append(instruction)
+            for operand in instruction.operands():
+                if operand.kind == KindredRiscVOperand.LABEL:
+                    self.label_refs.setdefault(operand.label,[]).append(operand)
+                    operand.value = self.labels.get(operand.label)
         if len(instruction.label) > 0:
             self.labels[instruction.label] = len(self.instructions)-1
-            printer.Printer.info( 'INSTBUFFER', 'Label [{0}] set at address [{1}]'.format(instruction.label,self.labels[instruction.label]) )
+            printer.Printer.info( 'INSTBUFFER', 'Label [{0}] set at address [{1}]', instruction.label,self.labels[instruction.label] )
+            # Resolve forward references
+            for operand in self.label_refs.get(instruction.label,[]):
+                operand.value = self.labels[instruction.label]
+
+    def extend(self, instructions):
+        """ Bulk append of instructions without labels (binary loader) """
+        for n,instruction in enumerate(instructions,len(self.instructions)+1):
+            instruction.id = n
+        self.instructions.extend(instructions)
+        self.program_arrays = None
+        self.version += 1
+
+    def clear(self):
+        self.program_arrays = None
+        self.version += 1
+        self.instructions = []
+        self.labels = {}
+        self.label_refs = {}
+        self.entry = 0
+        self.data = []
+
+    def arrays(self) -> KindredProgramArrays:
+        """ The program as parallel arrays indexed by PC - opcode id, dst/op1/op2 register
+        index (-1 none), op1/op2 constant (immediate, resolved label, or the offset of an
+        offset(register) operand, wrapped to 64 bits) and FLAG_* bits. Built once, after
+        the labels are resolved, for engines that process the whole program. """
+        if self.program_arrays == None:
+            arrays = KindredProgramArrays( array.array('H'), array.array('b'), array.array('b'), array.array('b')
+                                         , array.array('q'), array.array('q'), array.array('B') )
+            def register(operand):
+                if operand.kind == KindredRiscVOperand.REGISTER or operand.kind == KindredRiscVOperand.REG_OFFSET:
+                    return operand.index
+                return -1
+            def constant(operand):
+                value = operand.offset if operand.kind == KindredRiscVOperand.REG_OFFSET else operand.value or 0
+                return ((value + (1 << 63)) & 0xFFFFFFFFFFFFFFFF) - (1 << 63)
+            for inst in self.instructions:
+                opcode = inst.opcode
+                rs1 = register(inst.op1_operand)
+                rs2 = register(inst.op2_operand)
+                flags = 0
+                if inst.reg_write_back:
+                    flags |= KindredInstructionBufferUnit.FLAG_REG_WRITE
+                if inst.mem_load:
+                    flags |= KindredInstructionBufferUnit.FLAG_LOAD
+                if inst.mem_store:
+                    flags |= KindredInstructionBufferUnit.FLAG_STORE
+                if opcode.control:
+                    flags |= KindredInstructionBufferUnit.FLAG_CONTROL
+                if inst.reads_dst:
+                    flags |= KindredInstructionBufferUnit.FLAG_READS_DST
+                if rs1 >= 0:
+                    flags |= KindredInstructionBufferUnit.FLAG_OP1_REG
+                if rs2 >= 0:
+                    flags |= KindredInstructionBufferUnit.FLAG_OP2_REG
+                arrays.opcode_ids.append(opcode.id)
+                arrays.rd.append(inst.dst_operand.index if inst.dst_operand.kind == KindredRiscVOperand.REGISTER else -1)
+                arrays.rs1.append(rs1)
+                arrays.rs2.append(rs2)
+                arrays.imm1.append(constant(inst.op1_operand))
+                arrays.imm2.append(constant(inst.op2_operand))
+                arrays.flags.append(flags)
+            self.program_arrays = arrays
+        return self.program_arrays
 
     def fetch(self,addr) -> KindredRiscVInstruction:
         if self.has_instruction_at(addr):
@@ -114,53 +281,78 @@ class KindredInstructionBufferUnit:
         printer.Printer.info( 'INSTBUFFER', '                                ASSEMBLY' )
         printer.Printer.info( 'INSTBUFFER', '-----------------------------------------------------------------------------------' )
         for inst in self.instructions:
-            printer.Printer.info( 'INSTBUFFER', '{0}'.format(inst.assembly) )
+            printer.Printer.info( 'INSTBUFFER', '{0}', inst.assembly )
         printer.Printer.info( 'INSTBUFFER', '-----------------------------------------------------------------------------------' )
     
 
 
 class KindredRiscVInstructionDecode:
     """ Simpel representation of a decoded instruction """
+
+    # Fixed attributes, decodes are recycled through a KindredDecodePool
+    __slots__ = ( 'instruction', 'dst_value', 'op1_value', 'op2_value', 'lsu_value', 'resultant', 'target', 'record'
+                  , 'reserved_mask', 'stalled', 'sequence', 'ready_cycle', 'previous_producer' )
+
     def __init__(self,inst : KindredRiscVInstruction):
+        self.init(inst)
+
+    def init(self,inst : KindredRiscVInstruction):
         self.instruction = inst
         self.dst_value = None
         self.op1_value = None
         self.op2_value = None
         self.lsu_value = None
         self.resultant = None
+        # Control transfer target (taken branch/jump)
+        self.target = None
+        # Retire trace record providing the results in replay (replay.KindredReplayBuffer)
+        self.record = None
 
         # Runtime settings
-        self.reserved_regs = []
+        self.reserved_mask = 0
         self.stalled = False
 
+        # Staged pipeline - age, first cycle the current stage can work on it and the
+        # producer of the destination register this decode replaced
+        self.sequence = 0
+        self.ready_cycle = 0
+        self.previous_producer = None
+
     def reset(self):
-        self.reserved_regs = []
+        self.reserved_mask = 0
         self.resultant = 0
         self.lsu_value = 0
 
-    def reserve_regs(self,regs):
-        if isinstance(regs,list):
-            self.reserved_regs = regs
+    def reserve_regs(self,mask):
+        self.reserved_mask = mask
 
     def fetch_op_values(self, registers: registers_unit.KindredRegistersUnit, inst_buffer: KindredInstructionBufferUnit):
         self.dst_value = 0
-        if self.instruction.mem_load:
-            self.dst_value = self.fetch_op_value(self.instruction.dst,registers,inst_buffer)
-        self.op1_value = self.fetch_op_value(self.instruction.op1,registers,inst_buffer)
-        self.op2_value = self.fetch_op_value(self.instruction.op2,registers,inst_buffer)
-
-    def fetch_op_value(self, op : str, registers: registers_unit.KindredRegistersUnit, inst_buffer: KindredInstructionBufferUnit):
-        if op != None:
-            if assembly_loader.RiscVAssemblyLoader.is_op_register(op):
-                return registers.read(op)
-            elif assembly_loader.RiscVAssemblyLoader.is_op_reg_offset(op):
-                params = assembly_loader.RiscVAssemblyLoader.parse_op_as_reg_offset(op)
-                return registers.read(params[1]) + params[0]
-            elif assembly_loader.RiscVAssemblyLoader.is_op_hex(op):
-                return int(op,16)
-            elif assembly_loader.RiscVAssemblyLoader.is_op_dec(op):
-                return int(op)
-            else:
-                return inst_buffer.label_addr(op)
-        return None
+        if self.instruction.reads_dst:
+            # Store data / branch compare register
+            self.dst_value = self.instruction.dst_operand.read(registers)
+        self.op1_value = self.instruction.op1_operand.read(registers)
+        self.op2_value = self.instruction.op2_operand.read(registers)
+
+
+class KindredDecodePool:
+    """ Free list of decodes, so FETCH does not allocate one per instruction. Sized to the
+    pipeline depth up front, it only grows if more decodes are in flight than that. A decode
+    is released once the pipeline holds no reference to it (retired or squashed). """
+
+    def __init__(self,size):
+        self.free = [ KindredRiscVInstructionDecode(None) for _ in range(size) ]
+        self.allocated = size
+
+    def acquire(self,inst : KindredRiscVInstruction) -> KindredRiscVInstructionDecode:
+        if self.free:
+            decode = self.free.pop()
+            decode.init(inst)
+            return decode
+        self.allocated += 1
+        return KindredRiscVInstructionDecode(inst)
 
+    def release(self,decode : KindredRiscVInstructionDecode):
+        decode.instruction = None
+        decode.previous_producer = None
+        self.free.append(decode)
@@ -0,0 +1,291 @@
+############################################################################### 
+# File:          inst_set.py                                                  # 
+# Project:       Kindred                                                      # 
+# Author:        Paul Klein                                                   # 
+# EMail:         pauljkaz@gmail.com                                           # 
+# -----                                                                       # 
+# Last Modified: Mon Jul 31 2023                                              # 
+# Modified By:   Paul Klein                                                   # 
+# -----                                                                       # 
+#                                                                             # 
+#  Copyright (c) 2019 - 2023 N/A, All Rights Reserved.                        # 
+#                                                                             # 
+############################################################################### 
+
+import registers_unit
+import printer
+
+# Register values are RV32 - results are wrapped to signed 32-bit.
+XLEN_MASK = 0xFFFFFFFF
+SEXT32 = '((({0}) + 0x80000000) & 0xFFFFFFFF) - 0x80000000'
+
+def sext32(v):
+    return ((v + 0x80000000) & XLEN_MASK) - 0x80000000
+
+
+###############################################################################
+# Pipeline stage handlers
+#
+#   fetch(pipeline,decode,pc)          - FETCH negedge control, sets the PC and
+#                                        the registers reserved for write-back
+#   execute(pipeline,decode,complete)  - EXEC posedge, returns True when the
+#                                        stage is complete
+#   write_back(pipeline,decode)        - WB posedge, architectural update
+###############################################################################
+def fetch_sequential(pipeline,decode,pc):
+    inst = decode.instruction
+    pipeline.registers.write_index(registers_unit.PC,pc+1)
+    if inst.reg_write_back:
+        # Instruction with store to a register
+        decode.reserved_mask = inst.dst_mask
+
+def fetch_branch(pipeline,decode,pc):
+    if pipeline.branch_predictor is not None:
+        # Speculative - resolved in EXEC
+        pipeline.predict(decode,pc)
+        return
+    inst = decode.instruction
+    taken = inst.opcode.operation(pipeline.read_operand(inst.dst_operand),pipeline.read_operand(inst.op1_operand))
+    pipeline.control_transfer(decode,pc,taken,inst.op2_operand.value)
+
+def fetch_jump(pipeline,decode,pc):
+    # jal rd, label
+    decode.resultant = pc+1
+    if pipeline.branch_predictor is not None:
+        pipeline.predict(decode,pc)
+        return
+    pipeline.control_transfer(decode,pc,True,decode.instruction.op1_operand.value)
+
+def fetch_jump_register(pipeline,decode,pc):
+    # jalr rd, offset(rs1)
+    decode.resultant = pc+1
+    if pipeline.branch_predictor is not None:
+        pipeline.predict(decode,pc)
+        return
+    pipeline.control_transfer(decode,pc,True,pipeline.read_operand(decode.instruction.op1_operand))
+
+def execute_none(pipeline,decode,complete):
+    return True
+
+def execute_alu(pipeline,decode,complete):
+    decode.resultant = decode.instruction.opcode.operation(decode.op1_value,decode.op2_value)
+    if printer.Printer.debug_enabled:
+        printer.Printer.debug( 'STAGE2', 'Resultant calculated [{0} :: resultant={1}]', decode.instruction.assembly, decode.resultant )
+    return True
+
+def execute_control(pipeline,decode,complete):
+    # With a branch predictor the fetched path is checked here, otherwise FETCH already stalled on the target
+    if pipeline.branch_predictor is not None:
+        inst = decode.instruction
+        kind = inst.opcode.kind
+        if kind == KindredOpcode.BRANCH:
+            taken = inst.opcode.operation(decode.dst_value,decode.op1_value)
+            target = inst.op2_operand.value
+        elif inst.opcode.fetch is fetch_jump_register:
+            taken = True
+            target = decode.op1_value
+        else:
+            taken = True
+            target = inst.op1_operand.value
+        pipeline.resolve(decode,taken,target)
+    return True
+
+def execute_load(pipeline,decode,complete):
+    if complete:
+        # Load value
+        opcode = decode.instruction.opcode
+        v = pipeline.lsu.read(decode.op1_value,opcode.width,opcode.signed)
+        if printer.Printer.debug_enabled:
+            printer.Printer.debug( 'STAGE2', 'LOAD request to LSU completed [addr={0},value={1}]', hex(decode.op1_value), hex(v) )
+        decode.lsu_value = v
+        decode.resultant = v
+        return True
+    if printer.Printer.debug_enabled:
+        printer.Printer.debug( 'STAGE2', 'Sending LOAD request to LSU [addr={0}]', hex(decode.op1_value) )
+    pipeline.lsu_request(decode)
+    return False
+
+def execute_store(pipeline,decode,complete):
+    if complete:
+        # Store value
+        pipeline.lsu.write(decode.op1_value,decode.dst_value,decode.instruction.opcode.width)
+        if printer.Printer.debug_enabled:
+            printer.Printer.debug( 'STAGE2', 'STORE request to LSU completed [addr={0}]', hex(decode.op1_value) )
+        decode.lsu_value = decode.dst_value
+        return True
+    if printer.Printer.debug_enabled:
+        printer.Printer.debug( 'STAGE2', 'Sending STORE request to LSU [addr={0},value={1}]', hex(decode.op1_value), hex(decode.dst_value) )
+    pipeline.lsu_request(decode)
+    return False
+
+def write_back_none(pipeline,decode):
+    pass
+
+def write_back_register(pipeline,decode):
+    inst = decode.instruction
+    if printer.Printer.debug_enabled:
+        printer.Printer.debug( 'STAGE3', 'Performing register write-back [{0}=>{1}]', decode.resultant, inst.dst )
+    pipeline.registers.write_index(inst.dst_operand.index,decode.resultant)
+    pipeline.release(decode)
+
+def write_back_control(pipeline,decode):
+    inst = decode.instruction
+    if decode.reserved_mask & registers_unit.PC_MASK:
+        if printer.Printer.debug_enabled:
+            printer.Printer.debug( 'STAGE3', 'Performing {0} instruction - Jump to address={1}', inst.inst.upper(), decode.target )
+        if inst.reg_write_back:
+            pipeline.registers.write_index(inst.dst_operand.index,decode.resultant)
+        pipeline.registers.write_index(registers_unit.PC,decode.target)
+        pipeline.release(decode)
+    elif inst.reg_write_back:
+        # Predicted jump - PC was redirected earlier, only the link remains
+        pipeline.registers.write_index(inst.dst_operand.index,decode.resultant)
+        pipeline.release(decode)
+
+
+###############################################################################
+# Opcodes
+###############################################################################
+class KindredOpcode:
+    """ Static opcode description and its stage handlers """
+
+    ALU = 'alu'
+    LOAD = 'load'
+    STORE = 'store'
+    BRANCH = 'branch'
+    JUMP = 'jump'
+    NOP = 'nop'
+
+    def __init__(self,name,kind,expr=None,fetch=fetch_sequential,execute=execute_none,write_back=write_back_none,reg_write_back=False,width=4,signed=True):
+        self.name = name
+        self.id = 0
+        self.kind = kind
+        # ALU result or branch condition as a python expression of {a} (op1) and {b} (op2).
+        # Only operators are used so it can be inlined by code generators and also
+        # works element-wise on arrays. operation(a,b) is the compiled form.
+        self.expr = expr
+        self.operation = eval('lambda a,b: ' + self.expression('a','b')) if expr else None
+        self.fetch = fetch
+        self.execute = execute
+        self.write_back = write_back
+        self.reg_write_back = reg_write_back
+        # Memory access size in bytes and sign extension of loads
+        self.width = width
+        self.signed = signed
+        self.mem_load = kind == KindredOpcode.LOAD
+        self.mem_store = kind == KindredOpcode.STORE
+        self.control = kind == KindredOpcode.BRANCH or kind == KindredOpcode.JUMP
+
+    def expression(self,a,b):
+        """ Semantics expression with the given operand expressions substituted """
+        return self.expr.format(a='('+a+')',b='('+b+')')
+
+    def __reduce__(self):
+        # Opcodes are singletons - pickle by name
+        return (KindredInstructionSet.lookup,(self.name,))
+
+    def __str__(self):
+        return self.name
+
+def alu(name,expr,wrap=True):
+    if wrap:
+        expr = SEXT32.format(expr)
+    return KindredOpcode(name,KindredOpcode.ALU,expr,execute=execute_alu,write_back=write_back_register,reg_write_back=True)
+
+def load(name,width=4,signed=True):
+    return KindredOpcode(name,KindredOpcode.LOAD,execute=execute_load,write_back=write_back_register,reg_write_back=True,width=width,signed=signed)
+
+def store(name,width=4):
+    return KindredOpcode(name,KindredOpcode.STORE,execute=execute_store,width=width)
+
+def branch(name,expr):
+    return KindredOpcode(name,KindredOpcode.BRANCH,expr,fetch=fetch_branch,execute=execute_control,write_back=write_back_control)
+
+def jump(name,fetch):
+    return KindredOpcode(name,KindredOpcode.JUMP,fetch=fetch,execute=execute_control,write_back=write_back_control,reg_write_back=True)
+
+
+class KindredInstructionSet:
+    """ Opcode registry, mnemonic => KindredOpcode """
+
+    opcodes = {}
+    by_id = []
+
+    @staticmethod
+    def register(opcode : KindredOpcode):
+        opcode.id = len(KindredInstructionSet.by_id)
+        KindredInstructionSet.by_id.append(opcode)
+        KindredInstructionSet.opcodes[opcode.name] = opcode
+        return opcode
+
+    @staticmethod
+    def lookup(name) -> KindredOpcode:
+        return KindredInstructionSet.opcodes.get(name)
+
+    @staticmethod
+    def has(name):
+        return name in KindredInstructionSet.opcodes
+
+
+# Unknown mnemonics decode to this (no-op) so they still occupy a slot
+UNKNOWN = KindredInstructionSet.register( KindredOpcode('unknown',KindredOpcode.NOP) )
+
+for _opcode in [
+    KindredOpcode('nop',KindredOpcode.NOP)
+
+    # RV32I integer register-register
+    , alu('add',  '{a} + {b}')
+    , alu('sub',  '{a} - {b}')
+    , alu('and',  '{a} & {b}')
+    , alu('or',   '{a} | {b}')
+    , alu('xor',  '{a} ^ {b}')
+    , alu('sll',  '{a} << ({b} & 31)')
+    , alu('srl',  '({a} & 0xFFFFFFFF) >> ({b} & 31)')
+    , alu('sra',  '{a} >> ({b} & 31)')
+    , alu('slt',  '({a} < {b}) * 1', wrap=False)
+    , alu('sltu', '(({a} & 0xFFFFFFFF) < ({b} & 0xFFFFFFFF)) * 1', wrap=False)
+
+    # RV32I integer register-immediate
+    , alu('addi',  '{a} + {b}')
+    , alu('andi',  '{a} & {b}')
+    , alu('ori',   '{a} | {b}')
+    , alu('xori',  '{a} ^ {b}')
+    , alu('slli',  '{a} << ({b} & 31)')
+    , alu('srli',  '({a} & 0xFFFFFFFF) >> ({b} & 31)')
+    , alu('slri',  '({a} & 0xFFFFFFFF) >> ({b} & 31)')     # Legacy spelling of srli
+    , alu('srai',  '{a} >> ({b} & 31)')
+    , alu('slti',  '({a} < {b}) * 1', wrap=False)
+    , alu('sltiu', '(({a} & 0xFFFFFFFF) < ({b} & 0xFFFFFFFF)) * 1', wrap=False)
+    , alu('lui',   '{a} << 12')
+
+    # Pseudo instructions
+    , alu('li',   '{a}')
+    , alu('mv',   '{a}')
+    , alu('not',  '~{a}')
+    , alu('neg',  '-{a}')
+
+    # Load/Store
+    , load('lb',  1)
+    , load('lh',  2)
+    , load('lw',  4)
+    , load('lbu', 1, signed=False)
+    , load('lhu', 2, signed=False)
+    , store('sb', 1)
+    , store('sh', 2)
+    , store('sw', 4)
+
+    # Conditional branches - branch dst, op1, label
+    , branch('beq',  '{a} == {b}')
+    , branch('bne',  '{a} != {b}')
+    , branch('blt',  '{a} < {b}')
+    , branch('bge',  '{a} >= {b}')
+    , branch('bltu', '({a} & 0xFFFFFFFF) < ({b} & 0xFFFFFFFF)')
+    , branch('bgeu', '({a} & 0xFFFFFFFF) >= ({b} & 0xFFFFFFFF)')
+    , branch('ble',  '{a} <= {b}')
+    , branch('bgt',  '{a} > {b}')
+
+    # Jumps - link register receives the return address (pc+1)
+    , jump('jal',  fetch_jump)
+    , jump('jalr', fetch_jump_register)
+]:
+    KindredInstructionSet.register(_opcode)
@@ -12,20 +12,178 @@
 #                                                                             # 
 ###############################################################################
 
+import inst_set
+
+import argparse
+import collections
+import gzip
+import io
+import struct
+
+# Trace files are written through a large buffer
+BUFFER_SIZE = 1 << 20
+
+# Binary trace - header followed by fixed-size little endian records
+#   header : magic, version, record size, opcode count, then per opcode a length byte and its name
+#   record : cycle, pc, opcode id, flags, destination register, destination value, memory address
+MAGIC = b'KINDTRC\0'
+VERSION = 1
+HEADER = struct.Struct('<8sHHI')
+RECORD = struct.Struct('<QIHBBII')
+
+# Record flags
+FLAG_REG_WRITE = 0x1
+FLAG_LOAD = 0x2
+FLAG_STORE = 0x4
+
+KindredTraceRecord = collections.namedtuple('KindredTraceRecord',['cycle','pc','opcode','flags','dst','value','addr'])
+
+def open_file(filename,mode,compress):
+    raw = gzip.open(filename,mode) if compress else open(filename,mode)
+    return io.BufferedWriter(raw,BUFFER_SIZE) if 'w' in mode else io.BufferedReader(raw,BUFFER_SIZE)
+
+def create(filename,binary=None,compress=None):
+    """ Text or binary retire trace, by default picked from the file name (.bin, and .gz to compress) """
+    name = filename[:-3] if filename.endswith('.gz') else filename
+    if compress == None:
+        compress = filename.endswith('.gz')
+    if binary == None:
+        binary = name.endswith('.bin')
+    if binary:
+        return KindredBinaryInstructionTrace(filename,compress)
+    return KindredInstructionTrace(filename,compress)
+
 class KindredInstructionTrace:
-    
-    def __init__(self,filename):
+    """ Text retire trace, one line per retired instruction """
+
+    def __init__(self,filename,compress=False):
         self.filename = filename
+        self.compress = compress
         self.file = None
         self.open(filename)
 
     def __del__(self):
+        self.close()
+
+    def open(self,filename):
+        self.file = io.TextIOWrapper(open_file(filename,'wb',self.compress))
+
+    def close(self):
         if self.file:
             self.file.close()
+            self.file = None
+
+    def retire(self,cycle,decode):
+        if self.file:
+            self.file.write( f'CYCLE={cycle:5} :: {decode.instruction.assembly}\n' )
+
+class KindredBinaryInstructionTrace(KindredInstructionTrace):
+    """ Fixed-size binary retire records, read back with KindredInstructionTraceReader """
 
     def open(self,filename):
-        self.file = open(self.filename,"w")
+        self.file = open_file(filename,'wb',self.compress)
+        self.pack = RECORD.pack
+        opcodes = inst_set.KindredInstructionSet.by_id
+        self.file.write( HEADER.pack(MAGIC,VERSION,RECORD.size,len(opcodes)) )
+        for opcode in opcodes:
+            name = opcode.name.encode()
+            self.file.write( bytes([len(name)]) + name )
+
+    def retire(self,cycle,decode):
+        inst = decode.instruction
+        flags = 0
+        dst = 0
+        value = 0
+        addr = 0
+        if inst.reg_write_back:
+            flags = FLAG_REG_WRITE
+            dst = inst.dst_operand.index or 0
+            value = decode.resultant
+        if inst.mem_load or inst.mem_store:
+            flags |= FLAG_LOAD if inst.mem_load else FLAG_STORE
+            addr = decode.op1_value
+            if inst.mem_store:
+                value = decode.dst_value
+        self.file.write( self.pack(cycle,inst.id - 1,inst.opcode.id,flags,dst,value & 0xFFFFFFFF,addr & 0xFFFFFFFF) )
 
-    def retire(self,cycle,assembly):
+class KindredInstructionTraceReader:
+    """ Streams KindredTraceRecords from a binary trace, compressed or not, a chunk at a time
+
+        with KindredInstructionTraceReader('run.bin.gz') as trace:
+            for record in trace:
+                ...
+    """
+
+    # Records decoded per read
+    CHUNK = 1 << 14
+
+    def __init__(self,filename):
+        self.filename = filename
+        with open(filename,'rb') as f:
+            compress = f.read(2) == b'\x1f\x8b'
+        self.file = open_file(filename,'rb',compress)
+        magic,version,record_size,count = HEADER.unpack(self.file.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError('[{0}] is not a binary instruction trace'.format(filename))
+        if version != VERSION or record_size != RECORD.size:
+            raise ValueError('[{0}] has unsupported trace version {1} (record size {2})'.format(filename,version,record_size))
+        self.opcodes = []
+        for _ in range(count):
+            length = self.file.read(1)[0]
+            self.opcodes.append(self.file.read(length).decode())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+    def close(self):
         if self.file:
-            self.file.write( f'CYCLE={cycle:5} :: {assembly}\n' )
+            self.file.close()
+            self.file = None
+
+    def __iter__(self):
+        size = RECORD.size * KindredInstructionTraceReader.CHUNK
+        make = KindredTraceRecord._make
+        while True:
+            block = self.file.read(size)
+            if len(block) % RECORD.size:
+                raise ValueError('[{0}] ends with a truncated record'.format(self.filename))
+            for record in RECORD.iter_unpack(block):
+                yield make(record)
+            if len(block) < size:
+                return
+
+    def opcode_name(self,opcode):
+        return self.opcodes[opcode] if opcode < len(self.opcodes) else 'unknown'
+
+    def format(self,record):
+        text = f'CYCLE={record.cycle:5} :: PC={record.pc:<5} {self.opcode_name(record.opcode):6}'
+        if record.flags & FLAG_REG_WRITE:
+            text += f' x{record.dst}={record.value:#010x}'
+        if record.flags & FLAG_LOAD:
+            text += f' load[{record.addr:#010x}]'
+        if record.flags & FLAG_STORE:
+            text += f' store[{record.addr:#010x}]={record.value:#010x}'
+        return text.rstrip()
+
+def main():
+
+    parser = argparse.ArgumentParser(
+            prog='inst_trace',
+            description='Kindred RiscV Simulator - print a binary instruction trace'
+        )
+    parser.add_argument('trace', help='Binary trace file (.bin or .bin.gz)')
+    parser.add_argument('-n', '--limit', type=int, default=None,
+                        help='Stop after this many records')
+    args = parser.parse_args()
+
+    with KindredInstructionTraceReader(args.trace) as trace:
+        for i,record in enumerate(trace):
+            if args.limit != None and i >= args.limit:
+                break
+            print(trace.format(record))
+
+if __name__ == "__main__":
+    main()
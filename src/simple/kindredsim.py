@@ -12,103 +12,299 @@
 #                                                                             # 
 ###############################################################################
 
-import assembly_loader
-import registers_unit
-import inst_buffer_unit
-import load_store_unit
-import pipeline_unit
+import assembly_cache
+import simulator
+import staged_pipeline
+import checkpoint
 import vcd_trace
 import inst_trace
+import profiler
 import printer
 
 import argparse
+import gc
+import json
 
 import vcd.common
 
+def add_config_arguments(parser):
+    """ Pipeline, predictor and cache options shared by the command line front ends """
+    parser.add_argument('--pipeline', default='classic', choices=['classic','3stage','5stage'],
+                        help='classic FETCH/EXEC/WB latches or a generic staged pipeline (default: classic)')
+    parser.add_argument('--width', type=int, default=1,
+                        help='Staged pipelines: instructions per stage per cycle (default: 1)')
+    parser.add_argument('--stage_latency', default=None, metavar='STAGE=CYCLES,...',
+                        help='Staged pipelines: per stage latency, e.g. EX=2,MEM=1')
+    parser.add_argument('--forwarding', action='store_true',
+                        help='Forward EXEC/WB results to FETCH instead of stalling until write-back')
+    parser.add_argument('--branch_predictor', default='none', choices=['none','static_nt','btfn','bimodal','gshare'],
+                        help='Speculative fetch with a branch predictor, none stalls FETCH until a taken branch writes back (default: none)')
+    parser.add_argument('--bp_entries', type=int, default=1024,
+                        help='Bimodal/gshare counter table entries (default: 1024)')
+    parser.add_argument('--bp_history', type=int, default=10,
+                        help='gshare global history bits (default: 10)')
+    parser.add_argument('--btb_entries', type=int, default=256,
+                        help='Branch target buffer entries (default: 256)')
+    parser.add_argument('--l1d', default=None, metavar='SPEC',
+                        help='L1 data cache, e.g. size=32k,assoc=8,line=64,policy=lru|plru|random,write=back|through,hit=1')
+    parser.add_argument('--l2', default=None, metavar='SPEC',
+                        help='L2 cache behind the L1D, same SPEC format')
+    parser.add_argument('--memory_latency', type=int, default=100,
+                        help='Cycles for an access that misses the last cache level (default: 100)')
+
+def configure(sim,args):
+    """ Apply add_config_arguments options to sim, False (error reported) if invalid """
+    try:
+        sim.configure_pipeline(args.pipeline,args.width,staged_pipeline.KindredStagedPipeline.parse_latencies(args.stage_latency))
+        sim.pipeline.forwarding = args.forwarding
+        sim.configure_caches(args.l1d,args.l2,args.memory_latency)
+        sim.configure_branch_predictor(args.branch_predictor,args.bp_entries,args.bp_history,args.btb_entries)
+    except ValueError as e:
+        printer.Printer.error( 'SIMULATOR', 'Invalid configuration - {0}', e )
+        return False
+    return True
+
+def load_memory_images(sim,args):
+    """ Apply the --memory_image FILE[@ADDR] options to sim """
+    for image in args.memory_image:
+        filename,_,addr = image.partition('@')
+        sim.lsu.load_file(filename,int(addr,0) if addr else 0,args.mmap)
+
 def main():
 
-    printer.Printer.set_verbosity(printer.PrinterVerbosity.DEBUG)   # FULL OUTPUT
     parser = argparse.ArgumentParser(
             prog='kindredsim',
             description='Kindred RiscV Simulator'
         )
     parser.add_argument('-w', '--workload', required=True)
-    parser.add_argument('-v', '--vcd_trace', required=True)
+    parser.add_argument('-v', '--vcd_trace', default=None)
     parser.add_argument('-i', '--inst_trace', required=True)
+    parser.add_argument('--verbosity', default='debug', choices=[v.name.lower() for v in printer.PrinterVerbosity],
+                        help='Console verbosity (default: debug, FULL OUTPUT)')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='Fast mode - no per-cycle console output, only the end of run summary')
+    parser.add_argument('-m', '--mode', default='cycle', choices=['cycle','functional','sampled'],
+                        help='cycle accurate pipeline model, ISA-only functional execution or sampled (functional fast-forward + detailed windows)')
+    parser.add_argument('--max_cycles', type=int, default=10000,
+                        help='Stop cycle accurate simulation after this many cycles, 0 for no limit (default: 10000)')
+    parser.add_argument('--fast_forward', type=int, default=10000,
+                        help='Sampled mode: instructions executed functionally between samples')
+    parser.add_argument('--warmup', type=int, default=100,
+                        help='Sampled mode: detailed warm-up instructions before each measurement')
+    parser.add_argument('--measure', type=int, default=1000,
+                        help='Sampled mode: detailed instructions measured per sample')
+    parser.add_argument('--no_cycle_skip', action='store_true',
+                        help='Simulate every cycle instead of jumping over cycles spent waiting on the LSU')
+    parser.add_argument('--inst_trace_format', default=None, choices=['text','binary'],
+                        help='Retire trace format (default: binary for .bin files, text otherwise - either is gzipped when the name ends in .gz)')
+    parser.add_argument('--replay', default=None, metavar='TRACE',
+                        help='Cycle mode: take results, addresses and control flow from a binary retire trace of the workload (recorded with -i FILE.bin) and only model timing')
+    parser.add_argument('--no_vcd', '--no-vcd', action='store_true',
+                        help='Do not write a VCD trace (no --vcd_trace needed)')
+    parser.add_argument('--vcd_scope', action='append', default=None, metavar='PATTERN',
+                        help='Only trace signals whose scope or scope.name matches PATTERN, e.g. kindred.pipeline.* or kindred.registers.a0 (repeatable, default: all)')
+    parser.add_argument('--profile', action='store_true',
+                        help='Report host time per pipeline stage and unit plus per-cycle event counters (cycle mode)')
+    parser.add_argument('--profile_output', default=None,
+                        help='Also write the profile to this JSON file')
+    parser.add_argument('--cross_check', action='store_true',
+                        help='Also run the other model and compare final register and memory state')
+    add_config_arguments(parser)
+    parser.add_argument('--load_cache', default=None, metavar='DIR',
+                        help='Directory of the parsed assembly cache (default $KINDRED_CACHE_DIR or ~/.cache/kindred)')
+    parser.add_argument('--no_load_cache', action='store_true',
+                        help='Always parse the assembly workload, neither read nor write the cache (by default every assembly load writes an entry to $KINDRED_CACHE_DIR or ~/.cache/kindred)')
+    parser.add_argument('--memory_image', action='append', default=[], metavar='FILE[@ADDR]',
+                        help='Initialize memory from a binary file at ADDR (default 0), can be repeated')
+    parser.add_argument('--mmap', action='store_true',
+                        help='Read memory images through mmap')
+    parser.add_argument('--checkpoint', default=None,
+                        help='Save a binary checkpoint of the full simulator state to this file (cycle and functional modes)')
+    parser.add_argument('--checkpoint_at', type=int, default=None,
+                        help='Cycle mode: save the checkpoint after this cycle (default: end of run)')
+    parser.add_argument('--checkpoint_at_inst', type=int, default=None,
+                        help='Save the checkpoint once this many instructions have retired (default: end of run)')
+    parser.add_argument('--restore', default=None,
+                        help='Restore simulator state from a checkpoint before running')
     args = parser.parse_args()
+    if args.vcd_trace == None and not args.no_vcd:
+        parser.error('the following arguments are required: -v/--vcd_trace (or --no_vcd)')
+
+    if args.quiet:
+        printer.Printer.set_verbosity(printer.PrinterVerbosity.QUIET)
+    else:
+        printer.Printer.set_verbosity(printer.PrinterVerbosity[args.verbosity.upper()])
 
     # Build simulator
     printer.Printer.info('SIMULATOR', 'Setting up KINDRED simulator...')
 
-    inst_buffer = inst_buffer_unit.KindredInstructionBufferUnit('kindred.inst_buffer')
-    registers = registers_unit.KindredRegistersUnit('kindred.registers')
-    lsu = load_store_unit.KindredLoadStoreUnit('kindred.lsu')
-    pipeline = pipeline_unit.KindredPipeline('kindred.pipeline',inst_buffer,registers,lsu)
+    sim = simulator.KindredSimulator('kindred')
+    # Per-cycle pipe/register tables are skipped entirely when they would print nothing
+    sim.display_cycle = not args.quiet and printer.Printer.info_enabled
+    sim.max_cycles = args.max_cycles if args.max_cycles > 0 else None
+    sim.skip_idle = not args.no_cycle_skip
+    if not configure(sim,args):
+        return
 
     # Load workload
-    assembly_loader.RiscVAssemblyLoader.load(args.workload,inst_buffer)
-    inst_buffer.display()
-
-    if inst_buffer.size() > 0:
-
-        sim_run = True
-        cycle = 0
-        edge = 0
-
-        # Setup Trace / Stats
-        vcd_trace_store = vcd_trace.KindredVcdTrace(args.vcd_trace)
-        clock_var = vcd_trace_store.register('kindren','clk',vcd.common.VarType.integer,2,0)
-        stage1_inst_vcd = vcd_trace_store.register('kindred.stage1','inst',vcd.common.VarType.string,20)
-        inst_trace_store = inst_trace.KindredInstructionTrace(args.inst_trace)
-
-        # Simulation Loop
-        while sim_run:
-            edge = edge + 1
-            cycle = cycle + 1
-
-            printer.Printer.debug( 'SIMULATOR', '----------------------> Stepping simulator...' )
-            printer.Printer.debug( 'SIMULATOR', '   Cycle [{0}]'.format(cycle) )
-            printer.Printer.debug( 'SIMULATOR', '   Current PC [{0}]'.format(registers.get('x0').value) )
-
-            ######################################################################################################################
-            # NEGEDGE - LATCH values from previous stage, Pre-fetch
-            ######################################################################################################################
-            printer.Printer.info( 'SIMULATOR', ' [[ CLOCK@NEGEDGE cycle={0} ]]'.format(cycle) )
-            vcd_trace_store.change(clock_var,edge,0)
-            pipeline.negedge(cycle)
-
-            ######################################################################################################################
-            # UPDATE (POSEDGE) - LSU, Write-Back Store
-            ######################################################################################################################
-            printer.Printer.info( 'SIMULATOR', ' [[ CLOCK@POSEDGE cycle={0} ]]'.format(cycle) )
-            edge = edge + 1
-            vcd_trace_store.change(clock_var,edge,1)
-            pipeline.posedge(cycle)
-
-            ######################################################################################################################
-            # Display Cycle Summary
-            ######################################################################################################################
-            pipeline.display()
-            registers.display()
-
-
-            ######################################################################################################################
-            # Check for Termination
-            ######################################################################################################################
-            if pipeline.empty_pipe():
-                break
-            if cycle == 10000:
-                break
-
-        # SUMMARY
-        printer.Printer.verbose( 'SIMULATOR', 'Simulation complete')
-        printer.Printer.verbose( 'SIMULATOR', '  Total Cycles        : {}'.format(cycle) )
-        printer.Printer.verbose( 'SIMULATOR', '  Total Retired Inst  : {}'.format(pipeline.num_retired_instructions) )
-        printer.Printer.verbose( 'SIMULATOR', '  CPI                 : {}'.format(cycle/pipeline.num_retired_instructions) )
+    if args.no_load_cache:
+        assembly_cache.KindredAssemblyCache.directory = None
+    elif args.load_cache != None:
+        assembly_cache.KindredAssemblyCache.directory = args.load_cache
+    sim.load(args.workload)
+    # The program lives for the whole run - park it outside the collected generations
+    gc.freeze()
+    sim.inst_buffer.display()
+    load_memory_images(sim,args)
+
+    if sim.inst_buffer.size() > 0:
+
+        if args.restore != None:
+            if not checkpoint.KindredCheckpoint.restore(args.restore,sim):
+                return
+            if args.mode != 'cycle' and not sim.pipeline.idle():
+                # Functional execution continues from architectural state only
+                sim.drain()
+
+        if args.replay != None:
+            if args.mode != 'cycle' or args.restore != None or args.checkpoint != None:
+                printer.Printer.error( 'SIMULATOR', 'Replay is only supported in cycle mode without checkpoints' )
+                return
+            try:
+                sim.configure_replay(args.replay)
+            except (OSError,ValueError) as e:
+                printer.Printer.error( 'SIMULATOR', 'Could not open replay trace - {0}', e )
+                return
+
+        profile = profiler.KindredProfiler('kindred.profiler') if args.profile else None
+
+        if args.mode == 'cycle':
+            # Setup Trace / Stats
+            if not args.no_vcd:
+                sim.vcd_trace_store = vcd_trace.KindredVcdTrace(args.vcd_trace,args.vcd_scope)
+                sim.clock_var = sim.vcd_trace_store.register('kindren','clk',vcd.common.VarType.integer,2,0)
+                sim.vcd_sampler = vcd_trace.KindredPipelineVcd(sim.vcd_trace_store,sim)
+            sim.pipeline.inst_trace = inst_trace.create(args.inst_trace,args.inst_trace_format == 'binary' if args.inst_trace_format else None)
+            if profile != None:
+                profile.attach(sim)
+
+            # Without a cycle or instruction count the checkpoint is the final state
+            checkpoint_at_end = args.checkpoint != None and args.checkpoint_at == None and args.checkpoint_at_inst == None
+            if args.checkpoint != None and not checkpoint_at_end:
+                if args.checkpoint_at != None:
+                    max_cycles = sim.max_cycles
+                    sim.max_cycles = args.checkpoint_at
+                    sim.run_cycle()
+                    sim.max_cycles = max_cycles
+                else:
+                    sim.run_cycle(args.checkpoint_at_inst)
+                checkpoint.KindredCheckpoint.save(args.checkpoint,sim)
+
+            try:
+                cycle = sim.run_cycle() if not sim.pipeline.empty_pipe() else sim.cycle
+            except ValueError as e:
+                printer.Printer.error( 'SIMULATOR', 'Replay failed - {0}', e )
+                return
+            if checkpoint_at_end:
+                checkpoint.KindredCheckpoint.save(args.checkpoint,sim)
+            if sim.vcd_trace_store != None:
+                sim.vcd_trace_store.close()
+            sim.pipeline.inst_trace.close()
+
+            # SUMMARY
+            printer.Printer.summary( 'SIMULATOR', 'Simulation complete')
+            printer.Printer.summary( 'SIMULATOR', '  Total Cycles        : {}', cycle )
+            printer.Printer.summary( 'SIMULATOR', '  Total Retired Inst  : {}', sim.pipeline.num_retired_instructions )
+            printer.Printer.summary( 'SIMULATOR', '  CPI                 : {}', cycle/sim.pipeline.num_retired_instructions )
+            stalls = sim.pipeline.stalls
+            printer.Printer.summary( 'SIMULATOR', '  Stall Cycles        : {} (RAW {}, load-use {}, control {}, LSU {}, WAW {})', sim.pipeline.num_stalls()
+                                    , stalls['raw'], stalls['load_use'], stalls['control'], stalls['lsu'], stalls['waw'] )
+            if sim.skipped_cycles > 0:
+                printer.Printer.summary( 'SIMULATOR', '  Skipped Cycles      : {}', sim.skipped_cycles )
+            printer.Printer.summary( 'SIMULATOR', '  Host Time (s)       : {:.6f}', sim.host_time )
+        elif args.mode == 'sampled':
+            if profile != None:
+                profile.attach(sim)
+            results = sim.run_sampled(args.fast_forward,args.warmup,args.measure)
+
+            # SUMMARY
+            printer.Printer.summary( 'SIMULATOR', 'Sampled simulation complete')
+            printer.Printer.summary( 'SIMULATOR', '  Samples             : {}', len(results.samples) )
+            printer.Printer.summary( 'SIMULATOR', '  Total Retired Inst  : {}', results.total_instructions() )
+            printer.Printer.summary( 'SIMULATOR', '  Detailed Inst       : {} ({} measured)', results.detailed_instructions, results.measured_instructions )
+            printer.Printer.summary( 'SIMULATOR', '  CPI                 : {:.4f} +/- {:.4f} (95% confidence)', results.cpi(), results.confidence_interval() )
+            printer.Printer.summary( 'SIMULATOR', '  Estimated Cycles    : {:.0f}', results.estimated_cycles() )
+            printer.Printer.summary( 'SIMULATOR', '  Host Time (s)       : {:.6f}', sim.host_time )
+        else:
+            if profile != None:
+                profile.attach(sim)
+            if args.checkpoint != None and args.checkpoint_at_inst != None:
+                sim.run_functional(args.checkpoint_at_inst - sim.functional.num_retired_instructions)
+                checkpoint.KindredCheckpoint.save(args.checkpoint,sim)
+
+            sim.run_functional()
+            if args.checkpoint != None and args.checkpoint_at_inst == None:
+                checkpoint.KindredCheckpoint.save(args.checkpoint,sim)
+            retired = sim.functional.num_retired_instructions + sim.pipeline.num_retired_instructions
+
+            # SUMMARY
+            printer.Printer.summary( 'SIMULATOR', 'Functional simulation complete')
+            printer.Printer.summary( 'SIMULATOR', '  Total Retired Inst  : {}', retired )
+            printer.Printer.summary( 'SIMULATOR', '  Host Time (s)       : {:.6f}', sim.host_time )
+            printer.Printer.summary( 'SIMULATOR', '  Inst/Sec            : {:.0f}', retired/sim.host_time if sim.host_time > 0 else 0 )
+            sim.functional.display_stats()
+
+        for cache in sim.caches():
+            cache.display_stats()
+        if sim.pipeline.branch_predictor is not None:
+            sim.pipeline.branch_predictor.display_stats(sim.pipeline.num_retired_instructions)
+        if profile != None:
+            profile.display()
+            if args.profile_output != None:
+                with open(args.profile_output,'w') as f:
+                    json.dump(profile.results(),f,indent=2)
+            profile.detach()
+
+        if args.cross_check:
+            cross_check(sim,args)
 
     else:
         printer.Printer.error( 'SIMULATOR', 'No instructions we loaded')
 
+def cross_check(sim,args):
+    """ Run the other model on the same program, memory images and restored state and
+    compare architectural state """
+    mode = args.mode
+    if not sim.completed():
+        printer.Printer.error( 'SIMULATOR', 'Cross-check skipped - simulation did not run to completion')
+        return
+    verbosity = printer.Printer.verbosity
+    printer.Printer.set_verbosity(printer.PrinterVerbosity.QUIET)
+    reference = simulator.KindredSimulator('kindred.reference',sim.inst_buffer)
+    # Same pipeline as sim, a checkpoint only restores into the pipeline it was taken with
+    configure(reference,args)
+    reference.load_image()
+    load_memory_images(reference,args)
+    if args.restore != None and not checkpoint.KindredCheckpoint.restore(args.restore,reference):
+        printer.Printer.set_verbosity(verbosity)
+        printer.Printer.error( 'SIMULATOR', 'Cross-check skipped - could not restore [{0}] into the reference model', args.restore )
+        return
+    reference.max_cycles = None
+    if mode != 'functional':
+        if not reference.pipeline.idle():
+            reference.drain()
+        reference.run_functional()
+    else:
+        reference.run_cycle()
+    printer.Printer.set_verbosity(verbosity)
+
+    mismatches = sim.compare_state(reference)
+    if mismatches:
+        printer.Printer.error( 'SIMULATOR', 'Cross-check FAILED against the {0} model', 'cycle' if mode == 'functional' else 'functional' )
+        for mismatch in mismatches:
+            printer.Printer.error( 'SIMULATOR', '  {0}', mismatch )
+    else:
+        printer.Printer.summary( 'SIMULATOR', 'Cross-check passed against the {0} model', 'cycle' if mode == 'functional' else 'functional' )
+
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,500 @@
+###############################################################################
+# File:          lanes.py                                                     # 
+# Project:       Kindred                                                      # 
+# Author:        Paul Klein                                                   # 
+# EMail:         pauljkaz@gmail.com                                           # 
+# -----                                                                       # 
+# Last Modified: Mon Jul 31 2023                                              # 
+# Modified By:   Paul Klein                                                   # 
+# -----                                                                       # 
+#                                                                             # 
+#  Copyright (c) 2019 - 2023 N/A, All Rights Reserved.                        # 
+#                                                                             # 
+###############################################################################
+
+import simulator
+import inst_buffer_unit
+import registers_unit
+import load_store_unit
+import functional_engine
+import inst_set
+import assembly_loader
+import binary_loader
+import sweep
+import printer
+
+import argparse
+import os
+import re
+import time
+
+try:
+    import numpy
+except ImportError:
+    # The lanes engine is optional, everything else runs without numpy
+    numpy = None
+
+# (width in bytes,signed) => little-endian numpy type of a memory access
+ACCESS = {
+    (1,True) : '<i1'
+    , (1,False) : '<u1'
+    , (2,True) : '<i2'
+    , (2,False) : '<u2'
+    , (4,True) : '<i4'
+    , (4,False) : '<u4'
+}
+
+class KindredLanesEngine:
+    """ ISA-only execution of one program across many lanes at once
+
+    Every lane has its own register file and memory, all lanes run the same program.
+    Registers are a (lanes, registers) int64 array with the pc last, memory is made of
+    4KB pages shared by all lanes, each a (lanes, PAGE_SIZE) byte array allocated on the
+    first write of any lane.
+
+    Lanes at the same PC execute together, one numpy operation per instruction for the
+    whole group. After a branch sends lanes different ways, the group at the lowest PC
+    runs first until it reaches a PC where other lanes wait, they then continue as one
+    group again. Each lane ends with exactly the state the scalar functional model
+    would produce for it.
+    """
+
+    def __init__(self,instance_name,inst_buffer,lanes):
+        if numpy is None:
+            raise ImportError('the lanes engine needs numpy')
+        if lanes < 1:
+            raise ValueError('at least one lane is needed')
+        self.instance_name = instance_name
+        self.inst_buffer : inst_buffer_unit.KindredInstructionBufferUnit = inst_buffer
+        self.lanes = lanes
+        self.lane_ids = numpy.arange(lanes)
+        # Column major - each register of all lanes is contiguous
+        self.values = numpy.zeros((lanes,registers_unit.NUM_REGISTERS),dtype=numpy.int64,order='F')
+        # page number => (lanes, PAGE_SIZE) bytes
+        self.pages = {}
+        # Instructions retired by each lane
+        self.retired = numpy.zeros(lanes,dtype=numpy.int64)
+
+        self.executors = []
+        self.control = []
+        self.version = None
+
+        # Statistics - vector instructions issued and the ones issued for only part of the lanes
+        self.steps = 0
+        self.divergent_steps = 0
+        self.host_time = 0.0
+
+    def reset(self):
+        """ Every lane back to the initial memory and PC of the loaded program """
+        self.values[:] = 0
+        self.pages.clear()
+        self.retired[:] = 0
+        self.steps = 0
+        self.divergent_steps = 0
+        self.host_time = 0.0
+        for addr,data in self.inst_buffer.data:
+            self.write_bytes(addr,data)
+        self.values[:,registers_unit.PC] = self.inst_buffer.entry
+
+    def broadcast_state(self,registers,lsu):
+        """ Every lane starts from the state of a scalar register file and LSU, e.g. a
+        restored checkpoint """
+        self.values[:] = numpy.array(registers.values,dtype=numpy.int64)
+        self.pages.clear()
+        for number,page in lsu.pages.items():
+            self.page(number)[:] = numpy.frombuffer(page,dtype=numpy.uint8)
+
+    def export_lane(self,lane,registers,lsu):
+        """ Copy the state of one lane into a scalar register file and LSU """
+        registers.values[:] = [ int(value) for value in self.values[lane] ]
+        lsu.clear()
+        for number,page in self.pages.items():
+            if page[lane].any():
+                lsu.page(number)[:] = page[lane].tobytes()
+
+    ###########################################################################
+    # Per lane inputs and results
+    ###########################################################################
+    def register_index(self,reg):
+        index = reg if isinstance(reg,int) else registers_unit.register_index(reg)
+        if index is None or not 0 <= index < registers_unit.NUM_REGISTERS:
+            raise ValueError('invalid register [{0}]'.format(reg))
+        return index
+
+    def write_register(self,reg,values):
+        """ Set a register of every lane, values is a scalar or one value per lane """
+        index = self.register_index(reg)
+        # x0 is hard-wired to zero
+        if index != 0:
+            self.values[:,index] = values
+
+    def read_register(self,reg):
+        return self.values[:,self.register_index(reg)].copy()
+
+    def write_memory(self,addr,values,width=4):
+        """ Store to addr in every lane, values is a scalar or one value per lane """
+        self.store(slice(None),addr,values,width)
+
+    def read_memory(self,addr,width=4,signed=True):
+        return self.load(slice(None),addr,width,signed)
+
+    def write_bytes(self,addr,data,lane=None):
+        """ Bulk store into one lane, or all of them """
+        data = numpy.frombuffer(memoryview(data).cast('B'),dtype=numpy.uint8)
+        rows = slice(None) if lane is None else lane
+        addr &= load_store_unit.ADDR_MASK
+        pos = 0
+        while pos < len(data):
+            offset = addr & load_store_unit.PAGE_MASK
+            size = min(load_store_unit.PAGE_SIZE - offset,len(data) - pos)
+            self.page(addr >> load_store_unit.PAGE_BITS)[rows,offset:offset+size] = data[pos:pos+size]
+            addr = (addr + size) & load_store_unit.ADDR_MASK
+            pos += size
+
+    ###########################################################################
+    # Memory
+    ###########################################################################
+    def page(self,number):
+        page = self.pages.get(number)
+        if page is None:
+            page = numpy.zeros((self.lanes,load_store_unit.PAGE_SIZE),dtype=numpy.uint8)
+            self.pages[number] = page
+        return page
+
+    def gather(self,ids,addr):
+        """ Byte at addr (one per lane) of each lane in ids, unmapped pages read as zero """
+        numbers = addr >> load_store_unit.PAGE_BITS
+        offsets = addr & load_store_unit.PAGE_MASK
+        number = int(numbers[0])
+        if (numbers == number).all():
+            page = self.pages.get(number)
+            if page is None:
+                return numpy.zeros(len(ids),dtype=numpy.int64)
+            return page[ids,offsets].astype(numpy.int64)
+        data = numpy.zeros(len(ids),dtype=numpy.int64)
+        for number in numpy.unique(numbers).tolist():
+            page = self.pages.get(number)
+            if page is not None:
+                selected = numbers == number
+                data[selected] = page[ids[selected],offsets[selected]]
+        return data
+
+    def scatter(self,ids,addr,data):
+        numbers = addr >> load_store_unit.PAGE_BITS
+        offsets = addr & load_store_unit.PAGE_MASK
+        number = int(numbers[0])
+        if (numbers == number).all():
+            self.page(number)[ids,offsets] = data
+            return
+        for number in numpy.unique(numbers).tolist():
+            selected = numbers == number
+            self.page(number)[ids[selected],offsets[selected]] = data[selected]
+
+    def load(self,sel,addr,width,signed):
+        """ Little-endian load of the lanes in sel, addr is a scalar or one address per lane """
+        ids = self.lane_ids[sel]
+        addr = numpy.broadcast_to(numpy.asarray(addr,dtype=numpy.int64),ids.shape) & load_store_unit.ADDR_MASK
+        numbers = addr >> load_store_unit.PAGE_BITS
+        offsets = addr & load_store_unit.PAGE_MASK
+        number = int(numbers[0])
+        if (numbers == number).all() and int(offsets.max()) <= load_store_unit.PAGE_SIZE - width:
+            # Every lane in the same page - one gather of all bytes
+            page = self.pages.get(number)
+            if page is None:
+                return numpy.zeros(len(ids),dtype=numpy.int64)
+            data = page[ids[:,None],offsets[:,None] + numpy.arange(width)]
+            return data.view(ACCESS[width,signed]).reshape(-1).astype(numpy.int64)
+        value = self.gather(ids,addr)
+        for n in range(1,width):
+            value |= self.gather(ids,(addr + n) & load_store_unit.ADDR_MASK) << (8*n)
+        if signed:
+            sign = 1 << (8*width - 1)
+            value = (value ^ sign) - sign
+        return value
+
+    def store(self,sel,addr,value,width):
+        ids = self.lane_ids[sel]
+        addr = numpy.broadcast_to(numpy.asarray(addr,dtype=numpy.int64),ids.shape) & load_store_unit.ADDR_MASK
+        value = numpy.broadcast_to(numpy.asarray(value,dtype=numpy.int64),ids.shape)
+        numbers = addr >> load_store_unit.PAGE_BITS
+        offsets = addr & load_store_unit.PAGE_MASK
+        number = int(numbers[0])
+        if (numbers == number).all() and int(offsets.max()) <= load_store_unit.PAGE_SIZE - width:
+            data = value.astype(ACCESS[width,False]).view(numpy.uint8).reshape(-1,width)
+            self.page(number)[ids[:,None],offsets[:,None] + numpy.arange(width)] = data
+            return
+        for n in range(width):
+            self.scatter(ids,(addr + n) & load_store_unit.ADDR_MASK,((value >> (8*n)) & 0xFF).astype(numpy.uint8))
+
+    ###########################################################################
+    # Execution
+    ###########################################################################
+    def prepare(self):
+        buffer = self.inst_buffer
+        if self.version != buffer.version or len(self.executors) != buffer.size():
+            self.executors = [ self.build_on_first_use(pc) for pc in range(buffer.size()) ]
+            self.control = [ buffer.fetch(pc).opcode.control for pc in range(buffer.size()) ]
+            self.version = buffer.version
+
+    def run(self,max_steps=None):
+        """ Execute until every lane reached the end of the program or max_steps vector
+        instructions were issued, returns the instructions retired over all lanes """
+        start = time.perf_counter()
+        self.prepare()
+        executors = self.executors
+        control = self.control
+        size = len(executors)
+        values = self.values
+        pcs = values[:,registers_unit.PC]
+        retired = self.retired
+        before = int(retired.sum())
+        all_lanes = slice(None)
+        steps = 0
+        while max_steps is None or steps < max_steps:
+            pc = int(pcs[0])
+            group = pcs == pc
+            if group.all():
+                # Converged
+                if pc >= size:
+                    break
+                sel = all_lanes
+                waiting = ()
+            else:
+                active = pcs < size
+                if not active.any():
+                    break
+                pc = int(pcs[active].min())
+                group = pcs == pc
+                sel = numpy.flatnonzero(group)
+                waiting = set(numpy.unique(pcs[~group]).tolist())
+            # Straight-line run of the group, until a control instruction or a PC where other lanes wait
+            count = 0
+            while True:
+                executors[pc](sel)
+                count += 1
+                if control[pc]:
+                    break
+                pc += 1
+                if pc >= size or pc in waiting or (max_steps is not None and steps + count >= max_steps):
+                    values[sel,registers_unit.PC] = pc
+                    break
+            steps += count
+            retired[sel] += count
+            if sel is not all_lanes:
+                self.divergent_steps += count
+        self.steps += steps
+        self.host_time += time.perf_counter() - start
+        return int(retired.sum()) - before
+
+    def completed(self):
+        return bool((self.values[:,registers_unit.PC] >= self.inst_buffer.size()).all())
+
+    def build_on_first_use(self,pc):
+        def execute(sel):
+            executor = self.build_executor(self.inst_buffer.fetch(pc),pc)
+            self.executors[pc] = executor
+            return executor(sel)
+        return execute
+
+    @staticmethod
+    def executor_source(inst : inst_buffer_unit.KindredRiscVInstruction,pc):
+        """ Body statements executing inst for the lanes in sel. Only control instructions
+        write the PC, the run loop sets it at the end of a straight-line run. """
+        opcode = inst.opcode
+        kind = opcode.kind
+        rd = inst.dst_operand.index
+        # Scalar operand expressions, registers become the column of the lanes in sel
+        source = lambda operand: re.sub(r'values\[(\d+)\]',r'values[sel,\1]',functional_engine.KindredFunctionalEngine.operand_source(operand))
+        d = source(inst.dst_operand)
+        a = source(inst.op1_operand)
+        b = source(inst.op2_operand)
+        nxt = pc + 1
+        pc_dst = 'values[sel,{0}] = '.format(registers_unit.PC)
+        # x0 is hard-wired to zero, results written to it are dropped
+        dst = 'values[sel,{0}] = '.format(rd) if rd else None
+
+        if kind == inst_set.KindredOpcode.ALU:
+            if dst == None:
+                return ['pass']
+            return [ dst + opcode.expression(a,b) ]
+        if kind == inst_set.KindredOpcode.LOAD:
+            value = 'load(sel, {0}, {1}, {2})'.format(a,opcode.width,opcode.signed)
+            return [ dst + value if dst != None else value ]
+        if kind == inst_set.KindredOpcode.STORE:
+            return [ 'store(sel, {0}, {1}, {2})'.format(a,d,opcode.width) ]
+        if kind == inst_set.KindredOpcode.BRANCH:
+            return [ pc_dst + 'where({0}, {1}, {2})'.format(opcode.expression(d,a),repr(inst.op2_operand.value),nxt) ]
+        if kind == inst_set.KindredOpcode.JUMP:
+            if opcode.fetch is inst_set.fetch_jump_register:
+                # Copied - a column view would see the link write when rd is also the base
+                target = 'array({0})'.format(a)
+            else:
+                target = repr(inst.op1_operand.value)
+            if dst != None:
+                return [ 'target = ' + target, dst + str(nxt), pc_dst + 'target' ]
+            return [ pc_dst + target ]
+        return ['pass']
+
+    def build_executor(self,inst : inst_buffer_unit.KindredRiscVInstruction,pc):
+        source = 'def execute(sel):\n' + ''.join( '    {0}\n'.format(line) for line in self.executor_source(inst,pc) )
+        namespace = {
+            'values' : self.values
+            , 'load' : self.load
+            , 'store' : self.store
+            , 'where' : numpy.where
+            , 'array' : numpy.array
+        }
+        exec(compile(source,'<kindred lanes pc={0}>'.format(pc),'exec'),namespace)
+        return namespace['execute']
+
+    ###########################################################################
+    # Statistics
+    ###########################################################################
+    def utilization(self):
+        """ Fraction of the issued lane slots that retired an instruction """
+        if self.steps == 0:
+            return 0.0
+        return int(self.retired.sum()) / (self.steps * self.lanes)
+
+    def display_stats(self):
+        retired = int(self.retired.sum())
+        printer.Printer.summary( 'LANES', '{0} - {1} lanes', self.instance_name, self.lanes )
+        printer.Printer.summary( 'LANES', '  Vector Inst         : {} ({} divergent)', self.steps, self.divergent_steps )
+        printer.Printer.summary( 'LANES', '  Lane Retired Inst   : {} (min {}, max {} per lane)', retired, int(self.retired.min()), int(self.retired.max()) )
+        printer.Printer.summary( 'LANES', '  Lane Utilization    : {:.2%}', self.utilization() )
+        printer.Printer.summary( 'LANES', '  Host Time (s)       : {:.6f}', self.host_time )
+        printer.Printer.summary( 'LANES', '  Lane Inst/Sec       : {:.0f}', retired/self.host_time if self.host_time > 0 else 0 )
+
+
+###############################################################################
+# Command line
+###############################################################################
+def parse_input(engine,text,seed):
+    """ Lane values of a 'START[:STEP]' (lane n gets START + n*STEP) or 'rand:LO:HI' spec """
+    fields = text.split(':')
+    if fields[0] == 'rand':
+        if len(fields) != 3:
+            raise ValueError('random input needs rand:LO:HI, got [{0}]'.format(text))
+        return numpy.random.default_rng(seed).integers(int(fields[1],0),int(fields[2],0),engine.lanes,endpoint=True)
+    if len(fields) > 2:
+        raise ValueError('invalid lane input [{0}]'.format(text))
+    step = int(fields[1],0) if len(fields) == 2 else 0
+    return int(fields[0],0) + step * engine.lane_ids
+
+def parse_target(engine,target):
+    """ Register index, or memory address of a word """
+    if registers_unit.register_index(target) is not None:
+        return ('reg',registers_unit.register_index(target))
+    try:
+        return ('mem',int(target,0))
+    except ValueError:
+        raise ValueError('[{0}] is neither a register nor an address'.format(target))
+
+def read_target(engine,target):
+    kind,where = target
+    if kind == 'reg':
+        return engine.read_register(where)
+    return engine.read_memory(where)
+
+def main():
+
+    parser = argparse.ArgumentParser(
+            prog='lanes',
+            description='Kindred RiscV Simulator - one program over many inputs, all lanes executed at once (needs numpy)'
+        )
+    parser.add_argument('-w', '--workload', required=True,
+                        help='Workload run by every lane')
+    parser.add_argument('-n', '--lanes', type=int, default=1024,
+                        help='Number of lanes (default: 1024)')
+    parser.add_argument('--init', nargs=2, action='append', default=[], metavar=('TARGET','VALUES'),
+                        help='Initial value of a register or memory word (address) per lane: START[:STEP] gives lane n START + n*STEP, rand:LO:HI draws uniformly')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the rand: inputs (default: 0)')
+    parser.add_argument('--report', nargs='+', default=[], metavar='TARGET',
+                        help='Registers or memory words (addresses) summarized over the lanes at the end')
+    parser.add_argument('--max_steps', type=int, default=None,
+                        help='Stop after this many vector instructions')
+    parser.add_argument('-o', '--output', default=None,
+                        help='Per lane results (retired instructions and the --report values), .csv or .json')
+    parser.add_argument('--cross_check', action='store_true',
+                        help='Run every lane again in the scalar functional model and compare the final state')
+    args = parser.parse_args()
+
+    printer.Printer.set_verbosity(printer.PrinterVerbosity.QUIET)
+
+    if numpy is None:
+        printer.Printer.error( 'LANES', 'The lanes engine needs numpy' )
+        return
+    if not os.path.exists(args.workload):
+        printer.Printer.error( 'LANES', 'Workload [{0}] was not found', args.workload )
+        return
+
+    buffer = inst_buffer_unit.KindredInstructionBufferUnit('kindred.inst_buffer')
+    if binary_loader.RiscVBinaryLoader.is_binary(args.workload):
+        binary_loader.RiscVBinaryLoader.load(args.workload,buffer)
+    else:
+        assembly_loader.RiscVAssemblyLoader.load(args.workload,buffer)
+    if buffer.size() == 0:
+        printer.Printer.error( 'LANES', 'No instructions were loaded' )
+        return
+
+    try:
+        engine = KindredLanesEngine('kindred.lanes',buffer,args.lanes)
+        engine.reset()
+        for n,(target,text) in enumerate(args.init):
+            kind,where = parse_target(engine,target)
+            values = parse_input(engine,text,args.seed + n)
+            if kind == 'reg':
+                engine.write_register(where,values)
+            else:
+                engine.write_memory(where,values)
+        reports = [ (target,parse_target(engine,target)) for target in args.report ]
+    except ValueError as e:
+        printer.Printer.error( 'LANES', 'Invalid lanes run - {0}', e )
+        return
+    inputs = ( engine.values.copy(), { number : page.copy() for number,page in engine.pages.items() } )
+
+    engine.run(args.max_steps)
+
+    # SUMMARY
+    printer.Printer.summary( 'LANES', 'Lanes simulation complete{0}', '' if engine.completed() else ' (max_steps reached)' )
+    engine.display_stats()
+    for name,target in reports:
+        values = read_target(engine,target)
+        printer.Printer.summary( 'LANES', '  {0:19} : min {1}, mean {2:.2f}, max {3}, {4} distinct', name
+                                , int(values.min()), float(values.mean()), int(values.max()), len(numpy.unique(values)) )
+    if args.output != None:
+        columns = [ (name,read_target(engine,target)) for name,target in reports ]
+        rows = [ dict( [ ('lane',lane), ('retired',int(engine.retired[lane])) ] + [ (name,int(values[lane])) for name,values in columns ] )
+                for lane in range(engine.lanes) ]
+        sweep.write_results(args.output,rows,[ 'lane', 'retired' ] + [ name for name,_ in columns ])
+
+    if args.cross_check:
+        # Scalar reference per lane, from the same initial state
+        start_values,start_pages = inputs
+        initial = KindredLanesEngine('kindred.lanes.initial',buffer,args.lanes)
+        initial.values[:] = start_values
+        initial.pages = start_pages
+        reference = simulator.KindredSimulator('kindred.reference',buffer)
+        result = simulator.KindredSimulator('kindred.result',buffer)
+        failed = 0
+        for lane in range(engine.lanes):
+            reference.reset()
+            initial.export_lane(lane,reference.registers,reference.lsu)
+            if args.max_steps is None:
+                reference.run_functional()
+            else:
+                reference.run_functional(int(engine.retired[lane]))
+            engine.export_lane(lane,result.registers,result.lsu)
+            mismatches = reference.compare_state(result)
+            if mismatches:
+                failed += 1
+                if failed <= 5:
+                    printer.Printer.error( 'LANES', 'Lane {0} differs from the functional model: {1}', lane, '; '.join(mismatches[:4]) )
+        if failed:
+            printer.Printer.error( 'LANES', 'Cross-check FAILED for {0} of {1} lanes', failed, engine.lanes )
+        else:
+            printer.Printer.summary( 'LANES', 'Cross-check passed for all {0} lanes', engine.lanes )
+
+if __name__ == "__main__":
+    main()
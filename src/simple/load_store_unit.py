@@ -12,17 +12,137 @@
 #                                                                             # 
 ###############################################################################
 
+import printer
+
+import mmap
+import os
+import struct
+
+# Sparse paged memory - 4KB pages allocated on first write, little-endian
+PAGE_BITS = 12
+PAGE_SIZE = 1 << PAGE_BITS
+PAGE_MASK = PAGE_SIZE - 1
+ADDR_MASK = 0xFFFFFFFF
+
+# (width in bytes,signed) => struct
+ACCESS = {
+    (1,True) : struct.Struct('<b')
+    , (1,False) : struct.Struct('<B')
+    , (2,True) : struct.Struct('<h')
+    , (2,False) : struct.Struct('<H')
+    , (4,True) : struct.Struct('<i')
+    , (4,False) : struct.Struct('<I')
+}
+WORD_UNPACK = ACCESS[4,True].unpack_from
+WORD_PACK = ACCESS[4,False].pack_into
+
 class KindredLoadStoreUnit:
-    """ Super-duper simple LSU """
+    """ Super-duper simple LSU
+
+    Byte addressed 32-bit memory made of bytearray pages. Reads of pages that were
+    never written return zero without allocating them.
+    """
 
     def __init__(self,instance_name):
         self.instance_name = instance_name
-        self.memory = {}
+        # page number => bytearray(PAGE_SIZE)
+        self.pages = {}
+
+    def page(self,number):
+        """ Page backing store, allocated on demand """
+        page = self.pages.get(number)
+        if page is None:
+            page = bytearray(PAGE_SIZE)
+            self.pages[number] = page
+        return page
+
+    def write(self,addr,value,width=4):
+        addr &= ADDR_MASK
+        offset = addr & PAGE_MASK
+        if offset + width <= PAGE_SIZE:
+            ACCESS[width,False].pack_into(self.page(addr >> PAGE_BITS),offset,value & ((1 << (width*8)) - 1))
+        else:
+            # Access straddles two pages
+            self.write_bytes(addr,(value & ((1 << (width*8)) - 1)).to_bytes(width,'little'))
+
+    def read(self,addr,width=4,signed=True):
+        addr &= ADDR_MASK
+        offset = addr & PAGE_MASK
+        if offset + width <= PAGE_SIZE:
+            page = self.pages.get(addr >> PAGE_BITS)
+            if page is None:
+                return 0
+            return ACCESS[width,signed].unpack_from(page,offset)[0]
+        return int.from_bytes(self.read_bytes(addr,width),'little',signed=signed)
+
+    def read_word(self,addr):
+        """ Signed 32-bit read - fast path of read() for code generators """
+        addr &= ADDR_MASK
+        page = self.pages.get(addr >> PAGE_BITS)
+        offset = addr & PAGE_MASK
+        if offset <= PAGE_SIZE - 4:
+            return WORD_UNPACK(page,offset)[0] if page is not None else 0
+        return self.read(addr)
+
+    def write_word(self,addr,value):
+        """ 32-bit write - fast path of write() for code generators """
+        addr &= ADDR_MASK
+        offset = addr & PAGE_MASK
+        if offset <= PAGE_SIZE - 4:
+            WORD_PACK(self.page(addr >> PAGE_BITS),offset,value & ADDR_MASK)
+        else:
+            self.write(addr,value)
+
+    def write_bytes(self,addr,data):
+        """ Bulk store, e.g. initializing a data segment """
+        data = memoryview(data).cast('B')
+        addr &= ADDR_MASK
+        pos = 0
+        while pos < len(data):
+            offset = addr & PAGE_MASK
+            size = min(PAGE_SIZE - offset,len(data) - pos)
+            self.page(addr >> PAGE_BITS)[offset:offset+size] = data[pos:pos+size]
+            addr = (addr + size) & ADDR_MASK
+            pos += size
+
+    def read_bytes(self,addr,size):
+        """ Bulk load, unmapped pages read as zero """
+        data = bytearray(size)
+        addr &= ADDR_MASK
+        pos = 0
+        while pos < size:
+            offset = addr & PAGE_MASK
+            length = min(PAGE_SIZE - offset,size - pos)
+            page = self.pages.get(addr >> PAGE_BITS)
+            if page is not None:
+                data[pos:pos+length] = page[offset:offset+length]
+            addr = (addr + length) & ADDR_MASK
+            pos += length
+        return bytes(data)
+
+    def load_file(self,filename,addr,use_mmap=False):
+        """ Copy a binary file into memory at addr, returns the number of bytes loaded """
+        if not os.path.exists(filename):
+            printer.Printer.error( 'LSU', 'Memory image [{0}] was not found', filename )
+            return 0
+        with open(filename,'rb') as f:
+            if use_mmap and os.path.getsize(filename) > 0:
+                with mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ) as mm:
+                    self.write_bytes(addr,mm)
+                    size = len(mm)
+            else:
+                data = f.read()
+                self.write_bytes(addr,data)
+                size = len(data)
+        printer.Printer.info( 'LSU', 'Loaded memory image [{0}] {1} bytes @{2}', filename, size, hex(addr) )
+        return size
+
+    def dump_file(self,filename,addr,size):
+        with open(filename,'wb') as f:
+            f.write(self.read_bytes(addr,size))
 
-    def write(self, addr, value):
-        self.memory[addr] = value
+    def mapped_pages(self):
+        return sorted(self.pages)
 
-    def read(self, addr):
-        if addr in self.memory:
-            return self.memory[addr]
-        return 0
+    def clear(self):
+        self.pages.clear()
@@ -13,17 +13,57 @@
 ###############################################################################
 
 import inst_buffer_unit
+import registers_unit
 
 import printer
 
 class KindredPipeline:
 
+    # Stall causes
+    STALL_RAW = 'raw'
+    STALL_LOAD_USE = 'load_use'
+    STALL_CONTROL = 'control'
+    STALL_LSU = 'lsu'
+    STALL_WAW = 'waw'
+    STALL_CAUSES = [ STALL_RAW, STALL_LOAD_USE, STALL_CONTROL, STALL_LSU, STALL_WAW ]
+
+    # Profiler - (method, section) of the per-stage edge work
+    PROFILE_STAGES = [
+        ('wb_negedge', 'WB.negedge')
+        , ('exec_negedge', 'EXEC.negedge')
+        , ('fetch_negedge', 'FETCH.negedge')
+        , ('wb_posedge', 'WB.posedge')
+        , ('exec_posedge', 'EXEC.posedge')
+        , ('fetch_posedge', 'FETCH.posedge')
+    ]
+
     def __init__(self,instance_name,inst_buffer,registers,lsu):
         self.instance_name = instance_name
         self.inst_buffer = inst_buffer
         self.registers = registers
         self.lsu = lsu
 
+        self.load_store_unit_access_delay : int = 1
+        # Optional data cache, its access latency replaces load_store_unit_access_delay
+        self.dcache = None
+
+        # EXEC->FETCH / WB->FETCH forwarding. Without it FETCH waits until WB has released
+        # every source register, with it results are read from the youngest in-flight producer.
+        self.forwarding = False
+
+        # Optional branch predictor - FETCH follows predictions, EXEC resolves and squashes
+        self.branch_predictor = None
+
+        # Optional retire trace (inst_trace.KindredInstructionTrace)
+        self.inst_trace = None
+
+        self.reset()
+        # Recycled decodes, one per latch (stage slot) plus the one retiring
+        self.decode_pool = inst_buffer_unit.KindredDecodePool(len(self.latches()) + 1)
+
+    def reset(self):
+        """ Empty pipe and cleared counters, configuration is kept. Caches and predictor
+        belong to the pipe configuration and are reset by their owner. """
         # PIPE (Latch decoded instructions)       
         self.stage1_fetch_input_latch : inst_buffer_unit.KindredRiscVInstructionDecode = None
         self.stage1_fetch_output_latch : inst_buffer_unit.KindredRiscVInstructionDecode = None
@@ -33,220 +73,347 @@ class KindredPipeline:
         self.stage3_wb_output_latch : inst_buffer_unit.KindredRiscVInstructionDecode = None
 
         self.exec_lsu_delay : int = 0
-        self.load_store_unit_access_delay : int = 1
+
+        # FETCH can be turned off to drain the pipe (e.g. to hand state back to the functional model)
+        self.fetch_enabled = True
+
+        # Register number => youngest in-flight decode writing it (registered when it leaves FETCH)
+        self.producers = [None] * registers_unit.NUM_REGISTERS
 
         self.num_retired_instructions = 0
+        self.stalls = { cause : 0 for cause in KindredPipeline.STALL_CAUSES }
 
     def negedge(self,cycle):
-        # WB NegEdge
+        self.wb_negedge()
+        self.exec_negedge()
+        self.fetch_negedge()
+
+    def posedge(self,cycle):
+        self.wb_posedge(cycle)
+        self.exec_posedge()
+        self.fetch_posedge()
+
+    def wb_negedge(self):
         if self.stage3_wb_input_latch == None:
             # STAGE3: Latch EXEC instruction
             # Stage is open for processing (latch input)
             # Access to instruction operands and registers
             if self.exec_lsu_delay == 0:
+                if self.stage3_wb_output_latch != None:
+                    # Retired last cycle, nothing refers to it any more
+                    self.decode_pool.release(self.stage3_wb_output_latch)
                 self.stage3_wb_output_latch = None
                 if self.stage2_exec_output_latch != None:
                     # Pull from STAGE2
-                    printer.Printer.debug( 'STAGE3', f'Latch decoded instruction from STAGE2' )
+                    if printer.Printer.debug_enabled:
+                        printer.Printer.debug( 'STAGE3', 'Latch decoded instruction from STAGE2' )
                     self.stage3_wb_input_latch = self.stage2_exec_output_latch
                     self.stage2_exec_output_latch = None
 
-        # EXEC NegEdge
+    def exec_negedge(self):
         if self.stage2_exec_input_latch == None:
             # STAGE2: Latch FETCH instruction
             # Stage is open for processing (latch input)
             # Access to instruction, operand values and memory via LSU            
             if self.stage1_fetch_output_latch != None:
                 # Pull from STAGE1
-                printer.Printer.debug( 'STAGE2', f'Latch decoded instruction from STAGE1 [{self.stage1_fetch_output_latch.instruction.inst}]' )
+                if printer.Printer.debug_enabled:
+                    printer.Printer.debug( 'STAGE2', 'Latch decoded instruction from STAGE1 [{0}]', self.stage1_fetch_output_latch.instruction.inst )
                 self.stage2_exec_input_latch = self.stage1_fetch_output_latch
                 self.stage1_fetch_output_latch = None
-        
-        # FETCH NegEdge
-        if self.stage1_fetch_input_latch == None:
+
+    def fetch_negedge(self):
+        if self.stage1_fetch_input_latch == None and self.fetch_enabled:
             # STAGE1: Fetch next instruction if possible
             # Stage is open for processing (latch input)
             # Access to instruction and registers and literals
-            pc = self.registers.get('pc')
-            printer.Printer.debug( 'STAGE1', f'Pre-fetch next instruction @PC={pc.value}...' )
-            next_inst = self.inst_buffer.fetch(pc.value)
-            reserved_regs = []
+            pc = self.registers.read_index(registers_unit.PC)
+            if printer.Printer.debug_enabled:
+                printer.Printer.debug( 'STAGE1', 'Pre-fetch next instruction @PC={0}...', pc )
+            next_inst = self.inst_buffer.fetch(pc)
             if next_inst != None:
-                # Check to see if we should stall
-                #   - Any src op registers are currently scheduled for WB
-                #           OR
-                #   - Reg write-back is scheduled for WB
-                if not self.registers.is_reserved('pc') and not ( next_inst.has_reg_write_back() and self.registers.is_reserved(next_inst.dst) ) and ( not self.registers.is_reserved(next_inst.stall_regs) ):
-                    # vcd_trace_store.change(stage1_inst_vcd,edge,next_inst.inst)
+                blocked = self.fetch_blocked(next_inst)
+                if not blocked:
                     # No stall condition
                     # 'pc' stall is for jumps or conditional branches that have triggered
-                    printer.Printer.debug( 'STAGE1', 'No Stall. Fetching next instruction...' )
-                    # Some instruction behavior necessary for model
-                    if next_inst.inst == 'jal':
-                        # JUMP
-                        printer.Printer.debug( 'STAGE1', 'JAL jump' )
-                        reserved_regs = [next_inst.dst,'pc']
-                    elif next_inst.inst == 'bge':
-                        # COnditional Branch
-                        rval = self.registers.read(next_inst.dst)
-                        if rval >= int(next_inst.op1):
-                            ## BRANCH TO LOOP
-                            printer.Printer.debug( 'STAGE1', 'BGE branch condition met' )
-                            reserved_regs = [next_inst.dst,'pc']
-                        else:
-                            # NO Branch
-                            self.registers.increment('pc',1)
-                    elif next_inst.inst == 'ble':
-                        # COnditional Branch
-                        rval = self.registers.read(next_inst.dst)
-                        if rval <= int(next_inst.op1):
-                            ## BRANCH TO LOOP
-                            printer.Printer.debug( 'STAGE1', 'BLE branch condition met' )
-                            reserved_regs = [next_inst.dst,'pc']
-                        else:
-                            # NO Branch
-                            self.registers.increment('pc',1)
-                    elif next_inst.inst == 'lw':
-                        reserved_regs = [next_inst.dst]
-                        self.registers.increment('pc',1)
-                    elif next_inst.reg_write_back:
-                        # Instruction with store to a register
-                        reserved_regs = [next_inst.dst]
-                        self.registers.increment('pc',1)
-                    else:
-                        # All other instructions
-                        self.registers.increment('pc',1)
-
-                    # Decoded Instruction
-                    self.stage1_fetch_input_latch = inst_buffer_unit.KindredRiscVInstructionDecode(next_inst)
-                    self.stage1_fetch_input_latch.reserve_regs(reserved_regs)
-                    self.registers.reserve(reserved_regs)
+                    if printer.Printer.debug_enabled:
+                        printer.Printer.debug( 'STAGE1', 'No Stall. Fetching next instruction...' )
+
+                    # Decoded Instruction - opcode decides next PC and write-back reservations
+                    decode = self.decode_pool.acquire(next_inst)
+                    next_inst.opcode.fetch(self,decode,pc)
+                    self.registers.reserve_mask(decode.reserved_mask)
+                    self.stage1_fetch_input_latch = decode
                 else:
                     # Write-back hazard, stall
-                    printer.Printer.verbose( 'STAGE1', 'STALL - Write-back hazard' )
+                    self.stalls[self.stall_cause(next_inst,blocked)] += 1
+                    if printer.Printer.verbose_enabled:
+                        printer.Printer.verbose( 'STAGE1', 'STALL - Write-back hazard' )
             else:
                 # No instruction @PC - wait for pipe to complete
                 pass
 
-    def posedge(self,cycle):
-        # WB PosEdge
+    def wb_posedge(self,cycle):
         if self.stage3_wb_input_latch != None:
             # Calculate results and store in register if necessary
-            if self.stage3_wb_input_latch.instruction.inst == 'jal':
-                if self.stage3_wb_input_latch.instruction.dst in self.stage3_wb_input_latch.reserved_regs:
-                    laddr = self.stage3_wb_input_latch.op1_value
-                    printer.Printer.debug( 'STAGE3', 'Performing JAL instruction - Jump to address={0}'.format(laddr) )
-                    self.registers.write_back(self.stage3_wb_input_latch.instruction.dst,laddr)
-                    self.registers.write_back('pc',laddr)
-                    self.registers.release(self.stage3_wb_input_latch.reserved_regs)
-            elif self.stage3_wb_input_latch.instruction.inst == 'bge':
-                if self.stage3_wb_input_latch.instruction.dst in self.stage3_wb_input_latch.reserved_regs:
-                    laddr = self.inst_buffer.label_addr(self.stage3_wb_input_latch.instruction.op2)
-                    printer.Printer.debug( 'STAGE3', 'Performing BGE instruction - Jump to address={0}, label={1}'.format(laddr,self.stage3_wb_input_latch.instruction.op2) )
-                    self.registers.write_back(self.stage3_wb_input_latch.instruction.op1,laddr)
-                    self.registers.write_back('pc',laddr)
-                    self.registers.release(self.stage3_wb_input_latch.reserved_regs)
-            elif self.stage3_wb_input_latch.instruction.inst == 'ble':
-                if self.stage3_wb_input_latch.instruction.dst in self.stage3_wb_input_latch.reserved_regs:
-                    laddr = self.inst_buffer.label_addr(self.stage3_wb_input_latch.instruction.op2)
-                    printer.Printer.debug( 'STAGE3', 'Performing BLE instruction - Jump to address={0}, label={1}'.format(laddr,self.stage3_wb_input_latch.instruction.op2) )
-                    self.registers.write_back(self.stage3_wb_input_latch.instruction.op1,laddr)
-                    self.registers.write_back('pc',laddr)
-                    self.registers.release(self.stage3_wb_input_latch.reserved_regs)
-            elif self.stage3_wb_input_latch.instruction.reg_write_back:
-                printer.Printer.debug( 'STAGE3', 'Performing register write-back [{0}=>{1}]'.format(self.stage3_wb_input_latch.resultant,self.stage3_wb_input_latch.instruction.dst) )
-                self.registers.write_back(self.stage3_wb_input_latch.instruction.dst,self.stage3_wb_input_latch.resultant)
-                self.registers.release(self.stage3_wb_input_latch.reserved_regs)
-            printer.Printer.info( 'STAGE3', 'Retiring instruction [{0}]'.format(self.stage3_wb_input_latch.instruction.assembly) )
-            printer.Printer.verbose('STAGE3',f'CYCLE={cycle:5} - {self.stage3_wb_input_latch.instruction.assembly}' )
-            # t1 = self.registers.read('t1')
-            # printer.Printer.verbose( 'REGISTERS','ti = {0}'.format(hex(t1)) )
-            # inst_trace_store.retire(cycle,self.stage3_wb_input_latch.instruction.assembly)
+            self.stage3_wb_input_latch.instruction.opcode.write_back(self,self.stage3_wb_input_latch)
+            if printer.Printer.info_enabled:
+                printer.Printer.info( 'STAGE3', 'Retiring instruction [{0}]', self.stage3_wb_input_latch.instruction.assembly )
+            if printer.Printer.verbose_enabled:
+                printer.Printer.verbose( 'STAGE3', 'CYCLE={0:5} - {1}', cycle, self.stage3_wb_input_latch.instruction.assembly )
+            if self.inst_trace:
+                self.inst_trace.retire(cycle,self.stage3_wb_input_latch)
             self.stage3_wb_output_latch = self.stage3_wb_input_latch
             self.stage3_wb_input_latch.reset()
             self.stage3_wb_input_latch = None
             self.num_retired_instructions = self.num_retired_instructions + 1
 
-        # EXEC PosEdge
+    def exec_posedge(self):
         if self.stage2_exec_input_latch != None:
             # Processing an LSU access as well as performing ALU ops
             complete_stage = False
+            lsu_pending = False
             if self.exec_lsu_delay > 0:
                 self.exec_lsu_delay = self.exec_lsu_delay - 1
                 complete_stage = self.exec_lsu_delay == 0
+                lsu_pending = not complete_stage
 
-            if self.stage2_exec_input_latch.instruction.mem_store:
-                if self.stage2_exec_input_latch.instruction.inst == 'sw':
-                    if complete_stage:
-                        # Store value
-                        self.lsu.write(self.stage2_exec_input_latch.op1_value,self.stage2_exec_input_latch.dst_value)
-                        printer.Printer.debug( 'STAGE2', 'STORE request to LSU completed [addr={0}]'.format(hex(self.stage2_exec_input_latch.op1_value)) )
-                        self.stage2_exec_input_latch.lsu_value = self.stage2_exec_input_latch.dst_value
-                    else:
-                        # Stall
-                        printer.Printer.debug( 'STAGE2', 'Sending STORE request to LSU [addr={0},value={1}]'.format(hex(self.stage2_exec_input_latch.op1_value),hex(self.stage2_exec_input_latch.dst_value)) )
-                        self.exec_lsu_delay = self.load_store_unit_access_delay
-            elif self.stage2_exec_input_latch.instruction.mem_load:
-                if self.stage2_exec_input_latch.instruction.inst == 'lw':
-                    if complete_stage:
-                        # Load value
-                        v = self.lsu.read(self.stage2_exec_input_latch.op1_value)
-                        printer.Printer.debug( 'STAGE2', 'LOAD request to LSU completed [addr={0},value={1}]'.format(hex(self.stage2_exec_input_latch.op1_value),hex(v)) )
-                        self.stage2_exec_input_latch.lsu_value = v
-                    else:
-                        # Stall
-                        printer.Printer.debug( 'STAGE2', 'Sending LOAD request to LSU [addr={0}]'.format(hex(self.stage2_exec_input_latch.op1_value)) )
-                        self.exec_lsu_delay = self.load_store_unit_access_delay
-            else:
-                # Any other instruction
-                complete_stage = True
-            if complete_stage and self.stage2_exec_input_latch.instruction.reg_write_back:
-                self.stage2_exec_input_latch.resultant = 0
-                if self.stage2_exec_input_latch.instruction.inst == 'li':
-                    # dst = op1
-                    self.stage2_exec_input_latch.resultant = self.stage2_exec_input_latch.op1_value
-                elif self.stage2_exec_input_latch.instruction.inst == 'addi':
-                    # dst = op1 + imm
-                    self.stage2_exec_input_latch.resultant = self.stage2_exec_input_latch.op1_value + self.stage2_exec_input_latch.op2_value
-                elif self.stage2_exec_input_latch.instruction.inst == 'add':
-                    # dst = op1 + op2
-                    self.stage2_exec_input_latch.resultant = self.stage2_exec_input_latch.op1_value + self.stage2_exec_input_latch.op2_value
-                elif self.stage2_exec_input_latch.instruction.inst == 'slli':
-                    # shift-left im (NOT NEEDED)
-                    self.stage2_exec_input_latch.resultant = self.stage2_exec_input_latch.op1_value << self.stage2_exec_input_latch.op2_value
-                    pass
-                elif self.stage2_exec_input_latch.instruction.inst == 'slri':
-                    # shift-right im (NOT NEEDED)
-                    self.stage2_exec_input_latch.resultant = self.stage2_exec_input_latch.op1_value >> self.stage2_exec_input_latch.op2_value
-                elif self.stage2_exec_input_latch.instruction.inst == 'sub':
-                    # dst = op1 - op2
-                    self.stage2_exec_input_latch.resultant = self.stage2_exec_input_latch.op1_value - self.stage2_exec_input_latch.op2_value
-                printer.Printer.debug( 'STAGE2', 'Resultant calculated [{0} :: resultant={1}]'.format(self.stage2_exec_input_latch.instruction.assembly,self.stage2_exec_input_latch.resultant) )
+            # LSU access or ALU op - nothing to do while an LSU access is outstanding
+            if not lsu_pending:
+                complete_stage = self.stage2_exec_input_latch.instruction.opcode.execute(self,self.stage2_exec_input_latch,complete_stage)
 
             # Latch decoded instruction in output latch
             #   Latch after memory access
             if complete_stage:
-                printer.Printer.debug( 'STAGE2', 'Complete EXEC stage' )
+                if printer.Printer.debug_enabled:
+                    printer.Printer.debug( 'STAGE2', 'Complete EXEC stage' )
                 self.stage2_exec_output_latch = self.stage2_exec_input_latch
                 self.stage2_exec_input_latch = None
             else:
-                printer.Printer.verbose( 'STAGE2', 'STALL pipeline for LSU response [addr={0}]'.format(hex(self.stage2_exec_input_latch.op1_value)) )
+                self.stalls[KindredPipeline.STALL_LSU] += 1
+                if printer.Printer.verbose_enabled:
+                    printer.Printer.verbose( 'STAGE2', 'STALL pipeline for LSU response [addr={0}]', hex(self.stage2_exec_input_latch.op1_value) )
                 self.stage2_exec_output_latch = self.stage2_exec_input_latch
                 # self.stage2_exec_input_latch = None
 
-        # FETCH PosEdge
+    def fetch_posedge(self):
         if self.stage1_fetch_input_latch != None and self.stage1_fetch_output_latch == None:
-            # Latch operaand values
-            self.stage1_fetch_input_latch.fetch_op_values(self.registers,self.inst_buffer)
+            decode = self.stage1_fetch_input_latch
+            inst = decode.instruction
+            if self.forwarding:
+                if not self.sources_ready(inst):
+                    # Producer result not available yet (load in flight), hold in FETCH
+                    self.stalls[self.stall_cause(inst,inst.stall_mask)] += 1
+                    if printer.Printer.verbose_enabled:
+                        printer.Printer.verbose( 'STAGE1', 'STALL - Waiting for forwarded operand' )
+                    return
+                # Latch operand values, forwarded from in-flight producers
+                decode.dst_value = self.read_operand(inst.dst_operand) if inst.reads_dst else 0
+                decode.op1_value = self.read_operand(inst.op1_operand)
+                decode.op2_value = self.read_operand(inst.op2_operand)
+                if inst.reg_write_back and inst.dst_operand.index:
+                    # Re-reserve, an older producer of the same register may have released it
+                    self.registers.reserve_mask(inst.dst_mask)
+            else:
+                # Latch operaand values
+                decode.fetch_op_values(self.registers,self.inst_buffer)
+            if inst.reg_write_back and inst.dst_operand.index:
+                self.producers[inst.dst_operand.index] = decode
             # Latch decoded instruction in output latch
-            self.stage1_fetch_output_latch = self.stage1_fetch_input_latch
+            self.stage1_fetch_output_latch = decode
             self.stage1_fetch_input_latch = None
 
+    def fetch_blocked(self,next_inst):
+        """ Mask of the reservations stopping next_inst from being fetched, 0 if it can go """
+        # Check to see if we should stall
+        #   - Any src op registers are currently scheduled for WB
+        #           OR
+        #   - Reg write-back is scheduled for WB
+        if self.forwarding:
+            blocked = self.registers.reserved_mask & registers_unit.PC_MASK
+            if not blocked and next_inst.opcode.control and self.branch_predictor is None and not self.sources_ready(next_inst):
+                # Branch/jump operands are read now - producer has no result yet
+                blocked = next_inst.stall_mask
+            return blocked
+        return self.registers.reserved_mask & next_inst.fetch_stall_mask
+
+    def skip_idle(self,max_cycles):
+        """ Jump over up to max_cycles upcoming cycles in which EXEC only counts down an LSU
+        access and FETCH can not make progress. Stall counters advance exactly as if each cycle
+        had been simulated, returns the number of cycles skipped. """
+        # The cycle in which the access completes is always simulated
+        cycles = min(self.exec_lsu_delay - 1,max_cycles)
+        if cycles <= 0 or self.stage2_exec_input_latch == None or self.stage3_wb_input_latch != None:
+            return 0
+
+        # FETCH must be frozen, possibly repeating the same stall every cycle
+        fetch_cause = None
+        decode = self.stage1_fetch_input_latch
+        if decode != None:
+            if self.stage1_fetch_output_latch == None:
+                inst = decode.instruction
+                if not self.forwarding or self.sources_ready(inst):
+                    return 0
+                fetch_cause = self.stall_cause(inst,inst.stall_mask)
+        elif self.fetch_enabled:
+            next_inst = self.inst_buffer.fetch(self.registers.read_index(registers_unit.PC))
+            if next_inst != None:
+                blocked = self.fetch_blocked(next_inst)
+                if not blocked:
+                    return 0
+                fetch_cause = self.stall_cause(next_inst,blocked)
+
+        self.exec_lsu_delay -= cycles
+        self.stalls[KindredPipeline.STALL_LSU] += cycles
+        if fetch_cause != None:
+            self.stalls[fetch_cause] += cycles
+        return cycles
+
+    def control_transfer(self,decode,pc,taken,target):
+        """ FETCH policy for branches/jumps - stall until WB writes the target """
+        if taken:
+            if printer.Printer.debug_enabled:
+                printer.Printer.debug( 'STAGE1', '{0} taken, target={1}', decode.instruction.inst.upper(), target )
+            decode.target = target
+            decode.reserved_mask = decode.instruction.dst_mask | registers_unit.PC_MASK
+        else:
+            # NO Branch
+            self.registers.write_index(registers_unit.PC,pc+1)
+
+    def predict(self,decode,pc):
+        """ FETCH continues at the predicted next PC, kept in decode.target until EXEC resolves """
+        inst = decode.instruction
+        decode.target = self.branch_predictor.predict(pc,inst)
+        if inst.reg_write_back:
+            decode.reserved_mask = inst.dst_mask
+        if printer.Printer.debug_enabled:
+            printer.Printer.debug( 'STAGE1', '{0} predicted next PC={1}', inst.inst.upper(), decode.target )
+        self.registers.write_index(registers_unit.PC,decode.target)
+
+    def resolve(self,decode,taken,target):
+        """ EXEC outcome of a predicted control instruction, squash the wrong path on a mispredict """
+        inst = decode.instruction
+        pc = inst.id - 1
+        next_pc = target if taken else pc + 1
+        bp = self.branch_predictor
+        bp.update(pc,inst,taken,target)
+        if next_pc == decode.target:
+            return
+        if printer.Printer.debug_enabled:
+            printer.Printer.debug( 'STAGE2', '{0} mispredicted, flushing FETCH and redirecting to PC={1}', inst.inst.upper(), next_pc )
+        bp.mispredicts += 1
+        bp.flushes += 1
+        # FETCH slot spent on the wrong path between the prediction and the redirect
+        bp.flush_cycles += 1
+        for latch in ('stage1_fetch_input_latch','stage1_fetch_output_latch'):
+            squashed = getattr(self,latch)
+            if squashed != None:
+                self.squash(squashed)
+                setattr(self,latch,None)
+                self.decode_pool.release(squashed)
+                bp.squashed_instructions += 1
+        decode.target = next_pc
+        self.registers.write_index(registers_unit.PC,next_pc)
+
+    def squash(self,decode):
+        """ Undo the FETCH side effects of a wrong-path instruction """
+        mask = decode.reserved_mask
+        inst = decode.instruction
+        if inst.reg_write_back and inst.dst_operand.index:
+            index = inst.dst_operand.index
+            if self.producers[index] is decode:
+                self.producers[index] = None
+            elif self.producers[index] is not None:
+                mask &= ~inst.dst_mask
+        self.registers.release_mask(mask)
+
+    def sources_ready(self,inst):
+        """ Every source register is either committed or has a result in flight """
+        producers = self.producers
+        for index in inst.src_indices:
+            producer = producers[index]
+            if producer is not None and producer.resultant is None:
+                return False
+        return True
+
+    def read_operand(self,operand):
+        """ Operand value, forwarded from the youngest in-flight producer of the register """
+        index = operand.index
+        if index is None:
+            return operand.value
+        producer = self.producers[index]
+        value = producer.resultant if producer is not None else self.registers.values[index]
+        if operand.kind == inst_buffer_unit.KindredRiscVOperand.REG_OFFSET:
+            value = value + operand.offset
+        return value
+
+    def release(self,decode):
+        """ WB release of the registers reserved by decode """
+        mask = decode.reserved_mask
+        inst = decode.instruction
+        if inst.reg_write_back and inst.dst_operand.index:
+            index = inst.dst_operand.index
+            producer = self.producers[index]
+            if producer is decode:
+                self.producers[index] = None
+            elif producer is not None:
+                # A younger instruction still has to write the register
+                mask &= ~inst.dst_mask
+        self.registers.release_mask(mask)
+
+    def stall_cause(self,inst,blocked):
+        if blocked & registers_unit.PC_MASK:
+            return KindredPipeline.STALL_CONTROL
+        if blocked & inst.stall_mask:
+            for index in inst.src_indices:
+                producer = self.producers[index]
+                if producer is None or not producer.instruction.mem_load:
+                    continue
+                if producer.resultant is None if self.forwarding else blocked & (1 << index):
+                    return KindredPipeline.STALL_LOAD_USE
+            return KindredPipeline.STALL_RAW
+        return KindredPipeline.STALL_WAW
+
+    def latches(self):
+        """ (latch, decode or None) pairs, sampled by tracing """
+        return [
+            ('FETCH.in', self.stage1_fetch_input_latch)
+            , ('FETCH.out', self.stage1_fetch_output_latch)
+            , ('EXEC.in', self.stage2_exec_input_latch)
+            , ('EXEC.out', self.stage2_exec_output_latch)
+            , ('WB.in', self.stage3_wb_input_latch)
+        ]
+
+    def occupancy(self):
+        """ (latch, instructions held) pairs, sampled by the profiler """
+        return [ (latch, decode != None) for latch,decode in self.latches() ]
+
+    def lsu_busy(self):
+        return self.exec_lsu_delay > 0
+
+    def num_stalls(self):
+        return sum(self.stalls.values())
+
+    def lsu_request(self,decode):
+        """ Start an LSU access, EXEC stalls until it completes """
+        if self.dcache is not None:
+            self.exec_lsu_delay = max(1,self.dcache.access(decode.op1_value,decode.instruction.mem_store))
+        else:
+            self.exec_lsu_delay = self.load_store_unit_access_delay
+
     def empty_pipe(self):
-        pc = self.registers.read('pc')
-        return pc >= self.inst_buffer.size() and (self.stage1_fetch_output_latch == None and self.stage2_exec_output_latch == None)
+        pc = self.registers.read_index(registers_unit.PC)
+        return (pc >= self.inst_buffer.size() or not self.fetch_enabled) and (self.stage1_fetch_input_latch == None and self.stage1_fetch_output_latch == None and self.stage2_exec_output_latch == None)
+
+    def idle(self):
+        """ No instruction in flight """
+        return self.stage1_fetch_input_latch == None and self.stage1_fetch_output_latch == None \
+            and self.stage2_exec_input_latch == None and self.stage2_exec_output_latch == None \
+            and self.stage3_wb_input_latch == None
 
     def display(self):
+        if not printer.Printer.info_enabled:
+            return
         printer.Printer.info( 'SIMULATOR', '----------------------------------------------------------------------------------' )
         printer.Printer.info( 'SIMULATOR', '                                PIPELINE' )
         printer.Printer.info( 'SIMULATOR', '----------------------------------------------------------------------------------' )
@@ -15,6 +15,7 @@
 from enum import Enum
 
 class PrinterVerbosity(Enum):
+    QUIET = 0
     NONE = 1
     INFO = 2
     WARN = 3
@@ -25,33 +26,54 @@ class Printer:
 
     verbosity = PrinterVerbosity.NONE
 
+    # Level gates - hot paths test these before building a message
+    info_enabled = False
+    warn_enabled = False
+    debug_enabled = False
+    verbose_enabled = True
+
     @staticmethod
     def set_verbosity(v):
         Printer.verbosity = v
+        Printer.info_enabled = v.value >= PrinterVerbosity.INFO.value
+        Printer.warn_enabled = v.value >= PrinterVerbosity.WARN.value
+        Printer.debug_enabled = v.value >= PrinterVerbosity.DEBUG.value
+        Printer.verbose_enabled = v.value >= PrinterVerbosity.NONE.value
 
     @staticmethod
-    def info(scope,msg):
-        if Printer.verbosity.value >= int(PrinterVerbosity.INFO.value):
-            Printer._print('INFO',scope,msg)
+    def info(scope,msg,*args):
+        if Printer.info_enabled:
+            Printer._print('INFO',scope,msg,args)
 
     @staticmethod
-    def warn(scope,msg):
-        if Printer.verbosity.value >= int(PrinterVerbosity.WARN.value):
-            Printer._print('WARN',scope,msg)
+    def warn(scope,msg,*args):
+        if Printer.warn_enabled:
+            Printer._print('WARN',scope,msg,args)
 
     @staticmethod
-    def debug(scope,msg):
-        if Printer.verbosity.value >= int(PrinterVerbosity.DEBUG.value):
-            Printer._print('DEBUG',scope,msg)
+    def debug(scope,msg,*args):
+        if Printer.debug_enabled:
+            Printer._print('DEBUG',scope,msg,args)
 
     @staticmethod
-    def error(scope,msg):
-        Printer._print('ERROR',scope,msg)
+    def error(scope,msg,*args):
+        Printer._print('ERROR',scope,msg,args)
 
     @staticmethod
-    def _print(type,scope,msg):
+    def _print(type,scope,msg,args=()):
+        # Messages are only formatted once we know they will be printed
+        if args:
+            msg = msg.format(*args)
+        elif callable(msg):
+            msg = msg()
         print( f'[{type:6}] [{scope:10}] - {msg}' )
 
     @staticmethod
-    def verbose(scope,msg):
-        Printer._print('VERBOSE',scope,msg)
+    def verbose(scope,msg,*args):
+        if Printer.verbose_enabled:
+            Printer._print('VERBOSE',scope,msg,args)
+
+    @staticmethod
+    def summary(scope,msg,*args):
+        """ End of run results, printed even in QUIET mode """
+        Printer._print('VERBOSE',scope,msg,args)
@@ -0,0 +1,132 @@
+############################################################################### 
+# File:          profiler.py                                                  # 
+# Project:       Kindred                                                      # 
+# Author:        Paul Klein                                                   # 
+# EMail:         pauljkaz@gmail.com                                           # 
+# -----                                                                       # 
+# Last Modified: Mon Jul 31 2023                                              # 
+# Modified By:   Paul Klein                                                   # 
+# -----                                                                       # 
+#                                                                             # 
+#  Copyright (c) 2019 - 2023 N/A, All Rights Reserved.                        # 
+#                                                                             # 
+############################################################################### 
+
+import printer
+
+import time
+
+class KindredProfiler:
+    """ Host time and event counters per pipeline stage and unit
+
+    Nothing is patched until attach(), so a run without the profiler pays nothing.
+    attach() shadows unit methods with timed wrappers on the instances, including the
+    per-stage edge methods listed in the pipeline's PROFILE_STAGES. Timers are
+    inclusive - a stage's time includes the LSU and register file calls it makes.
+    """
+
+    def __init__(self,instance_name):
+        self.instance_name = instance_name
+        # Section => [calls, seconds]
+        self.timers = {}
+        # Event counters sampled after every posedge
+        self.cycles = 0
+        self.lsu_busy_cycles = 0
+        self.occupancy = {}
+        self.sim = None
+        self.hooks = []
+
+    ###########################################################################
+    # Hooks
+    ###########################################################################
+    def attach(self,sim):
+        """ Instrument sim's units. Every cycle is simulated while profiling so the
+        per-cycle counters see all of them. """
+        self.sim = sim
+        pipeline = sim.pipeline
+        sim.skip_idle = False
+
+        for name,section in pipeline.PROFILE_STAGES:
+            self.wrap(pipeline,name,section)
+        posedge = pipeline.posedge
+        def sampled(cycle):
+            posedge(cycle)
+            self.sample(pipeline)
+        pipeline.posedge = sampled
+        self.hooks.append((pipeline,'posedge'))
+        self.wrap(pipeline,'lsu_request','LSU.request')
+        self.wrap(pipeline,'display','display.pipeline')
+        for name in ('read','write','read_word','write_word'):
+            self.wrap(sim.lsu,name,'LSU.' + name)
+        for name in ('reserve_mask','release_mask','write_index'):
+            self.wrap(sim.registers,name,'registers.' + name)
+        self.wrap(sim.registers,'display','display.registers')
+        if pipeline.dcache is not None:
+            self.wrap(pipeline.dcache,'access','cache.access')
+        if pipeline.branch_predictor is not None:
+            self.wrap(pipeline.branch_predictor,'predict','bpred.predict')
+            self.wrap(pipeline.branch_predictor,'update','bpred.update')
+        if pipeline.inst_trace is not None:
+            self.wrap(pipeline.inst_trace,'retire','trace.inst')
+        if sim.vcd_trace_store is not None:
+            self.wrap(sim.vcd_trace_store,'change','trace.vcd')
+        # The functional engine binds LSU methods when it builds executors
+        sim.functional.invalidate()
+
+    def detach(self):
+        for obj,name in reversed(self.hooks):
+            delattr(obj,name)
+        self.hooks = []
+        if self.sim is not None:
+            self.sim.functional.invalidate()
+
+    def wrap(self,obj,name,section):
+        """ Time every call of obj.name under section """
+        function = getattr(obj,name)
+        timer = self.timers.setdefault(section,[0,0.0])
+        clock = time.perf_counter
+        def timed(*args):
+            start = clock()
+            result = function(*args)
+            timer[0] += 1
+            timer[1] += clock() - start
+            return result
+        setattr(obj,name,timed)
+        self.hooks.append((obj,name))
+
+    def sample(self,pipeline):
+        self.cycles += 1
+        if pipeline.lsu_busy():
+            self.lsu_busy_cycles += 1
+        occupancy = self.occupancy
+        for latch,held in pipeline.occupancy():
+            occupancy[latch] = occupancy.get(latch,0) + held
+
+    ###########################################################################
+    # Results
+    ###########################################################################
+    def results(self):
+        """ Timers and counters as plain data """
+        pipeline = self.sim.pipeline if self.sim is not None else None
+        return {
+            'host_time' : self.sim.host_time if self.sim is not None else 0.0
+            , 'timers' : { section : { 'calls' : calls, 'seconds' : seconds } for section,(calls,seconds) in self.timers.items() }
+            , 'cycles' : self.cycles
+            , 'lsu_busy_cycles' : self.lsu_busy_cycles
+            , 'occupancy' : { latch : held / self.cycles if self.cycles else 0.0 for latch,held in self.occupancy.items() }
+            , 'stalls' : dict(pipeline.stalls) if pipeline is not None else {}
+        }
+
+    def display(self):
+        results = self.results()
+        total = results['host_time']
+        printer.Printer.summary( 'PROFILE', '{0} - host time by section (inclusive)', self.instance_name )
+        printer.Printer.summary( 'PROFILE', '  {0:24} {1:>10} {2:>10} {3:>7} {4:>9}', 'Section', 'Calls', 'Time (s)', '% Run', 'us/call' )
+        for section,(calls,seconds) in sorted(self.timers.items(), key=lambda item: -item[1][1]):
+            if calls == 0:
+                continue
+            printer.Printer.summary( 'PROFILE', '  {0:24} {1:>10} {2:>10.6f} {3:>6.1f}% {4:>9.3f}', section, calls, seconds
+                                    , 100.0 * seconds / total if total > 0 else 0.0, 1e6 * seconds / calls )
+        printer.Printer.summary( 'PROFILE', '  Cycles              : {} ({} with the LSU busy)', results['cycles'], results['lsu_busy_cycles'] )
+        printer.Printer.summary( 'PROFILE', '  Stalls              : {}', ', '.join( '{0} {1}'.format(cause,value) for cause,value in results['stalls'].items() ) )
+        printer.Printer.summary( 'PROFILE', '  Latch Occupancy     : {}', ', '.join( '{0} {1:.2f}'.format(latch,value) for latch,value in results['occupancy'].items() ) )
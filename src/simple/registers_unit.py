@@ -16,10 +16,50 @@ import printer
 
 import abc
 
+# Architectural register file layout: x0-x31 followed by the pc
+NUM_GPR_REGISTERS = 32
+PC = 32
+NUM_REGISTERS = 33
+PC_MASK = 1 << PC
+
+ABI_NAMES = [
+    'zero', 'ra', 'sp', 'gp', 'tp', 't0', 't1', 't2'
+    , 's0', 's1', 'a0', 'a1', 'a2', 'a3', 'a4', 'a5'
+    , 'a6', 'a7', 's2', 's3', 's4', 's5', 's6', 's7'
+    , 's8', 's9', 's10', 's11', 't3', 't4', 't5', 't6'
+]
+
+# Register name (xN, ABI name or pc) to register file index
+REGISTER_INDEX = { 'pc' : PC, 'fp' : 8 }
+for _i in range(NUM_GPR_REGISTERS):
+    REGISTER_INDEX['x{0}'.format(_i)] = _i
+    REGISTER_INDEX[ABI_NAMES[_i]] = _i
+
+def register_index(name):
+    """ Register file index for a register name, None if not a register """
+    if not isinstance(name,str):
+        return None
+    return REGISTER_INDEX.get(name.lower())
+
+def register_name(index):
+    if index == PC:
+        return 'pc'
+    return 'x{0}'.format(index)
+
 class KindredRegister:
-    
-    def __init__(self):
-        self.value = 0
+    """ Name based view of a single entry in the register file """
+
+    def __init__(self,registers,index):
+        self.registers = registers
+        self.index = index
+
+    @property
+    def value(self):
+        return self.registers.values[self.index]
+
+    @value.setter
+    def value(self,v):
+        self.registers.write_index(self.index,v)
 
 class KindredRegistersInterface(metaclass=abc.ABCMeta):
 
@@ -42,100 +82,111 @@ class KindredRegistersUnit(KindredRegistersInterface):
     
     def __init__(self,instance_name):
         self.instance_name = instance_name
-        self.registers = {
-            'pc' : KindredRegister()
-            , 'x0' : KindredRegister()
-            , 'x1' : KindredRegister()
-            , 'x2' : KindredRegister()
-            , 'x3' : KindredRegister()
-            , 'x4' : KindredRegister()
-            , 'x5' : KindredRegister()
-            , 't0' : KindredRegister()
-            , 't1' : KindredRegister()
-            , 't2' : KindredRegister()
-            , 't3' : KindredRegister()
-            , 't4' : KindredRegister()
-            , 't5' : KindredRegister()
-            , 's0' : KindredRegister()
-            , 's1' : KindredRegister()
-            , 's2' : KindredRegister()
-            , 's3' : KindredRegister()
-            , 's4' : KindredRegister()
-            , 's5' : KindredRegister()
-        }
-        self.reserved_registers = {}
+        # Register values indexed by architectural register number (pc last)
+        self.values = [0] * NUM_REGISTERS
+        # Scoreboard, one bit per register index pending stage3 write-back
+        self.reserved_mask = 0
 
-    def is_reserved(self,regs):
+    def reset(self):
+        # In place - the functional engine holds a reference to values
+        self.values[:] = [0] * NUM_REGISTERS
+        self.reserved_mask = 0
+
+    ###########################################################################
+    # Index / mask based access (hot path)
+    ###########################################################################
+    def read_index(self,index):
+        return self.values[index]
+
+    def write_index(self,index,value):
+        # x0 is hard-wired to zero
+        if index != 0:
+            self.values[index] = value
+
+    def is_reserved_mask(self,mask):
+        return (self.reserved_mask & mask) != 0
+
+    def reserve_mask(self,mask):
+        if mask:
+            if printer.Printer.debug_enabled:
+                if self.reserved_mask & mask:
+                    printer.Printer.debug( 'REGISTERS', 'Register(s) [{0}] already reserved for stage3 writeback', self.mask_names(self.reserved_mask & mask) )
+                printer.Printer.debug( 'REGISTERS', 'Reserving register(s) [{0}] for stage3 write-back', self.mask_names(mask & ~self.reserved_mask) )
+            self.reserved_mask |= mask
+
+    def release_mask(self,mask):
+        if self.reserved_mask & mask:
+            if printer.Printer.info_enabled:
+                printer.Printer.info( 'REGISTERS', 'Releasing register(s) [{0}]', self.mask_names(self.reserved_mask & mask) )
+            self.reserved_mask &= ~mask
+
+    def mask(self,regs):
+        """ Scoreboard mask for a register name or list of names """
         if isinstance(regs,str):
-            lname = regs.lower()
-            return lname in self.reserved_registers
-        elif isinstance(regs,list):
-            for reg in regs:
-                if self.is_reserved(reg):
-                    return True
-        return False
+            index = register_index(regs)
+            return 1 << index if index is not None else 0
+        m = 0
+        for reg in regs:
+            m |= self.mask(reg)
+        return m
+
+    def mask_names(self,mask):
+        return ','.join( register_name(i) for i in range(NUM_REGISTERS) if mask & (1 << i) )
+
+    ###########################################################################
+    # Name based access (compatibility layer)
+    ###########################################################################
+    def is_reserved(self,regs):
+        return self.is_reserved_mask(self.mask(regs))
 
     def reserve(self,regs):
-        if isinstance(regs,str):
-            lname = regs.lower()
-            if not lname in self.reserved_registers:
-                r = self.get(lname)
-                if r:
-                    printer.Printer.debug( 'REGISTERS', 'Reserving register [{0}] for stage3 write-back'.format(lname) )
-                    self.reserved_registers[lname] = r
-            else:
-                printer.Printer.debug( 'REGISTERS', 'Register [{0}] already reserved for stage3 writeback'.format(lname) )
-        elif isinstance(regs,list):
-            for reg in regs:
-                self.reserve(reg)
+        self.reserve_mask(self.mask(regs))
     
     def release(self,regs):
-        if isinstance(regs,str):
-            lname = regs.lower()
-            if lname in self.reserved_registers:
-                printer.Printer.info( 'REGISTERS', 'Releasing register [{0}]'.format(lname) )
-                self.reserved_registers.pop(lname)
-        elif isinstance(regs,list):
-            for reg in regs:
-                self.release(reg)
+        self.release_mask(self.mask(regs))
+
+    def index(self,name):
+        index = register_index(name)
+        if index is None:
+            printer.Printer.error( 'REGISTERS', 'Invalid register [{0}]'.format(name) )
+        return index
                 
     def get(self,name) -> KindredRegister:
-        lname = name.lower()
-        if lname in self.registers:
-            r = self.registers[lname]
-            return r
-        printer.Printer.error( 'REGISTERS', 'Invalid register [{0}]'.format(name) )
+        index = self.index(name)
+        if index is not None:
+            return KindredRegister(self,index)
         return None
     
-    def read(self,name) -> KindredRegister:
-        lname = name.lower()
-        if lname in self.registers:
-            r = self.registers[lname]
-            return int(r.value)
-        printer.Printer.error( 'REGISTERS', 'Invalid register [{0}]'.format(name) )
+    def read(self,name) -> int:
+        index = self.index(name)
+        if index is not None:
+            return self.values[index]
         return None
     
     def write_back(self,name,value):
-        lname = name.lower()
-        if lname in self.registers:
+        index = register_index(name)
+        if index is not None:
             v = value
             if isinstance(value,str):
                 v = int(value,0)
-            self.registers[lname].value = v
+            self.write_index(index,v)
     
     def increment(self,name,increment):
-        lname = name.lower()
-        if lname in self.registers:
+        index = register_index(name)
+        if index is not None:
             v = increment
             if isinstance(increment,str):
                 v = int(increment)
-            self.registers[lname].value = self.registers[lname].value + v
+            self.write_index(index,self.values[index] + v)
 
     def display(self):
+        if not printer.Printer.info_enabled:
+            return
         printer.Printer.info( 'REGISTERS', '----------------------------------------------------------------------------------' )
         printer.Printer.info( 'REGISTERS', '                                REGISTER VALUES' )
         printer.Printer.info( 'REGISTERS', '----------------------------------------------------------------------------------' )
-        for name,reg in self.registers.items():
-            stall = ' :: WB STALL' if self.is_reserved(name) else ''
-            printer.Printer.info( 'REGISTERS', '{0} = {1}{2}'.format(name.upper(), hex(reg.value), stall) )
+        for index in [PC] + list(range(NUM_GPR_REGISTERS)):
+            name = 'PC' if index == PC else '{0}/{1}'.format(register_name(index),ABI_NAMES[index]).upper()
+            stall = ' :: WB STALL' if self.reserved_mask & (1 << index) else ''
+            printer.Printer.info( 'REGISTERS', '{0:7} = {1}{2}', name, hex(self.values[index]), stall )
         printer.Printer.info( 'REGISTERS', '----------------------------------------------------------------------------------' )
@@ -0,0 +1,139 @@
+###############################################################################
+# File:          replay.py                                                    # 
+# Project:       Kindred                                                      # 
+# Author:        Paul Klein                                                   # 
+# EMail:         pauljkaz@gmail.com                                           # 
+# -----                                                                       # 
+# Last Modified: Mon Jul 31 2023                                              # 
+# Modified By:   Paul Klein                                                   # 
+# -----                                                                       # 
+#                                                                             # 
+#  Copyright (c) 2019 - 2023 N/A, All Rights Reserved.                        # 
+#                                                                             # 
+###############################################################################
+
+import inst_set
+import inst_trace
+
+import copy
+
+###############################################################################
+# Replay stage handlers - outcomes come from decode.record instead of being
+# computed. Wrong-path instructions (record None) only occupy pipeline slots.
+###############################################################################
+def fetch_replay(pipeline,decode,pc):
+    inst = decode.instruction
+    opcode = inst.opcode
+    decode.record,next_pc = pipeline.inst_buffer.take(decode)
+    if not opcode.control:
+        opcode.original.fetch(pipeline,decode,pc)
+        return
+    if opcode.kind == inst_set.KindredOpcode.JUMP:
+        decode.resultant = pc+1
+    if pipeline.branch_predictor is not None:
+        pipeline.predict(decode,pc)
+        if decode.record != None and decode.target != next_pc:
+            # Mispredicted - FETCH runs down the wrong path until EXEC redirects it
+            pipeline.inst_buffer.redirect = (decode,next_pc)
+        return
+    taken = opcode.kind == inst_set.KindredOpcode.JUMP or next_pc != pc+1
+    pipeline.control_transfer(decode,pc,taken,next_pc)
+
+def execute_replay(pipeline,decode,complete):
+    record = decode.record
+    if record == None:
+        return True
+    inst = decode.instruction
+    if inst.mem_load or inst.mem_store:
+        decode.op1_value = record.addr
+        if not complete:
+            pipeline.lsu_request(decode)
+            return False
+        if inst.mem_store:
+            # Loads take their value from the trace, memory is only written for the final state
+            pipeline.lsu.write(record.addr,record.value,inst.opcode.width)
+            decode.dst_value = record.value
+            decode.lsu_value = record.value
+            return True
+        decode.lsu_value = inst_set.sext32(record.value)
+    if inst.reg_write_back:
+        decode.resultant = inst_set.sext32(record.value)
+    if inst.opcode.control and pipeline.branch_predictor is not None:
+        buffer = pipeline.inst_buffer
+        next_pc = decode.target
+        if buffer.redirect != None and buffer.redirect[0] is decode:
+            next_pc = buffer.redirect[1]
+            buffer.redirect = None
+        pc = inst.id - 1
+        pipeline.resolve(decode,inst.opcode.kind == inst_set.KindredOpcode.JUMP or next_pc != pc+1,next_pc)
+    return True
+
+def replay_opcode(opcode):
+    # Not copy.copy - opcodes reduce to the registered singleton
+    replay = inst_set.KindredOpcode.__new__(inst_set.KindredOpcode)
+    replay.__dict__.update(opcode.__dict__)
+    replay.original = opcode
+    replay.fetch = fetch_replay
+    replay.execute = execute_replay
+    return replay
+
+
+class KindredReplayBuffer:
+    """ Instruction buffer that fetches along a binary retire trace (inst_trace) instead of
+    following the PC. The workload's instructions provide registers and hazards, the trace
+    provides results, memory addresses and the control flow, so the pipeline only models
+    timing and no instruction semantics are evaluated. """
+
+    def __init__(self,instance_name,inst_buffer,filename):
+        self.instance_name = instance_name
+        self.inst_buffer = inst_buffer
+        self.reader = inst_trace.KindredInstructionTraceReader(filename)
+        self.records = iter(self.reader)
+        # Trace opcode id => opcode id of this build, to check the trace belongs to the workload
+        self.opcode_ids = [ (inst_set.KindredInstructionSet.lookup(name) or inst_set.UNKNOWN).id for name in self.reader.opcodes ]
+        replays = {}
+        self.instructions = []
+        for inst in inst_buffer.instructions:
+            replay = copy.copy(inst)
+            replay.opcode = replays.setdefault(inst.opcode.name,replay_opcode(inst.opcode))
+            self.instructions.append(replay)
+        # (mispredicted control decode, actual next PC) while FETCH is on the wrong path
+        self.redirect = None
+        self.consumed = 0
+        self.next = next(self.records,None)
+
+    def close(self):
+        self.reader.close()
+
+    def fetch(self,addr):
+        if self.redirect == None:
+            if self.next == None:
+                return None
+            addr = self.next.pc
+        if addr < len(self.instructions):
+            return self.instructions[addr]
+        return None
+
+    def take(self,decode):
+        """ Trace record of an on-path decode and the PC that followed it, (None,None) on the wrong path """
+        record = self.next
+        if self.redirect != None or record == None:
+            return None,None
+        inst = decode.instruction
+        if record.pc != inst.id - 1 or self.opcode_ids[record.opcode] != inst.opcode.id:
+            raise ValueError('trace record {0} [{1} @PC={2}] does not match the workload [{3}]'.format(self.consumed,self.reader.opcode_name(record.opcode),record.pc,inst.assembly))
+        self.consumed += 1
+        self.next = next(self.records,None)
+        return record,self.next.pc if self.next != None else record.pc+1
+
+    def label_addr(self,label):
+        return self.inst_buffer.label_addr(label)
+
+    def size(self):
+        """ Instructions left to fetch - none once the trace is exhausted, so the pipe can drain """
+        if self.next == None and self.redirect == None:
+            return 0
+        return len(self.instructions)
+
+    def has_instruction_at(self,addr):
+        return self.fetch(addr) != None
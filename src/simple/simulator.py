@@ -0,0 +1,325 @@
+############################################################################### 
+# File:          simulator.py                                                 # 
+# Project:       Kindred                                                      # 
+# Author:        Paul Klein                                                   # 
+# EMail:         pauljkaz@gmail.com                                           # 
+# -----                                                                       # 
+# Last Modified: Mon Jul 31 2023                                              # 
+# Modified By:   Paul Klein                                                   # 
+# -----                                                                       # 
+#                                                                             # 
+#  Copyright (c) 2019 - 2023 N/A, All Rights Reserved.                        # 
+#                                                                             # 
+############################################################################### 
+
+import assembly_loader
+import binary_loader
+import registers_unit
+import inst_buffer_unit
+import load_store_unit
+import pipeline_unit
+import functional_engine
+import cache_unit
+import branch_predictor_unit
+import staged_pipeline
+import replay
+import printer
+
+import math
+import time
+
+class KindredSimulator:
+    """ Kindred units wired together plus the cycle and functional run loops """
+
+    def __init__(self,instance_name='kindred',inst_buffer=None):
+        self.instance_name = instance_name
+        # Instruction buffer is read-only during simulation and can be shared
+        self.inst_buffer = inst_buffer if inst_buffer is not None else inst_buffer_unit.KindredInstructionBufferUnit(instance_name+'.inst_buffer')
+        self.registers = registers_unit.KindredRegistersUnit(instance_name+'.registers')
+        self.lsu = load_store_unit.KindredLoadStoreUnit(instance_name+'.lsu')
+        self.pipeline = pipeline_unit.KindredPipeline(instance_name+'.pipeline',self.inst_buffer,self.registers,self.lsu)
+        self.functional = functional_engine.KindredFunctionalEngine(instance_name+'.functional',self.inst_buffer,self.registers,self.lsu)
+
+        # Run settings
+        self.max_cycles = 10000
+        self.display_cycle = False
+        # Jump over cycles where the pipe only waits on the LSU (cycle counts are unchanged)
+        self.skip_idle = True
+
+        # Optional VCD clock trace (KindredVcdTrace,clock var) and pipeline state sampler
+        self.vcd_trace_store = None
+        self.clock_var = None
+        self.vcd_sampler = None
+
+        # Results
+        self.cycle = 0
+        self.edge = 0
+        self.skipped_cycles = 0
+        self.host_time = 0.0
+
+    def reset(self):
+        """ Back to power-on state with the same configuration, the program is kept unless the
+        instruction buffer is cleared and reloaded """
+        self.registers.reset()
+        self.lsu.clear()
+        self.pipeline.reset()
+        if self.pipeline.dcache is not None:
+            self.pipeline.dcache.reset()
+        if self.pipeline.branch_predictor is not None:
+            self.pipeline.branch_predictor.reset()
+        self.functional.invalidate()
+        self.functional.num_retired_instructions = 0
+        self.cycle = 0
+        self.edge = 0
+        self.skipped_cycles = 0
+        self.host_time = 0.0
+
+    def configure_pipeline(self,preset='classic',width=1,latencies=None):
+        """ 'classic' 3-latch pipeline or a staged pipeline preset ('3stage', '5stage') """
+        if preset == 'classic':
+            if width != 1 or latencies:
+                raise ValueError('the classic pipeline is single issue with fixed latencies')
+            self.pipeline = pipeline_unit.KindredPipeline(self.instance_name+'.pipeline',self.inst_buffer,self.registers,self.lsu)
+        else:
+            self.pipeline = staged_pipeline.KindredStagedPipeline.from_preset(self.instance_name+'.pipeline',self.inst_buffer,self.registers,self.lsu,preset,width,latencies)
+
+    def configure_caches(self,l1d=None,l2=None,memory_latency=100):
+        """ Data cache hierarchy from 'size=32k,assoc=8,...' specs, None to leave a level out """
+        next_level = None
+        if l2 != None:
+            next_level = cache_unit.KindredCache.from_spec(self.instance_name+'.l2',l2,memory_latency=memory_latency)
+        if l1d != None:
+            self.pipeline.dcache = cache_unit.KindredCache.from_spec(self.instance_name+'.l1d',l1d,next_level,memory_latency)
+        else:
+            self.pipeline.dcache = next_level
+
+    def configure_branch_predictor(self,predictor='none',entries=1024,history_bits=10,btb_entries=256):
+        """ Speculative fetch with the named direction predictor, 'none' stalls FETCH on every taken branch """
+        if predictor == 'none':
+            self.pipeline.branch_predictor = None
+        else:
+            self.pipeline.branch_predictor = branch_predictor_unit.KindredBranchPredictorUnit(self.instance_name+'.bpred',predictor,entries,history_bits,btb_entries)
+
+    def configure_replay(self,filename):
+        """ Drive the pipeline from a binary retire trace of the loaded workload, the pipeline
+        then only models timing. None goes back to executing the workload. """
+        if isinstance(self.pipeline.inst_buffer,replay.KindredReplayBuffer):
+            self.pipeline.inst_buffer.close()
+        if filename == None:
+            self.pipeline.inst_buffer = self.inst_buffer
+        else:
+            self.pipeline.inst_buffer = replay.KindredReplayBuffer(self.instance_name+'.replay',self.inst_buffer,filename)
+
+    def caches(self):
+        """ Data caches from L1 outwards """
+        caches = []
+        cache = self.pipeline.dcache
+        while cache is not None:
+            caches.append(cache)
+            cache = cache.next_level
+        return caches
+
+    def load(self,workload):
+        """ Assembly, or an RV32I ELF executable / raw .bin image """
+        if binary_loader.RiscVBinaryLoader.is_binary(workload):
+            binary_loader.RiscVBinaryLoader.load(workload,self.inst_buffer)
+        else:
+            assembly_loader.RiscVAssemblyLoader.load(workload,self.inst_buffer)
+        self.load_image()
+
+    def load_image(self):
+        """ Initial memory and PC of the loaded program """
+        for addr,data in self.inst_buffer.data:
+            self.lsu.write_bytes(addr,data)
+        self.registers.write_index(registers_unit.PC,self.inst_buffer.entry)
+
+    def run_cycle(self,max_retired=None):
+        """ Cycle accurate run until the pipe drains, max_cycles or max_retired (total) retired
+        instructions, returns total cycles """
+        pipeline = self.pipeline
+        registers = self.registers
+        vcd_trace_store = self.vcd_trace_store
+        vcd_sampler = self.vcd_sampler
+        # Cycles with per-cycle console output are always simulated
+        skip_idle = self.skip_idle and not self.display_cycle and not printer.Printer.verbose_enabled
+        start = time.perf_counter()
+
+        # Simulation Loop
+        while True:
+            self.edge = self.edge + 1
+            self.cycle = self.cycle + 1
+            cycle = self.cycle
+
+            if printer.Printer.debug_enabled:
+                printer.Printer.debug( 'SIMULATOR', '----------------------> Stepping simulator...' )
+                printer.Printer.debug( 'SIMULATOR', '   Cycle [{0}]', cycle )
+                printer.Printer.debug( 'SIMULATOR', '   Current PC [{0}]', registers.read('pc') )
+
+            ######################################################################################################################
+            # NEGEDGE - LATCH values from previous stage, Pre-fetch
+            ######################################################################################################################
+            if printer.Printer.info_enabled:
+                printer.Printer.info( 'SIMULATOR', ' [[ CLOCK@NEGEDGE cycle={0} ]]', cycle )
+            if vcd_trace_store:
+                vcd_trace_store.change(self.clock_var,self.edge,0)
+            pipeline.negedge(cycle)
+
+            ######################################################################################################################
+            # UPDATE (POSEDGE) - LSU, Write-Back Store
+            ######################################################################################################################
+            if printer.Printer.info_enabled:
+                printer.Printer.info( 'SIMULATOR', ' [[ CLOCK@POSEDGE cycle={0} ]]', cycle )
+            self.edge = self.edge + 1
+            if vcd_trace_store:
+                vcd_trace_store.change(self.clock_var,self.edge,1)
+            pipeline.posedge(cycle)
+            if vcd_sampler:
+                vcd_sampler.sample(self.edge)
+
+            ######################################################################################################################
+            # Display Cycle Summary
+            ######################################################################################################################
+            if self.display_cycle:
+                pipeline.display()
+                registers.display()
+
+            ######################################################################################################################
+            # Check for Termination
+            ######################################################################################################################
+            if pipeline.empty_pipe():
+                break
+            if cycle == self.max_cycles:
+                break
+            if max_retired is not None and pipeline.num_retired_instructions >= max_retired:
+                break
+
+            ######################################################################################################################
+            # Skip idle cycles - jump to the next cycle where the pipe changes state
+            ######################################################################################################################
+            if skip_idle:
+                skipped = pipeline.skip_idle(self.max_cycles - cycle - 1 if self.max_cycles is not None else 1 << 62)
+                if skipped:
+                    if vcd_trace_store:
+                        for edge in range(self.edge + 1,self.edge + 2*skipped + 1):
+                            vcd_trace_store.change(self.clock_var,edge,(edge - self.edge + 1) & 1)
+                    self.edge = self.edge + 2*skipped
+                    self.cycle = self.cycle + skipped
+                    self.skipped_cycles = self.skipped_cycles + skipped
+
+        self.host_time += time.perf_counter() - start
+        return self.cycle
+
+    def run_functional(self,max_instructions=None):
+        """ ISA-only run, returns the number of retired instructions """
+        start = time.perf_counter()
+        retired = self.functional.run(max_instructions)
+        self.host_time += time.perf_counter() - start
+        return retired
+
+    def drain(self):
+        """ Stop fetching and run until all in-flight instructions retire. Architectural
+        state is then exact and can be handed to the functional model. """
+        self.pipeline.fetch_enabled = False
+        max_cycles = self.max_cycles
+        self.max_cycles = None
+        self.run_cycle()
+        self.max_cycles = max_cycles
+        self.pipeline.fetch_enabled = True
+
+    def run_sampled(self,fast_forward,warmup,measure,max_samples=None):
+        """ SMARTS style periodic sampling
+
+        Repeats until the program ends: fast-forward functionally, warm up the
+        pipeline in detailed mode, measure a detailed window, drain. Returns a
+        KindredSampledResults with the per-sample CPI.
+        """
+        results = KindredSampledResults()
+        max_cycles = self.max_cycles
+        self.max_cycles = None
+        while not self.completed():
+            results.functional_instructions += self.run_functional(fast_forward)
+            if self.completed():
+                break
+
+            # Detailed warm-up then measurement window
+            pipeline = self.pipeline
+            if warmup > 0:
+                self.run_cycle(pipeline.num_retired_instructions + warmup)
+                if pipeline.empty_pipe():
+                    break
+            start_cycle = self.cycle
+            start_retired = pipeline.num_retired_instructions
+            self.run_cycle(start_retired + measure)
+            retired = pipeline.num_retired_instructions - start_retired
+            if retired > 0:
+                results.samples.append( (self.cycle - start_cycle) / retired )
+                results.measured_instructions += retired
+
+            # Drain so the functional model continues from exact state
+            self.drain()
+            if max_samples is not None and len(results.samples) >= max_samples:
+                break
+
+        self.max_cycles = max_cycles
+        results.detailed_instructions = self.pipeline.num_retired_instructions
+        results.detailed_cycles = self.cycle
+        return results
+
+    def completed(self):
+        return self.registers.read_index(registers_unit.PC) >= self.inst_buffer.size()
+
+    def compare_state(self,other):
+        """ Architectural state differences against another simulator, empty if identical """
+        mismatches = []
+        for index in range(registers_unit.NUM_REGISTERS):
+            a = self.registers.values[index]
+            b = other.registers.values[index]
+            if a != b:
+                mismatches.append( 'register {0}: {1} != {2}'.format(registers_unit.register_name(index),hex(a),hex(b)) )
+        for number in sorted(set(self.lsu.pages) | set(other.lsu.pages)):
+            base = number << load_store_unit.PAGE_BITS
+            if self.lsu.read_bytes(base,load_store_unit.PAGE_SIZE) == other.lsu.read_bytes(base,load_store_unit.PAGE_SIZE):
+                continue
+            for addr in range(base,base + load_store_unit.PAGE_SIZE,4):
+                a = self.lsu.read(addr,4,False)
+                b = other.lsu.read(addr,4,False)
+                if a != b:
+                    mismatches.append( 'memory {0}: {1} != {2}'.format(hex(addr),hex(a),hex(b)) )
+        return mismatches
+
+
+class KindredSampledResults:
+    """ Sampled simulation results """
+
+    # Two-sided 95% Student-t critical values by degrees of freedom
+    T95 = [ 0, 12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228
+        , 2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086
+        , 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042 ]
+
+    def __init__(self):
+        self.samples = []
+        self.functional_instructions = 0
+        self.measured_instructions = 0
+        self.detailed_instructions = 0
+        self.detailed_cycles = 0
+
+    def total_instructions(self):
+        return self.functional_instructions + self.detailed_instructions
+
+    def cpi(self):
+        if not self.samples:
+            return 0.0
+        return sum(self.samples) / len(self.samples)
+
+    def confidence_interval(self):
+        """ 95% confidence interval half-width of the mean CPI """
+        n = len(self.samples)
+        if n < 2:
+            return float('inf') if n == 1 else 0.0
+        mean = self.cpi()
+        stdev = math.sqrt( sum( (s - mean) ** 2 for s in self.samples ) / (n - 1) )
+        t = KindredSampledResults.T95[n-1] if n-1 < len(KindredSampledResults.T95) else 1.96
+        return t * stdev / math.sqrt(n)
+
+    def estimated_cycles(self):
+        return self.cpi() * self.total_instructions()
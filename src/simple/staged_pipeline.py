@@ -0,0 +1,457 @@
+############################################################################### 
+# File:          staged_pipeline.py                                           # 
+# Project:       Kindred                                                      # 
+# Author:        Paul Klein                                                   # 
+# EMail:         pauljkaz@gmail.com                                           # 
+# -----                                                                       # 
+# Last Modified: Mon Jul 31 2023                                              # 
+# Modified By:   Paul Klein                                                   # 
+# -----                                                                       # 
+#                                                                             # 
+#  Copyright (c) 2019 - 2023 N/A, All Rights Reserved.                        # 
+#                                                                             # 
+############################################################################### 
+
+import registers_unit
+import pipeline_unit
+import printer
+
+import collections
+
+class KindredStage:
+    """ One pipeline stage - what it does (roles), how many instructions it holds (width)
+    and how many cycles an instruction spends in it (latency) """
+
+    FETCH = 'fetch'             # Instructions enter here on the negedge, PC/prediction update
+    DECODE = 'decode'           # Operands read (forwarded)
+    EXECUTE = 'execute'         # ALU ops and branch resolution
+    MEMORY = 'memory'           # LSU access, the stage is held until it completes
+    WRITEBACK = 'writeback'     # Retire, last stage only
+
+    ROLES = [ FETCH, DECODE, EXECUTE, MEMORY, WRITEBACK ]
+
+    def __init__(self,name,roles,width=1,latency=1):
+        for role in roles:
+            if role not in KindredStage.ROLES:
+                raise ValueError('unknown role [{0}] for stage [{1}]'.format(role,name))
+        self.name = name
+        self.roles = list(roles)
+        self.width = width
+        self.latency = latency
+        self.fetch = KindredStage.FETCH in roles
+        self.decode = KindredStage.DECODE in roles
+        self.execute = KindredStage.EXECUTE in roles
+        self.memory = KindredStage.MEMORY in roles
+        # Input latch - [decode, first cycle its work can be done], filled on the negedge
+        self.input = collections.deque()
+        # Output latch - decodes done with this stage, pulled by the next one on the negedge
+        self.output = collections.deque()
+
+
+class KindredStagedPipeline(pipeline_unit.KindredPipeline):
+    """ In-order pipeline described by a list of KindredStage
+
+    Same two edge model as the classic pipeline, with an input and an output latch of
+    'width' slots per stage. On the negedge every stage pulls from the output latch of
+    the stage before it (back to front) and the first stage fetches. On the posedge every
+    stage does its work (back to front) and moves finished instructions to its output
+    latch if it has room. The '3stage' preset is the classic pipeline cycle for cycle,
+    IF/ID/EX/MEM/WB and N-wide variants come from the same loop. Hazards, control
+    transfers (stall or predict) and LSU accesses use the classic policies.
+    """
+
+    PRESETS = {
+        '3stage' : [ ('FETCH', [KindredStage.FETCH,KindredStage.DECODE])
+                     , ('EXEC', [KindredStage.EXECUTE,KindredStage.MEMORY])
+                     , ('WB', [KindredStage.WRITEBACK]) ]
+        , '5stage' : [ ('IF', [KindredStage.FETCH])
+                       , ('ID', [KindredStage.DECODE])
+                       , ('EX', [KindredStage.EXECUTE])
+                       , ('MEM', [KindredStage.MEMORY])
+                       , ('WB', [KindredStage.WRITEBACK]) ]
+    }
+
+    PROFILE_STAGES = [
+        ('pull', 'latch.negedge')
+        , ('fetch', 'fetch.negedge')
+        , ('writeback', 'retire.posedge')
+        , ('advance', 'stages.posedge')
+    ]
+
+    def __init__(self,instance_name,inst_buffer,registers,lsu,stages):
+        if len(stages) < 2 or not stages[0].fetch or KindredStage.WRITEBACK not in stages[-1].roles:
+            raise ValueError('a pipeline needs a fetch stage first and a writeback stage last')
+        for role in (KindredStage.DECODE,KindredStage.EXECUTE,KindredStage.MEMORY):
+            if not any( role in stage.roles for stage in stages ):
+                raise ValueError('no stage has the [{0}] role'.format(role))
+        self.stages = stages
+        # (stage, output latch it pulls from) back to front, stages with posedge work back to front
+        self.links = [ (stages[i], stages[i-1].output) for i in range(len(stages)-1,0,-1) ]
+        self.workers = stages[-2::-1]
+        # Cycles a mispredict costs the front end - stages ahead of branch resolution
+        self.refill_cycles = 0
+        for stage in stages:
+            if stage.execute:
+                break
+            self.refill_cycles += stage.latency
+        pipeline_unit.KindredPipeline.__init__(self,instance_name,inst_buffer,registers,lsu)
+
+    @staticmethod
+    def from_preset(instance_name,inst_buffer,registers,lsu,preset='5stage',width=1,latencies=None):
+        """ Build a preset pipeline, latencies maps stage name => cycles """
+        if preset not in KindredStagedPipeline.PRESETS:
+            raise ValueError('unknown pipeline [{0}]'.format(preset))
+        latencies = latencies or {}
+        stages = []
+        for name,roles in KindredStagedPipeline.PRESETS[preset]:
+            stages.append( KindredStage(name,roles,width,latencies.get(name,1)) )
+        for name in latencies:
+            if not any( stage.name == name for stage in stages ):
+                raise ValueError('pipeline [{0}] has no stage [{1}]'.format(preset,name))
+        return KindredStagedPipeline(instance_name,inst_buffer,registers,lsu,stages)
+
+    @staticmethod
+    def parse_latencies(spec):
+        """ 'EX=2,MEM=1' => { 'EX' : 2, 'MEM' : 1 } """
+        latencies = {}
+        if spec != None:
+            for item in spec.split(','):
+                if len(item.strip()) == 0:
+                    continue
+                name,_,cycles = item.partition('=')
+                latencies[name.strip().upper()] = int(cycles)
+        return latencies
+
+    def reset(self):
+        pipeline_unit.KindredPipeline.reset(self)
+        for stage in self.stages:
+            stage.input.clear()
+            stage.output.clear()
+        # Age of the next fetched and of the last retired instruction
+        self.sequence = 0
+        self.retired_sequence = -1
+        self.cycle = 0
+
+    def negedge(self,cycle):
+        self.pull(cycle)
+        if self.fetch_enabled:
+            self.fetch(cycle)
+
+    def posedge(self,cycle):
+        self.cycle = cycle
+        self.writeback(cycle)
+        self.advance(cycle)
+
+    def pull(self,cycle):
+        """ Every stage latches from the output of the stage before, back to front """
+        last = self.stages[-1]
+        if last.output:
+            # Retired last cycle, nothing refers to them any more
+            for decode in last.output:
+                self.decode_pool.release(decode)
+            last.output.clear()
+        for stage,source in self.links:
+            if not source:
+                continue
+            latch = stage.input
+            ready = cycle + stage.latency - 1
+            while source and len(latch) < stage.width:
+                decode = source.popleft()
+                if printer.Printer.debug_enabled:
+                    printer.Printer.debug( stage.name, 'Latch decoded instruction [{0}]', decode.instruction.inst )
+                decode.ready_cycle = ready
+                latch.append(decode)
+
+    def writeback(self,cycle):
+        """ Retire from the last stage """
+        last = self.stages[-1]
+        latch = last.input
+        while latch and latch[0].ready_cycle <= cycle:
+            decode = latch.popleft()
+            self.retire(decode,cycle)
+            last.output.append(decode)
+
+    def advance(self,cycle):
+        """ Posedge work of every other stage, back to front """
+        for stage in self.workers:
+            latch = stage.input
+            output = stage.output
+            while latch and len(output) < stage.width:
+                decode = latch[0]
+                if decode.ready_cycle > cycle or not self.work(stage,decode):
+                    break
+                output.append(latch.popleft())
+
+    def work(self,stage,decode):
+        """ Posedge work of stage on decode, False while it has to stay in the stage """
+        inst = decode.instruction
+        memory = stage.memory and (inst.mem_load or inst.mem_store)
+        if memory and self.exec_lsu_delay > 0:
+            # Outstanding LSU access, always the oldest one in the stage
+            self.exec_lsu_delay = self.exec_lsu_delay - 1
+            if self.exec_lsu_delay > 0:
+                self.lsu_stall(stage,decode)
+                return False
+            inst.opcode.execute(self,decode,True)
+            return True
+        if stage.decode:
+            if self.forwarding and not self.sources_ready(inst):
+                # Producer result not available yet (load in flight), hold in the stage
+                self.stalls[self.stall_cause(inst,inst.stall_mask)] += 1
+                if printer.Printer.verbose_enabled:
+                    printer.Printer.verbose( stage.name, 'STALL - Waiting for forwarded operand [{0}]', inst.assembly )
+                return False
+            self.read_operands(decode)
+        if memory:
+            if not inst.opcode.execute(self,decode,False):
+                self.lsu_stall(stage,decode)
+                return False
+        elif stage.execute and not (inst.mem_load or inst.mem_store):
+            inst.opcode.execute(self,decode,True)
+        return True
+
+    def lsu_stall(self,stage,decode):
+        self.stalls[pipeline_unit.KindredPipeline.STALL_LSU] += 1
+        if printer.Printer.verbose_enabled:
+            printer.Printer.verbose( stage.name, 'STALL pipeline for LSU response [addr={0}]', hex(decode.op1_value) )
+
+    def fetch(self,cycle):
+        stage = self.stages[0]
+        latch = stage.input
+        values = self.registers.values
+        while len(latch) < stage.width:
+            pc = values[registers_unit.PC]
+            inst = self.inst_buffer.fetch(pc)
+            if inst == None:
+                # No instruction @PC - wait for pipe to complete
+                break
+            blocked = self.fetch_blocked(inst)
+            if blocked:
+                self.stalls[self.stall_cause(inst,blocked)] += 1
+                if printer.Printer.verbose_enabled:
+                    printer.Printer.verbose( stage.name, 'STALL - Write-back hazard' )
+                break
+            decode = self.decode_pool.acquire(inst)
+            decode.sequence = self.sequence
+            decode.ready_cycle = cycle + stage.latency - 1
+            self.sequence += 1
+            inst.opcode.fetch(self,decode,pc)
+            self.registers.reserve_mask(decode.reserved_mask)
+            if printer.Printer.debug_enabled:
+                printer.Printer.debug( stage.name, 'Fetched [{0}] @PC={1}', inst.assembly, pc )
+            latch.append(decode)
+            if values[registers_unit.PC] != pc + 1:
+                # Control transfer - the fetch group ends here
+                break
+
+    def fetch_blocked(self,next_inst):
+        if not self.forwarding:
+            return self.registers.reserved_mask & next_inst.fetch_stall_mask
+        blocked = pipeline_unit.KindredPipeline.fetch_blocked(self,next_inst)
+        if not blocked and next_inst.opcode.control and self.branch_predictor is None:
+            # Branch/jump operands are read now - older instructions that have not read their
+            # operands yet are not in the producer table
+            mask = next_inst.stall_mask
+            for decode in self.undecoded():
+                inst = decode.instruction
+                if inst.reg_write_back and inst.dst_operand.index and inst.dst_mask & mask:
+                    return mask
+        return blocked
+
+    def undecoded(self):
+        """ Decodes in flight that have not read their operands yet """
+        decodes = []
+        for stage in self.stages:
+            decodes.extend(stage.input)
+            if stage.decode:
+                break
+            decodes.extend(stage.output)
+        return decodes
+
+    def skip_idle(self,max_cycles):
+        """ Jump over upcoming cycles in which only an LSU access counts down and no other
+        stage can make progress, stall counters advance as if each cycle was simulated """
+        # The cycle in which the access completes is always simulated
+        cycles = min(self.exec_lsu_delay - 1,max_cycles)
+        if cycles <= 0:
+            return 0
+        stages = self.stages
+        last = stages[-1]
+        causes = []
+        for stage,source in self.links:
+            if source and len(stage.input) < stage.width:
+                return 0
+        if last.input:
+            return 0
+        for stage in self.workers:
+            latch = stage.input
+            if not latch or len(stage.output) >= stage.width:
+                continue
+            decode = latch[0]
+            inst = decode.instruction
+            if decode.ready_cycle > self.cycle + 1:
+                cycles = min(cycles,decode.ready_cycle - self.cycle - 1)
+            elif stage.memory and (inst.mem_load or inst.mem_store):
+                causes.append(pipeline_unit.KindredPipeline.STALL_LSU)
+            elif stage.decode and self.forwarding and not self.sources_ready(inst):
+                causes.append(self.stall_cause(inst,inst.stall_mask))
+            else:
+                return 0
+        first = stages[0]
+        if self.fetch_enabled and len(first.input) < first.width:
+            next_inst = self.inst_buffer.fetch(self.registers.read_index(registers_unit.PC))
+            if next_inst != None:
+                blocked = self.fetch_blocked(next_inst)
+                if not blocked:
+                    return 0
+                causes.append(self.stall_cause(next_inst,blocked))
+        if cycles <= 0:
+            return 0
+        self.exec_lsu_delay -= cycles
+        for cause in causes:
+            self.stalls[cause] += cycles
+        self.cycle += cycles
+        return cycles
+
+    def retire(self,decode,cycle):
+        inst = decode.instruction
+        inst.opcode.write_back(self,decode)
+        if printer.Printer.info_enabled:
+            printer.Printer.info( self.stages[-1].name, 'Retiring instruction [{0}]', inst.assembly )
+        if printer.Printer.verbose_enabled:
+            printer.Printer.verbose( self.stages[-1].name, 'CYCLE={0:5} - {1}', cycle, inst.assembly )
+        if self.inst_trace:
+            self.inst_trace.retire(cycle,decode)
+        self.retired_sequence = decode.sequence
+        decode.reset()
+        self.num_retired_instructions = self.num_retired_instructions + 1
+
+    def read_operands(self,decode):
+        inst = decode.instruction
+        if self.forwarding:
+            # Forwarded from in-flight producers
+            decode.dst_value = self.read_operand(inst.dst_operand) if inst.reads_dst else 0
+            decode.op1_value = self.read_operand(inst.op1_operand)
+            decode.op2_value = self.read_operand(inst.op2_operand)
+            if inst.reg_write_back and inst.dst_operand.index:
+                # Re-reserve, an older producer of the same register may have released it
+                self.registers.reserve_mask(inst.dst_mask)
+        else:
+            decode.fetch_op_values(self.registers,self.inst_buffer)
+        if inst.reg_write_back and inst.dst_operand.index:
+            index = inst.dst_operand.index
+            decode.previous_producer = self.producers[index]
+            self.producers[index] = decode
+
+    def resolve(self,decode,taken,target):
+        inst = decode.instruction
+        pc = inst.id - 1
+        next_pc = target if taken else pc + 1
+        bp = self.branch_predictor
+        bp.update(pc,inst,taken,target)
+        if next_pc == decode.target:
+            return
+        if printer.Printer.debug_enabled:
+            printer.Printer.debug( 'PIPELINE', '{0} mispredicted, flushing and redirecting to PC={1}', inst.inst.upper(), next_pc )
+        bp.mispredicts += 1
+        bp.flushes += 1
+        bp.flush_cycles += self.refill_cycles
+        # Squash everything younger, youngest first so producer links unwind in order
+        for stage in self.stages:
+            latch = stage.input
+            while latch and latch[-1].sequence > decode.sequence:
+                self.discard(latch.pop())
+            latch = stage.output
+            while latch and latch[-1].sequence > decode.sequence:
+                self.discard(latch.pop())
+        decode.target = next_pc
+        self.registers.write_index(registers_unit.PC,next_pc)
+
+    def discard(self,decode):
+        self.squash(decode)
+        self.decode_pool.release(decode)
+        self.branch_predictor.squashed_instructions += 1
+
+    def squash(self,decode):
+        mask = decode.reserved_mask
+        inst = decode.instruction
+        if inst.reg_write_back and inst.dst_operand.index:
+            index = inst.dst_operand.index
+            producer = self.producers[index]
+            if producer is decode:
+                producer = decode.previous_producer
+                if producer is not None and (producer.sequence <= self.retired_sequence or producer.sequence > decode.sequence):
+                    # Retired (and maybe reused from the decode pool), the register is committed
+                    producer = None
+                self.producers[index] = producer
+            if producer is not None:
+                # An older instruction still has to write the register
+                mask &= ~inst.dst_mask
+        self.registers.release_mask(mask)
+
+    def latches(self):
+        """ (latch, decode or None) pairs, 'FETCH.in', 'FETCH.out', ... with the slot number
+        appended for wide stages. The last stage has no output latch. """
+        latches = []
+        for stage in self.stages:
+            for name,latch in (('in',stage.input),('out',stage.output)):
+                if name == 'out' and stage is self.stages[-1]:
+                    break
+                for slot in range(stage.width):
+                    label = '{0}.{1}'.format(stage.name,name) if stage.width == 1 else '{0}.{1}{2}'.format(stage.name,name,slot)
+                    latches.append( (label, latch[slot] if slot < len(latch) else None) )
+        return latches
+
+    def restore_latches(self,decodes):
+        """ Refill the latches from decodes in latches() order (None for an empty slot), ages
+        and producer links are rebuilt """
+        slots = iter(decodes)
+        for stage in self.stages:
+            for latch in (stage.input,stage.output):
+                latch.clear()
+                if latch is stage.output and stage is self.stages[-1]:
+                    break
+                for slot in range(stage.width):
+                    decode = next(slots)
+                    if decode != None:
+                        latch.append(decode)
+        # Oldest first - last stage to first, output before input
+        self.sequence = 0
+        self.retired_sequence = -1
+        undecoded = self.undecoded()
+        writers = {}
+        for stage in reversed(self.stages):
+            for decode in list(stage.output) + list(stage.input):
+                decode.sequence = self.sequence
+                self.sequence += 1
+                inst = decode.instruction
+                if inst.reg_write_back and inst.dst_operand.index and decode not in undecoded:
+                    decode.previous_producer = writers.get(inst.dst_operand.index)
+                    writers[inst.dst_operand.index] = decode
+
+    def occupancy(self):
+        last = self.stages[-1]
+        return [ (stage.name, len(stage.input) + (len(stage.output) if stage is not last else 0)) for stage in self.stages ]
+
+    def empty_pipe(self):
+        pc = self.registers.read_index(registers_unit.PC)
+        return (pc >= self.inst_buffer.size() or not self.fetch_enabled) and self.idle()
+
+    def idle(self):
+        last = self.stages[-1]
+        for stage in self.stages:
+            if stage.input or stage.output and stage is not last:
+                return False
+        return True
+
+    def display(self):
+        if not printer.Printer.info_enabled:
+            return
+        printer.Printer.info( 'SIMULATOR', '----------------------------------------------------------------------------------' )
+        printer.Printer.info( 'SIMULATOR', '                                PIPELINE' )
+        printer.Printer.info( 'SIMULATOR', '----------------------------------------------------------------------------------' )
+        for stage in self.stages:
+            decodes = list(stage.input) + list(stage.output)
+            insts = ' | '.join( decode.instruction.assembly for decode in decodes ) if decodes else 'X'
+            printer.Printer.info( 'SIMULATOR', '[{0:5}] inst=[{1}]', stage.name, insts )
+        printer.Printer.info( 'SIMULATOR', '----------------------------------------------------------------------------------' )
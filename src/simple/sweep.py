@@ -0,0 +1,198 @@
+############################################################################### 
+# File:          sweep.py                                                     # 
+# Project:       Kindred                                                      # 
+# Author:        Paul Klein                                                   # 
+# EMail:         pauljkaz@gmail.com                                           # 
+# -----                                                                       # 
+# Last Modified: Mon Jul 31 2023                                              # 
+# Modified By:   Paul Klein                                                   # 
+# -----                                                                       # 
+#                                                                             # 
+#  Copyright (c) 2019 - 2023 N/A, All Rights Reserved.                        # 
+#                                                                             # 
+############################################################################### 
+
+import simulator
+import staged_pipeline
+import pipeline_unit
+import printer
+
+import argparse
+import concurrent.futures
+import csv
+import itertools
+import json
+import os
+import time
+
+# Sweepable parameters - name => (type, default)
+PARAMETERS = {
+    'pipeline' : (str, 'classic')
+    , 'width' : (int, 1)
+    , 'stage_latency' : (str, None)
+    , 'forwarding' : (bool, False)
+    , 'branch_predictor' : (str, 'none')
+    , 'bp_entries' : (int, 1024)
+    , 'bp_history' : (int, 10)
+    , 'btb_entries' : (int, 256)
+    , 'l1d' : (str, None)
+    , 'l2' : (str, None)
+    , 'memory_latency' : (int, 100)
+    , 'load_store_unit_access_delay' : (int, 1)
+    , 'max_cycles' : (int, 0)
+}
+
+RESULTS = [ 'cycles', 'retired', 'cpi' ] + [ 'stall_' + cause for cause in pipeline_unit.KindredPipeline.STALL_CAUSES ] + [ 'host_time', 'error' ]
+
+def parse_value(name,text):
+    kind,_ = PARAMETERS[name]
+    if text.lower() == 'none':
+        return None
+    if kind == bool:
+        if text.lower() not in ('0','1','false','true','off','on'):
+            raise ValueError('[{0}] expects a boolean, got [{1}]'.format(name,text))
+        return text.lower() in ('1','true','on')
+    return kind(text)
+
+def build_grid(params):
+    """ Cartesian product of { name : [values] }, one dict of every parameter per point """
+    names = list(params.keys())
+    grid = []
+    for values in itertools.product(*[ params[name] for name in names ]):
+        point = { name : default for name,(_,default) in PARAMETERS.items() }
+        point.update(zip(names,values))
+        grid.append(point)
+    return grid
+
+###############################################################################
+# Worker side
+###############################################################################
+# Workload => instruction buffer, decoded once in the parent and handed to each worker once
+_inst_buffers = {}
+
+def _init_worker(inst_buffers):
+    global _inst_buffers
+    _inst_buffers = inst_buffers
+    printer.Printer.set_verbosity(printer.PrinterVerbosity.QUIET)
+
+def run_point(workload,point):
+    """ One cycle accurate run of workload with the point's parameters, returns a results row """
+    row = { 'workload' : workload }
+    row.update(point)
+    row.update({ name : None for name in RESULTS })
+    sim = simulator.KindredSimulator('kindred',_inst_buffers[workload])
+    sim.load_image()
+    sim.max_cycles = point['max_cycles'] if point['max_cycles'] else None
+    try:
+        sim.configure_pipeline(point['pipeline'],point['width'],staged_pipeline.KindredStagedPipeline.parse_latencies(point['stage_latency']))
+        sim.pipeline.forwarding = point['forwarding']
+        sim.pipeline.load_store_unit_access_delay = point['load_store_unit_access_delay']
+        sim.configure_caches(point['l1d'],point['l2'],point['memory_latency'])
+        sim.configure_branch_predictor(point['branch_predictor'],point['bp_entries'],point['bp_history'],point['btb_entries'])
+    except ValueError as e:
+        row['error'] = str(e)
+        return row
+
+    cycles = sim.run_cycle()
+    retired = sim.pipeline.num_retired_instructions
+    row['cycles'] = cycles
+    row['retired'] = retired
+    row['cpi'] = cycles / retired if retired > 0 else None
+    for cause,value in sim.pipeline.stalls.items():
+        row['stall_' + cause] = value
+    row['host_time'] = sim.host_time
+    if not sim.completed():
+        row['error'] = 'max_cycles reached'
+    return row
+
+###############################################################################
+# Parent side
+###############################################################################
+def sweep(workloads,grid,jobs=None):
+    """ Run every workload at every grid point, rows come back in (workload, point) order """
+    inst_buffers = {}
+    for workload in workloads:
+        sim = simulator.KindredSimulator('kindred')
+        sim.load(workload)
+        inst_buffers[workload] = sim.inst_buffer
+    tasks = [ (workload,point) for workload in workloads for point in grid ]
+
+    if jobs == 1:
+        verbosity = printer.Printer.verbosity
+        _init_worker(inst_buffers)
+        rows = [ run_point(workload,point) for workload,point in tasks ]
+        printer.Printer.set_verbosity(verbosity)
+        return rows
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs,initializer=_init_worker,initargs=(inst_buffers,)) as pool:
+        futures = [ pool.submit(run_point,workload,point) for workload,point in tasks ]
+        return [ future.result() for future in futures ]
+
+def write_results(filename,rows,fields=None):
+    """ CSV, or JSON when the file name ends in .json """
+    if filename.lower().endswith('.json'):
+        with open(filename,'w') as f:
+            json.dump(rows,f,indent=2)
+        return
+    if fields == None:
+        fields = [ 'workload' ] + list(PARAMETERS.keys()) + RESULTS
+    with open(filename,'w',newline='') as f:
+        writer = csv.DictWriter(f,fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def main():
+
+    parser = argparse.ArgumentParser(
+            prog='sweep',
+            description='Kindred RiscV Simulator - parallel parameter sweep'
+        )
+    parser.add_argument('-w', '--workload', nargs='+', required=True,
+                        help='Workloads to run at every point of the grid')
+    parser.add_argument('-p', '--param', nargs='+', action='append', default=[], metavar=('NAME','VALUE'),
+                        help='Parameter and the values to sweep, e.g. -p load_store_unit_access_delay 1 2 4 (one of: {0})'.format(', '.join(PARAMETERS.keys())))
+    parser.add_argument('-o', '--output', default='sweep.csv',
+                        help='Results table, .csv or .json (default: sweep.csv)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Worker processes (default: one per CPU, 1 runs in this process)')
+    args = parser.parse_args()
+
+    printer.Printer.set_verbosity(printer.PrinterVerbosity.NONE)
+
+    params = {}
+    try:
+        for param in args.param:
+            name = param[0]
+            if name not in PARAMETERS:
+                raise ValueError('unknown parameter [{0}]'.format(name))
+            if len(param) < 2:
+                raise ValueError('no values for parameter [{0}]'.format(name))
+            params.setdefault(name,[]).extend( parse_value(name,value) for value in param[1:] )
+    except ValueError as e:
+        printer.Printer.error( 'SWEEP', 'Invalid sweep - {0}', e )
+        return
+    for workload in args.workload:
+        if not os.path.exists(workload):
+            printer.Printer.error( 'SWEEP', 'Workload [{0}] was not found', workload )
+            return
+
+    grid = build_grid(params)
+    printer.Printer.summary( 'SWEEP', 'Running {0} workload(s) x {1} configuration(s)', len(args.workload), len(grid) )
+    start = time.perf_counter()
+    rows = sweep(args.workload,grid,args.jobs)
+    elapsed = time.perf_counter() - start
+    write_results(args.output,rows)
+
+    # SUMMARY
+    names = list(params.keys())
+    for row in rows:
+        config = ' '.join( '{0}={1}'.format(name,row[name]) for name in names )
+        if row['error'] != None and row['cycles'] == None:
+            printer.Printer.summary( 'SWEEP', '{0:24} {1} - {2}', os.path.basename(row['workload']), config, row['error'] )
+        else:
+            printer.Printer.summary( 'SWEEP', '{0:24} {1} - cycles={2} retired={3} CPI={4:.4f}{5}', os.path.basename(row['workload']), config
+                                    , row['cycles'], row['retired'], row['cpi'] or 0.0, ' ({0})'.format(row['error']) if row['error'] else '' )
+    printer.Printer.summary( 'SWEEP', 'Sweep complete - {0} runs in {1:.3f}s, results in [{2}]', len(rows), elapsed, args.output )
+
+if __name__ == "__main__":
+    main()
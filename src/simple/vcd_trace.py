@@ -12,29 +12,137 @@
 #                                                                             # 
 ###############################################################################
 
+import registers_unit
+
+import fnmatch
+
+import vcd.common
 from vcd import VCDWriter
 
 class KindredVcdTrace:
-    
-    def __init__(self,filename):
+    """ VCD file writer, only signals matching one of the scope patterns are registered """
+
+    # Bytes buffered before the file is written
+    BUFFER_SIZE = 1 << 20
+
+    def __init__(self,filename,scopes=None):
         self.filename = filename
         self.file = None
         self.vcdwriter = None
+        # fnmatch patterns on 'scope.name', None for every signal
+        self.scopes = scopes
         self.open(filename)
 
     def __del__(self):
-        if self.file:
-            self.file.close()
+        self.close()
 
     def open(self,filename):
-        self.file = open(self.filename,"w")
+        self.file = open(self.filename,"w",buffering=KindredVcdTrace.BUFFER_SIZE)
         if self.file:
             self.vcdwriter = VCDWriter(self.file, timescale='1 ns', date='today')
 
+    def close(self):
+        if self.vcdwriter:
+            self.vcdwriter.close()
+            self.vcdwriter = None
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def selected(self,scope,name):
+        if self.scopes == None:
+            return True
+        full_name = '{0}.{1}'.format(scope,name)
+        return any( fnmatch.fnmatchcase(full_name,pattern) or fnmatch.fnmatchcase(scope,pattern) for pattern in self.scopes )
+
     def register(self,scope,name,var_type,size,init='x'):
         if self.vcdwriter:
             return self.vcdwriter.register_var(scope,name,var_type,size,init)
+
+    def register_selected(self,scope,name,var_type,size,init='x'):
+        """ Register a signal if the scope filter selects it, None otherwise """
+        if self.selected(scope,name):
+            return self.register(scope,name,var_type,size,init)
+        return None
         
     def change(self,var,timestamp,value):
         if self.vcdwriter:
             self.vcdwriter.change(var,timestamp,value)
+
+
+class KindredPipelineVcd:
+    """ Samples pipeline latches, registers, reservations and LSU requests once per cycle
+
+    Values are compared against the previous sample so only real changes reach the
+    writer. Signals:
+        <pipeline>.<latch>.inst / .pc   instruction held by each latch (or stage slot)
+        <registers>.<name>              register values, x0-x31 and pc
+        <registers>.reserved            scoreboard reservation bits (pc is bit 32)
+        <lsu>.valid/.write/.addr/.data  LSU request issued this cycle
+    """
+
+    def __init__(self,trace : KindredVcdTrace,sim):
+        self.trace = trace
+        self.sim = sim
+        self.signals = []       # (var, value function)
+        self.values = []
+        self.latches = []
+        pipeline = sim.pipeline
+
+        # Latches - (name, decode) pairs from the pipeline
+        for index,(latch,_) in enumerate(pipeline.latches()):
+            scope = '{0}.{1}'.format(pipeline.instance_name,latch)
+            self.add(scope,'inst',vcd.common.VarType.string,1,lambda index=index: self.latch_inst(index))
+            self.add(scope,'pc',vcd.common.VarType.integer,32,lambda index=index: self.latch_pc(index))
+
+        # Register file
+        registers = sim.registers
+        values = registers.values
+        for index in range(registers_unit.NUM_REGISTERS):
+            name = 'pc' if index == registers_unit.PC else registers_unit.ABI_NAMES[index]
+            self.add(registers.instance_name,name,vcd.common.VarType.integer,32,lambda index=index: values[index] & 0xFFFFFFFF)
+        self.add(registers.instance_name,'reserved',vcd.common.VarType.wire,registers_unit.NUM_REGISTERS,lambda: registers.reserved_mask)
+
+        # LSU requests, captured by shadowing lsu_request on the pipeline instance
+        self.request = None
+        lsu = sim.lsu.instance_name
+        lsu_signals = [
+            self.add(lsu,'valid',vcd.common.VarType.wire,1,lambda: 1 if self.request != None else 0)
+            , self.add(lsu,'write',vcd.common.VarType.wire,1,lambda: int(self.request.instruction.mem_store) if self.request != None else 0)
+            , self.add(lsu,'addr',vcd.common.VarType.integer,32,lambda: self.request.op1_value & 0xFFFFFFFF if self.request != None else 0)
+            , self.add(lsu,'data',vcd.common.VarType.integer,32,lambda: self.request.dst_value & 0xFFFFFFFF if self.request != None and self.request.instruction.mem_store else 0)
+        ]
+        if any(lsu_signals):
+            lsu_request = pipeline.lsu_request
+            def traced_lsu_request(decode):
+                self.request = decode
+                return lsu_request(decode)
+            pipeline.lsu_request = traced_lsu_request
+
+    def add(self,scope,name,var_type,size,value):
+        var = self.trace.register_selected(scope,name,var_type,size)
+        if var == None:
+            return False
+        self.signals.append( (var,value) )
+        self.values.append(None)
+        return True
+
+    def latch_inst(self,index):
+        decode = self.latches[index][1]
+        return decode.instruction.assembly if decode != None else ''
+
+    def latch_pc(self,index):
+        decode = self.latches[index][1]
+        return decode.instruction.id - 1 if decode != None else 0
+
+    def sample(self,timestamp):
+        """ Emit the signals that changed since the last sample """
+        self.latches = self.sim.pipeline.latches()
+        values = self.values
+        change = self.trace.change
+        for i,(var,value) in enumerate(self.signals):
+            v = value()
+            if v != values[i]:
+                values[i] = v
+                change(var,timestamp,v)
+        self.request = None
@@ -0,0 +1,82 @@
+###############################################################################
+# File:          conftest.py                                                  # 
+# Project:       Kindred                                                      # 
+# Author:        Paul Klein                                                   # 
+# EMail:         pauljkaz@gmail.com                                           # 
+# -----                                                                       # 
+# Last Modified: Mon Jul 31 2023                                              # 
+# Modified By:   Paul Klein                                                   # 
+# -----                                                                       # 
+#                                                                             # 
+#  Copyright (c) 2019 - 2023 N/A, All Rights Reserved.                        # 
+#                                                                             # 
+###############################################################################
+
+import os
+import struct
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKLOADS = os.path.join(ROOT,'workloads')
+
+# The simulator modules import each other by bare name
+sys.path.insert(0,os.path.join(ROOT,'src','simple'))
+
+import simulator
+import printer
+
+import pytest
+
+printer.Printer.set_verbosity(printer.PrinterVerbosity.QUIET)
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path,monkeypatch):
+    """ Parsed assembly cache in a temporary directory, tests never write to ~/.cache/kindred """
+    import assembly_cache
+    directory = str(tmp_path / 'cache')
+    monkeypatch.setattr(assembly_cache.KindredAssemblyCache,'directory',directory)
+    monkeypatch.setattr(assembly_cache.KindredAssemblyCache,'fingerprint',None)
+    return directory
+
+@pytest.fixture
+def program(tmp_path):
+    """ Write assembly lines to a workload file, returns its path """
+    def write(lines,name='prog.s'):
+        path = tmp_path / name
+        path.write_text('\n'.join(lines) + '\n')
+        return str(path)
+    return write
+
+# addi x1,x0,5 / addi x2,x0,7 / add x3,x1,x2 / sw x3,256(x0) / lw x4,256(x0) / add x5,x4,x3
+PROGRAM_WORDS = [ 0x00500093, 0x00700113, 0x002081b3, 0x10302023, 0x10002203, 0x003202b3 ]
+
+@pytest.fixture
+def binary(tmp_path):
+    """ Write RV32I words to a raw .bin image, returns its path """
+    def write(words=PROGRAM_WORDS,name='prog.bin'):
+        path = tmp_path / name
+        path.write_bytes(struct.pack('<{0}I'.format(len(words)),*words))
+        return str(path)
+    return write
+
+@pytest.fixture
+def command(monkeypatch,capsys):
+    """ Run a command line main(), returns the console messages as a dict of
+    'name : value' lines, messages without a value map to '' """
+    def run(main,*argv):
+        monkeypatch.setattr(sys,'argv',list(argv))
+        main()
+        summary = {}
+        for line in capsys.readouterr().out.splitlines():
+            name,_,value = line.partition(' - ')[2].partition(':')
+            summary[name.strip()] = value.strip()
+        return summary
+    return run
+
+@pytest.fixture
+def kindredsim(tmp_path,command):
+    """ Run kindredsim quietly without traces """
+    import kindredsim as cli
+    def run(*args):
+        return command(cli.main,'kindredsim','-q','--no_vcd','--no_load_cache','-i',str(tmp_path / 'inst.log'),*args)
+    return run
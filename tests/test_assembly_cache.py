@@ -0,0 +1,71 @@
+###############################################################################
+# File:          test_assembly_cache.py                                       # 
+# Project:       Kindred                                                      # 
+# Author:        Paul Klein                                                   # 
+# EMail:         pauljkaz@gmail.com                                           # 
+# -----                                                                       # 
+# Last Modified: Mon Jul 31 2023                                              # 
+# Modified By:   Paul Klein                                                   # 
+# -----                                                                       # 
+#                                                                             # 
+#  Copyright (c) 2019 - 2023 N/A, All Rights Reserved.                        # 
+#                                                                             # 
+###############################################################################
+
+import os
+
+import assembly_cache
+import assembly_loader
+import inst_buffer_unit
+
+from conftest import WORKLOADS
+
+def load(workload):
+    buffer = inst_buffer_unit.KindredInstructionBufferUnit('kindred.inst_buffer')
+    assembly_loader.RiscVAssemblyLoader.load(workload,buffer)
+    return buffer
+
+def restore(workload):
+    """ True on a cache hit """
+    buffer = inst_buffer_unit.KindredInstructionBufferUnit('kindred.inst_buffer')
+    with open(workload,'rb') as f:
+        return assembly_cache.KindredAssemblyCache().restore(f.read(),buffer)
+
+def listing(buffer):
+    return [ (i.label,i.inst,i.dst,i.op1,i.op2) for i in buffer.instructions ], buffer.labels
+
+def test_miss_then_hit(cache_dir):
+    workload = os.path.join(WORKLOADS,'test3.s')
+    assert not restore(workload)
+    parsed = load(workload)
+    assert len(os.listdir(cache_dir)) == 1
+    assert restore(workload)
+    assert listing(load(workload)) == listing(parsed)
+
+def test_edited_source_misses(cache_dir,program):
+    lines = [ '        li t0, 1', '        addi t1, t0, 2' ]
+    workload = program(lines)
+    load(workload)
+    assert restore(workload)
+    workload = program(lines + [ '        add t2, t1, t0' ])
+    assert not restore(workload)
+    assert load(workload).size() == 3
+    assert restore(workload)
+    assert len(os.listdir(cache_dir)) == 2
+
+def test_changed_fingerprint_invalidates(cache_dir,monkeypatch):
+    workload = os.path.join(WORKLOADS,'test2.s')
+    parsed = load(workload)
+    assert restore(workload)
+    # As if the loader or decoder sources had been edited
+    monkeypatch.setattr(assembly_cache.KindredAssemblyCache,'fingerprint',bytes(32))
+    assert not restore(workload)
+    assert listing(load(workload)) == listing(parsed)
+    assert restore(workload)
+    assert len(os.listdir(cache_dir)) == 1
+
+def test_disabled_cache_writes_nothing(cache_dir,monkeypatch):
+    monkeypatch.setattr(assembly_cache.KindredAssemblyCache,'directory',None)
+    load(os.path.join(WORKLOADS,'test1.s'))
+    assert not restore(os.path.join(WORKLOADS,'test1.s'))
+    assert not os.path.exists(cache_dir)
@@ -0,0 +1,40 @@
+###############################################################################
+# File:          test_batch.py                                                # 
+# Project:       Kindred                                                      # 
+# Author:        Paul Klein                                                   # 
+# EMail:         pauljkaz@gmail.com                                           # 
+# -----                                                                       # 
+# Last Modified: Mon Jul 31 2023                                              # 
+# Modified By:   Paul Klein                                                   # 
+# -----                                                                       # 
+#                                                                             # 
+#  Copyright (c) 2019 - 2023 N/A, All Rights Reserved.                        # 
+#                                                                             # 
+###############################################################################
+
+import os
+
+import pytest
+
+import simulator
+import batch
+
+from conftest import WORKLOADS
+
+def test_binary_is_a_workload(binary):
+    image = binary()
+    assert batch.workload_list([ image ]) == [ image ]
+    row = batch.run_workload(simulator.KindredSimulator(),image,'cycle')
+    assert row['error'] == None
+    assert row['retired'] == 6
+
+def test_manifest_is_relative_to_its_directory(tmp_path):
+    manifest = tmp_path / 'list.txt'
+    manifest.write_text('# workloads\n' + os.path.join(WORKLOADS,'test1.s') + '\nsub/a.s  # local\n')
+    assert batch.workload_list([ str(manifest) ]) == [ os.path.join(WORKLOADS,'test1.s'), str(tmp_path / 'sub' / 'a.s') ]
+
+def test_undecodable_file_is_not_a_manifest(tmp_path):
+    blob = tmp_path / 'image.dat'
+    blob.write_bytes(b'\x93\x00\x50\xff\xfe\x00')
+    with pytest.raises(ValueError,match='not a manifest'):
+        batch.workload_list([ str(blob) ])
@@ -0,0 +1,72 @@
+###############################################################################
+# File:          test_binary_loader.py                                        # 
+# Project:       Kindred                                                      # 
+# Author:        Paul Klein                                                   # 
+# EMail:         pauljkaz@gmail.com                                           # 
+# -----                                                                       # 
+# Last Modified: Mon Jul 31 2023                                              # 
+# Modified By:   Paul Klein                                                   # 
+# -----                                                                       # 
+#                                                                             # 
+#  Copyright (c) 2019 - 2023 N/A, All Rights Reserved.                        # 
+#                                                                             # 
+###############################################################################
+
+import gc
+import struct
+
+import pytest
+
+import simulator
+import binary_loader
+import inst_buffer_unit
+
+# addi x1,x0,3 / loop: addi x1,x1,-1 / addi x2,x2,4 / sw x2,256(x1) / bne x1,x0,loop
+LOOP_WORDS = [ 0x00300093, 0xfff08093, 0x00410113, 0x1020a023, 0xfe009ae3 ]
+
+def elf(path,words,vaddr=0x10000,entry=None):
+    """ Minimal RV32 ELF executable with one PT_LOAD code segment """
+    loader = binary_loader.RiscVBinaryLoader
+    code = struct.pack('<{0}I'.format(len(words)),*words)
+    phoff = loader.ELF_HEADER.size
+    offset = phoff + loader.PROGRAM_HEADER.size
+    ident = loader.ELF_MAGIC + bytes([ 1, 1, 1 ]) + bytes(9)
+    header = loader.ELF_HEADER.pack( ident, 2, loader.EM_RISCV, 1, vaddr if entry == None else entry, phoff, 0, 0
+                                    , loader.ELF_HEADER.size, loader.PROGRAM_HEADER.size, 1, 0, 0, 0 )
+    segment = loader.PROGRAM_HEADER.pack( loader.PT_LOAD, offset, vaddr, vaddr, len(code), len(code), loader.PF_X | 4, 4 )
+    path.write_bytes(header + segment + code)
+    return str(path)
+
+def test_branch_targets_are_instruction_numbers(binary):
+    buffer = inst_buffer_unit.KindredInstructionBufferUnit('kindred.inst_buffer')
+    binary_loader.RiscVBinaryLoader.load(binary(LOOP_WORDS),buffer)
+    assert buffer.size() == 5
+    assert buffer.fetch(4).inst == 'bne'
+    assert buffer.fetch(4).op2 == '1'
+
+def test_load_leaves_the_collector_alone(binary):
+    frozen = gc.get_freeze_count()
+    collecting = gc.isenabled()
+    binary_loader.RiscVBinaryLoader.load(binary(LOOP_WORDS),inst_buffer_unit.KindredInstructionBufferUnit('kindred.inst_buffer'))
+    assert gc.get_freeze_count() == frozen
+    assert gc.isenabled() == collecting
+
+def test_elf_entry_and_segments(tmp_path):
+    sim = simulator.KindredSimulator()
+    sim.load(elf(tmp_path / 'loop.elf',[ 0 ] + LOOP_WORDS,entry=0x10004))
+    assert sim.inst_buffer.entry == 1
+    assert sim.lsu.read_bytes(0x10004,4) == struct.pack('<I',LOOP_WORDS[0])
+    assert sim.run_functional() == 13
+    assert sim.registers.read('x2') == 12
+
+@pytest.mark.parametrize('mode',[ 'cycle', 'functional' ])
+@pytest.mark.parametrize('words',[ LOOP_WORDS, None ])
+def test_cross_check(kindredsim,binary,mode,words):
+    image = binary(words) if words != None else binary()
+    run = kindredsim('-w',image,'-m',mode,'--cross_check')
+    assert 'Cross-check passed against the {0} model'.format('functional' if mode == 'cycle' else 'cycle') in run
+
+def test_cross_check_elf(kindredsim,tmp_path):
+    run = kindredsim('-w',elf(tmp_path / 'loop.elf',LOOP_WORDS),'--pipeline','5stage','--cross_check')
+    assert run['Total Retired Inst'] == '13'
+    assert 'Cross-check passed against the functional model' in run
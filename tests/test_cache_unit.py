@@ -0,0 +1,51 @@
+###############################################################################
+# File:          test_cache_unit.py                                           # 
+# Project:       Kindred                                                      # 
+# Author:        Paul Klein                                                   # 
+# EMail:         pauljkaz@gmail.com                                           # 
+# -----                                                                       # 
+# Last Modified: Mon Jul 31 2023                                              # 
+# Modified By:   Paul Klein                                                   # 
+# -----                                                                       # 
+#                                                                             # 
+#  Copyright (c) 2019 - 2023 N/A, All Rights Reserved.                        # 
+#                                                                             # 
+###############################################################################
+
+import simulator
+import cache_unit
+
+def test_cold_access_at_high_address_misses():
+    cache = cache_unit.KindredCache('l1d',size=1024,assoc=2,line_size=16,memory_latency=7)
+    # Sign-extended register values, the tag used to collide with INVALID
+    assert cache.access(-16) == 8
+    assert cache.access(-12) == 1
+    assert cache.access(0xFFFFFFF0,True) == 1
+    assert (cache.read_misses,cache.write_misses) == (1,0)
+
+def test_negative_address_is_the_same_line():
+    cache = cache_unit.KindredCache('l1d',size=1024,assoc=2,line_size=16)
+    cache.access(-4)
+    cache.access(0xFFFFFFFC)
+    assert cache.misses() == 1
+    assert cache.accesses() == 2
+
+def test_state_round_trip_keeps_empty_ways():
+    cache = cache_unit.KindredCache('l1d',size=1024,assoc=2,line_size=16)
+    cache.access(0x40)
+    other = cache_unit.KindredCache('l1d',size=1024,assoc=2,line_size=16)
+    other.restore_state(cache.state())
+    assert other.tags == cache.tags
+    assert other.access(0x44) == 1
+
+def test_pipeline_cold_cache_at_high_address(program):
+    sim = simulator.KindredSimulator()
+    sim.load(program([ '        li s0, 0xFFFFFFF0'
+                       , '        lw t0, 0(s0)'
+                       , '        lw t1, 4(s0)'
+                       , '        sw t0, 8(s0)' ]))
+    sim.configure_caches('size=1k,assoc=2,line=16',None,7)
+    sim.run_cycle()
+    cache = sim.pipeline.dcache
+    assert (cache.read_misses,cache.write_misses) == (1,0)
+    assert cache.accesses() - cache.misses() == 2
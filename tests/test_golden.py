@@ -0,0 +1,56 @@
+###############################################################################
+# File:          test_golden.py                                               # 
+# Project:       Kindred                                                      # 
+# Author:        Paul Klein                                                   # 
+# EMail:         pauljkaz@gmail.com                                           # 
+# -----                                                                       # 
+# Last Modified: Mon Jul 31 2023                                              # 
+# Modified By:   Paul Klein                                                   # 
+# -----                                                                       # 
+#                                                                             # 
+#  Copyright (c) 2019 - 2023 N/A, All Rights Reserved.                        # 
+#                                                                             # 
+###############################################################################
+
+import os
+
+import pytest
+
+import simulator
+
+from conftest import WORKLOADS
+
+# Cycles, retired instructions and stalls of the original classic pipeline (default configuration)
+GOLDEN = {
+    'test1.s' : ( 14, 6, { 'raw' : 2, 'load_use' : 0, 'control' : 4, 'lsu' : 0, 'waw' : 0 } )
+    , 'test2.s' : ( 170, 68, { 'raw' : 50, 'load_use' : 24, 'control' : 18, 'lsu' : 16, 'waw' : 0 } )
+    , 'test3.s' : ( 652, 226, { 'raw' : 272, 'load_use' : 90, 'control' : 62, 'lsu' : 60, 'waw' : 0 } )
+}
+
+@pytest.mark.parametrize('skip_idle',[ True, False ])
+@pytest.mark.parametrize('preset',[ 'classic', '3stage' ])
+@pytest.mark.parametrize('workload',sorted(GOLDEN))
+def test_cycle_counts(workload,preset,skip_idle):
+    cycles,retired,stalls = GOLDEN[workload]
+    sim = simulator.KindredSimulator()
+    sim.configure_pipeline(preset)
+    sim.skip_idle = skip_idle
+    sim.load(os.path.join(WORKLOADS,workload))
+    assert sim.run_cycle() == cycles
+    assert sim.pipeline.num_retired_instructions == retired
+    assert dict(sim.pipeline.stalls) == stalls
+    assert sim.completed()
+
+@pytest.mark.parametrize('workload',sorted(GOLDEN))
+def test_functional_retired(workload):
+    sim = simulator.KindredSimulator()
+    sim.load(os.path.join(WORKLOADS,workload))
+    assert sim.run_functional() == GOLDEN[workload][1]
+
+@pytest.mark.parametrize('workload',sorted(GOLDEN))
+def test_command_line_summary(kindredsim,workload):
+    cycles,retired,_ = GOLDEN[workload]
+    run = kindredsim('-w',os.path.join(WORKLOADS,workload),'--cross_check')
+    assert run['Total Cycles'] == str(cycles)
+    assert run['Total Retired Inst'] == str(retired)
+    assert 'Cross-check passed against the functional model' in run
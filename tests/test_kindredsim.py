@@ -0,0 +1,78 @@
+###############################################################################
+# File:          test_kindredsim.py                                           # 
+# Project:       Kindred                                                      # 
+# Author:        Paul Klein                                                   # 
+# EMail:         pauljkaz@gmail.com                                           # 
+# -----                                                                       # 
+# Last Modified: Mon Jul 31 2023                                              # 
+# Modified By:   Paul Klein                                                   # 
+# -----                                                                       # 
+#                                                                             # 
+#  Copyright (c) 2019 - 2023 N/A, All Rights Reserved.                        # 
+#                                                                             # 
+###############################################################################
+
+import os
+import struct
+
+import pytest
+
+import checkpoint
+import simulator
+
+from conftest import WORKLOADS
+
+def restored(workload,filename):
+    sim = simulator.KindredSimulator()
+    sim.load(workload)
+    assert checkpoint.KindredCheckpoint.restore(filename,sim)
+    return sim
+
+def test_checkpoint_defaults_to_end_of_run(kindredsim,tmp_path):
+    workload = os.path.join(WORKLOADS,'test2.s')
+    saved = str(tmp_path / 'end.ckpt')
+    run = kindredsim('-w',workload,'--checkpoint',saved)
+    sim = restored(workload,saved)
+    assert (sim.cycle,sim.pipeline.num_retired_instructions) == (170,68)
+    resumed = kindredsim('-w',workload,'--restore',saved)
+    assert run['Total Cycles'] == resumed['Total Cycles'] == '170'
+    assert run['Total Retired Inst'] == resumed['Total Retired Inst'] == '68'
+
+def test_functional_checkpoint_defaults_to_end_of_run(kindredsim,tmp_path):
+    workload = os.path.join(WORKLOADS,'test2.s')
+    saved = str(tmp_path / 'end.ckpt')
+    run = kindredsim('-w',workload,'-m','functional','--checkpoint',saved)
+    assert restored(workload,saved).functional.num_retired_instructions == 68
+    resumed = kindredsim('-w',workload,'-m','functional','--restore',saved)
+    assert run['Total Retired Inst'] == resumed['Total Retired Inst'] == '68'
+
+def test_checkpoint_at_inst_resumes_to_the_same_result(kindredsim,tmp_path):
+    workload = os.path.join(WORKLOADS,'test2.s')
+    saved = str(tmp_path / 'mid.ckpt')
+    run = kindredsim('-w',workload,'--checkpoint',saved,'--checkpoint_at_inst','20')
+    assert restored(workload,saved).pipeline.num_retired_instructions == 20
+    resumed = kindredsim('-w',workload,'--restore',saved)
+    assert run['Total Cycles'] == resumed['Total Cycles']
+    assert run['Total Retired Inst'] == resumed['Total Retired Inst']
+
+@pytest.fixture
+def image(tmp_path):
+    """ Eight words for the test2 loop at 0xA000 """
+    path = tmp_path / 'data.bin'
+    path.write_bytes(struct.pack('<8i',*range(1,9)))
+    return '{0}@0xA000'.format(path)
+
+@pytest.mark.parametrize('mode',[ 'cycle', 'functional' ])
+def test_cross_check_loads_memory_images(kindredsim,image,mode):
+    run = kindredsim('-w',os.path.join(WORKLOADS,'test2.s'),'-m',mode,'--memory_image',image,'--cross_check')
+    other = 'functional' if mode == 'cycle' else 'cycle'
+    assert 'Cross-check passed against the {0} model'.format(other) in run
+
+@pytest.mark.parametrize('mode',[ 'cycle', 'functional' ])
+def test_cross_check_restores_the_checkpoint(kindredsim,image,tmp_path,mode):
+    workload = os.path.join(WORKLOADS,'test2.s')
+    saved = str(tmp_path / 'mid.ckpt')
+    kindredsim('-w',workload,'--memory_image',image,'--checkpoint',saved,'--checkpoint_at','30')
+    run = kindredsim('-w',workload,'-m',mode,'--restore',saved,'--cross_check')
+    other = 'functional' if mode == 'cycle' else 'cycle'
+    assert 'Cross-check passed against the {0} model'.format(other) in run
@@ -0,0 +1,54 @@
+###############################################################################
+# File:          test_lanes.py                                                # 
+# Project:       Kindred                                                      # 
+# Author:        Paul Klein                                                   # 
+# EMail:         pauljkaz@gmail.com                                           # 
+# -----                                                                       # 
+# Last Modified: Mon Jul 31 2023                                              # 
+# Modified By:   Paul Klein                                                   # 
+# -----                                                                       # 
+#                                                                             # 
+#  Copyright (c) 2019 - 2023 N/A, All Rights Reserved.                        # 
+#                                                                             # 
+###############################################################################
+
+import os
+
+import pytest
+
+pytest.importorskip('numpy')
+
+import simulator
+import lanes
+
+from conftest import WORKLOADS
+
+def test_cross_check_assembly(command):
+    run = command(lanes.main,'lanes','-w',os.path.join(WORKLOADS,'test2.s'),'-n','64'
+                  ,'--init','0xA000','rand:-1000:1000','--init','0xA01C','5:3','--cross_check')
+    assert 'Cross-check passed for all 64 lanes' in run
+
+def test_cross_check_binary(command,binary):
+    run = command(lanes.main,'lanes','-w',binary(),'-n','16','--init','x1','0:1','--report','x5','--cross_check')
+    assert 'Cross-check passed for all 16 lanes' in run
+
+def test_cross_check_max_steps(command):
+    run = command(lanes.main,'lanes','-w',os.path.join(WORKLOADS,'test3.s'),'-n','8','--max_steps','50','--cross_check')
+    assert 'Cross-check passed for all 8 lanes' in run
+
+def test_lane_matches_scalar_model():
+    sim = simulator.KindredSimulator()
+    sim.load(os.path.join(WORKLOADS,'test3.s'))
+    engine = lanes.KindredLanesEngine('kindred.lanes',sim.inst_buffer,4)
+    engine.reset()
+    engine.run()
+    retired = sim.run_functional()
+    result = simulator.KindredSimulator('kindred.result',sim.inst_buffer)
+    for lane in range(4):
+        assert engine.retired[lane] == retired
+        engine.export_lane(lane,result.registers,result.lsu)
+        assert sim.compare_state(result) == []
+
+def test_empty_workload(command,program):
+    run = command(lanes.main,'lanes','-w',program([ '# nothing' ]))
+    assert 'No instructions were loaded' in run
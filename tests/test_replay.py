@@ -0,0 +1,42 @@
+###############################################################################
+# File:          test_replay.py                                               # 
+# Project:       Kindred                                                      # 
+# Author:        Paul Klein                                                   # 
+# EMail:         pauljkaz@gmail.com                                           # 
+# -----                                                                       # 
+# Last Modified: Mon Jul 31 2023                                              # 
+# Modified By:   Paul Klein                                                   # 
+# -----                                                                       # 
+#                                                                             # 
+#  Copyright (c) 2019 - 2023 N/A, All Rights Reserved.                        # 
+#                                                                             # 
+###############################################################################
+
+import os
+
+import pytest
+
+from conftest import WORKLOADS
+
+CONFIGS = [ (), ('--pipeline','5stage','--width','2','--forwarding'), ('--pipeline','3stage','--branch_predictor','gshare')
+            , ('--branch_predictor','bimodal','--l1d','size=1k,assoc=2,line=16') ]
+
+@pytest.mark.parametrize('config',CONFIGS)
+@pytest.mark.parametrize('workload',[ 'test2.s', 'test3.s' ])
+def test_replay_matches_execution(kindredsim,tmp_path,workload,config):
+    workload = os.path.join(WORKLOADS,workload)
+    trace = str(tmp_path / 'retire.bin')
+    kindredsim('-w',workload,'-i',trace)
+    executed = kindredsim('-w',workload,*config)
+    replayed = kindredsim('-w',workload,'--replay',trace,'--cross_check',*config)
+    assert 'Cross-check passed against the functional model' in replayed
+    for name in ('Total Cycles','Total Retired Inst','Stall Cycles'):
+        assert replayed[name] == executed[name]
+
+def test_replay_of_a_binary(kindredsim,binary,tmp_path):
+    image = binary()
+    trace = str(tmp_path / 'retire.bin')
+    kindredsim('-w',image,'-i',trace)
+    replayed = kindredsim('-w',image,'--replay',trace,'--pipeline','5stage','--cross_check')
+    assert replayed['Total Retired Inst'] == '6'
+    assert 'Cross-check passed against the functional model' in replayed